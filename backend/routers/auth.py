@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Header, HTTPException, Depends, Request
 from typing import Optional, Dict, Any
 from clerk_backend_api import Clerk, models
+from clerk_backend_api.jwks_helpers import TokenVerificationError, VerifyTokenOptions, verify_token
+from cachetools import TTLCache
 import os
+import threading
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -12,6 +15,43 @@ router = APIRouter()
 # Create Clerk SDK client
 clerk = Clerk(bearer_auth=os.getenv("CLERK_SECRET_KEY"))
 
+# Session tokens are verified locally: with CLERK_JWT_KEY set no network call is made,
+# otherwise the SDK fetches the JWKS once and keeps it in its in-process cache
+verify_options = VerifyTokenOptions(
+    jwt_key=os.getenv("CLERK_JWT_KEY"),
+    secret_key=os.getenv("CLERK_SECRET_KEY"),
+    authorized_parties=[p for p in os.getenv("CLERK_AUTHORIZED_PARTIES", "").split(",") if p] or None,
+)
+
+# User profiles rarely change, so keep them for a few minutes; unknown users are
+# remembered briefly too so repeated bad ids don't turn into repeated API calls
+profile_cache = TTLCache(maxsize=10000, ttl=300)
+missing_profile_cache = TTLCache(maxsize=10000, ttl=30)
+profile_cache_lock = threading.Lock()
+
+def get_user_profile(user_id: str) -> Optional[Dict[str, Any]]:
+    with profile_cache_lock:
+        if user_id in profile_cache:
+            return profile_cache[user_id]
+        if user_id in missing_profile_cache:
+            return None
+
+    try:
+        user = clerk.users.get(user_id=user_id)
+    except models.ClerkErrors:
+        with profile_cache_lock:
+            missing_profile_cache[user_id] = True
+        return None
+
+    profile = {
+        "email": user.email_addresses[0].email_address if user.email_addresses else None,
+        "firstName": user.first_name,
+        "lastName": user.last_name,
+    }
+    with profile_cache_lock:
+        profile_cache[user_id] = profile
+    return profile
+
 # Dependency for getting the current active user
 async def get_current_user(request: Request, authorization: Optional[str] = Header(None)):
     if not authorization:
@@ -25,22 +65,24 @@ async def get_current_user(request: Request, authorization: Optional[str] = Head
         token = authorization
     
     try:
-        # Authenticate the request using Clerk SDK
-        auth_state = clerk.authenticate_request(token)
-        
-        if not auth_state.is_signed_in:
-            raise HTTPException(status_code=401, detail="Not authenticated")
+        # Verify the session token locally
+        claims = verify_token(token, verify_options)
+        user_id = claims["sub"]
         
         # Get user details
-        user = clerk.users.get(user_id=auth_state.user_id)
+        profile = get_user_profile(user_id)
+        if profile is None:
+            raise HTTPException(status_code=401, detail="User not found")
         
         return {
-            "userId": auth_state.user_id,
-            "email": user.email_addresses[0].email_address if user.email_addresses else None,
-            "firstName": user.first_name,
-            "lastName": user.last_name,
+            "userId": user_id,
+            **profile,
             "permissions": ["read:scans", "write:scans"]  # This can be customized based on user roles
         }
+    except HTTPException:
+        raise
+    except TokenVerificationError as e:
+        raise HTTPException(status_code=401, detail=f"Not authenticated: {str(e)}")
     except models.ClerkErrors as e:
         raise HTTPException(status_code=401, detail=f"Authentication error: {str(e)}")
     except models.SDKError as e:
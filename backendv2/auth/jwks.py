@@ -0,0 +1,196 @@
+"""
+Local verification of Clerk session tokens.
+
+The JWKS key set is fetched once, kept in memory and refreshed on a
+background thread, so verifying a request is a local RS256 signature
+check instead of a round trip to Clerk. Verified claims are also cached
+per token until shortly before they expire, so repeated requests with
+the same session token skip the signature check entirely.
+"""
+
+import os
+import threading
+import time
+
+import httpx
+from cachetools import TTLCache
+from jose import jwk, jwt
+from jose.exceptions import JOSEError
+
+CLERK_JWKS_URL = "https://api.clerk.com/v1/jwks"
+
+
+class InvalidSessionToken(Exception):
+    pass
+
+
+class SigningKeysUnavailable(InvalidSessionToken):
+    """
+    The token can't be checked because the JWKS couldn't be fetched
+    """
+
+
+def fetch_clerk_jwks(url=None, secret_key=None, timeout=5.0):
+    """
+    Fetches the instance key set, either from the Backend API (with the
+    secret key) or from a public JWKS URL such as the Frontend API's
+    /.well-known/jwks.json
+    """
+    url = url or os.getenv("CLERK_JWKS_URL") or CLERK_JWKS_URL
+    secret_key = secret_key or os.getenv("CLERK_SECRET_KEY")
+    headers = {"Authorization": f"Bearer {secret_key}"} if secret_key and url == CLERK_JWKS_URL else {}
+    response = httpx.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+class JWKSCache:
+    """
+    In-memory JWKS keyed by kid. An unknown kid triggers a synchronous
+    refresh (key rotation), rate limited by min_refetch_interval whether
+    or not the fetch succeeds.
+    """
+
+    def __init__(self, fetch_keys=fetch_clerk_jwks, refresh_interval=300, min_refetch_interval=30):
+        self.fetch_keys = fetch_keys
+        self.refresh_interval = refresh_interval
+        self.min_refetch_interval = min_refetch_interval
+        self._keys = {}
+        self._last_fetch = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def refresh(self):
+        """
+        Replaces the key set. If it can't be fetched the old keys stay and
+        SigningKeysUnavailable is raised.
+        """
+        with self._lock:
+            self._last_fetch = time.monotonic()
+        try:
+            key_set = self.fetch_keys()
+            keys = {}
+            for key_data in key_set.get("keys", []):
+                keys[key_data.get("kid")] = jwk.construct(key_data, key_data.get("alg", "RS256"))
+        except (httpx.HTTPError, ValueError, JOSEError) as e:
+            self.refresh_failures += 1
+            raise SigningKeysUnavailable(f"Could not fetch the JWKS: {e}")
+        self.refreshes += 1
+        with self._lock:
+            self._keys = keys
+
+    def get_key(self, kid):
+        key = self._keys.get(kid)
+        if key is None:
+            # Claimed under the lock, so concurrent requests share one fetch per interval
+            with self._lock:
+                due = time.monotonic() - self._last_fetch > self.min_refetch_interval
+                if due:
+                    self._last_fetch = time.monotonic()
+            if due:
+                self.refresh()
+                key = self._keys.get(kid)
+        if key is None and not self._keys:
+            raise SigningKeysUnavailable("No signing keys loaded")
+        return key
+
+    def start(self):
+        """
+        Loads the keys now and keeps refreshing them in the background
+        """
+        try:
+            self.refresh()
+        except SigningKeysUnavailable as e:
+            print(f"Error fetching JWKS: {e}")
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except SigningKeysUnavailable as e:
+                # Keep serving the last good key set
+                print(f"Error refreshing JWKS: {e}")
+
+    def stats(self):
+        return {
+            "keys": len(self._keys),
+            "refreshes_total": self.refreshes,
+            "refresh_failures_total": self.refresh_failures,
+        }
+
+
+class SessionVerifier:
+    """
+    Verifies a session token against the cached JWKS and returns its claims
+    """
+
+    def __init__(self, jwks_cache, authorized_parties=None, leeway=5, cache_size=10000, cache_ttl=60):
+        self.jwks_cache = jwks_cache
+        self.authorized_parties = [p for p in (authorized_parties or []) if p]
+        self.leeway = leeway
+        self.cache_ttl = cache_ttl
+        self._claims_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rejected = 0
+
+    def stats(self):
+        return {
+            "cache_entries": len(self._claims_cache),
+            "cache_hits_total": self.cache_hits,
+            "cache_misses_total": self.cache_misses,
+            "rejected_total": self.rejected,
+        }
+
+    def verify(self, token):
+        with self._cache_lock:
+            claims = self._claims_cache.get(token)
+        if claims is not None and claims.get("exp", 0) > time.time():
+            self.cache_hits += 1
+            return claims
+        self.cache_misses += 1
+
+        try:
+            claims = self._verify_signature(token)
+        except InvalidSessionToken:
+            self.rejected += 1
+            raise
+
+        # Never cache past the token's own expiry
+        if claims.get("exp", 0) - time.time() > 1:
+            with self._cache_lock:
+                self._claims_cache[token] = claims
+        return claims
+
+    def _verify_signature(self, token):
+        try:
+            header = jwt.get_unverified_header(token)
+        except JOSEError:
+            raise InvalidSessionToken("Malformed session token")
+
+        key = self.jwks_cache.get_key(header.get("kid"))
+        if key is None:
+            raise InvalidSessionToken("Unknown signing key")
+
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                options={"verify_aud": False, "leeway": self.leeway},
+            )
+        except JOSEError as e:
+            raise InvalidSessionToken(str(e))
+
+        if self.authorized_parties and claims.get("azp") and claims["azp"] not in self.authorized_parties:
+            raise InvalidSessionToken("Unauthorized party")
+        return claims
@@ -0,0 +1,46 @@
+"""
+Local JWKS stand-in for tests and load tests: an RSA key pair served as a
+key set, plus a helper to issue Clerk-style session tokens signed with it.
+"""
+
+import time
+import uuid
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+
+class LocalJWKS:
+    def __init__(self, kid="local-test-key"):
+        self.kid = kid
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        self._public_jwk = dict(jwk.construct(public_pem, "RS256").to_dict(), kid=kid, use="sig")
+
+    def __call__(self):
+        """
+        The key set, so an instance can be passed as JWKSCache(fetch_keys=...)
+        """
+        return {"keys": [self._public_jwk]}
+
+    def issue_token(self, sub="user_local_test", azp="http://localhost:5173", expires_in=300, **claims):
+        now = int(time.time())
+        payload = {
+            "sub": sub,
+            "azp": azp,
+            "sid": f"sess_{uuid.uuid4().hex}",
+            "iat": now,
+            "nbf": now,
+            "exp": now + expires_in,
+            **claims,
+        }
+        return jwt.encode(payload, self._private_pem, algorithm="RS256", headers={"kid": self.kid})
@@ -0,0 +1,228 @@
+"""
+Inference benchmark for the Grad-CAM pipeline in ml/GradCam.py.
+
+Measures cold-start time of get_cam_overlay in a fresh process, then warm
+p50/p95/p99 latency of each stage of analyze_scan, the call scan
+processing makes (decode, forward, cam_forward, backward, overlay, plus
+the JPEG encode of every overlay), for every combination of CAM mode and
+thread count. The all_classes mode is what production runs: one batched
+backward for every class via generate_all_cams. predicted_class is the
+single-class path of get_cam_overlay. Each case runs in its own process,
+so its peak RSS is its own. Results are written as JSON; when a baseline
+file exists, the run fails if any latency regresses past it by more than
+the tolerance.
+
+The image must be classified as a tumor, or analyze_scan skips Grad-CAM.
+
+Usage (from backendv2/):
+    python benchmarks/bench_inference.py --modes all_classes --threads 1 4
+    python benchmarks/bench_inference.py --update-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import cv2
+import numpy as np
+import torch
+
+from ml.GradCam import analyze_scan
+
+STAGES = ["decode", "forward", "cam_forward", "backward", "overlay", "encode"]
+MODES = {"all_classes": True, "predicted_class": False}
+PERCENTILES = [50, 95, 99]
+
+
+def measure_cold_start(image_path):
+    """
+    Time to import ml.GradCam and serve the first get_cam_overlay call in a new process
+    """
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "from ml.GradCam import get_cam_overlay\n"
+        "imported = time.perf_counter()\n"
+        "get_cam_overlay(sys.argv[1])\n"
+        "done = time.perf_counter()\n"
+        "print(json.dumps({'import_s': imported - start, 'first_call_s': done - imported, 'total_s': done - start}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script, image_path],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_pipeline(image_path, all_classes):
+    """
+    One analyze_scan call plus the JPEG encode of its overlays, as scan
+    processing does it, returning the wall time of each stage in milliseconds
+    """
+    timings = {}
+    analysis = analyze_scan(image_path, timings=timings, all_classes=all_classes)
+    if "cam" not in analysis:
+        raise SystemExit(f"{image_path} is classified as {analysis['predicted_class']}, so Grad-CAM "
+                         "never runs; pass a tumor image with --image")
+
+    start = time.perf_counter()
+    cv2.imencode(".jpg", analysis["overlay"])
+    for overlay in analysis.get("class_overlays", {}).values():
+        cv2.imencode(".jpg", overlay)
+    timings["encode"] = time.perf_counter() - start
+
+    timings = {stage: timings.get(stage, 0.0) * 1000 for stage in STAGES}
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+def run_case(image_path, mode, threads, warmup, iterations):
+    """
+    Latency summary and peak RSS of one case; called in a process of its own
+    """
+    torch.set_num_threads(threads)
+    for _ in range(warmup):
+        run_pipeline(image_path, MODES[mode])
+    samples = [run_pipeline(image_path, MODES[mode]) for _ in range(iterations)]
+    summary = summarize(samples)
+    return {
+        "mode": mode,
+        "threads": threads,
+        "latency": summary,
+        "images_per_s": 1000 / summary["total"]["mean_ms"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure_case(args, mode, threads):
+    """
+    Runs one case in a new process, so neither its memory nor its caches carry over to the next
+    """
+    run = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--case", mode, str(threads), "--image", args.image,
+         "--iterations", str(args.iterations), "--warmup", str(args.warmup)],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if run.returncode != 0:
+        raise SystemExit(f"{mode},threads={threads} failed:\n{run.stderr}")
+    return json.loads(run.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    summary = {}
+    for stage in STAGES + ["total"]:
+        values = np.array([s[stage] for s in samples])
+        p50, p95, p99 = np.percentile(values, PERCENTILES)
+        summary[stage] = {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "mean_ms": values.mean()}
+    return summary
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def find_regressions(results, baseline, tolerance, min_delta_ms):
+    """
+    Lists every (config, stage, percentile) whose latency grew past the baseline
+    """
+    regressions = []
+    for config, stages in results["configs"].items():
+        base_stages = baseline.get("configs", {}).get(config)
+        if base_stages is None:
+            continue
+        for stage, stats in stages["latency"].items():
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                base = base_stages["latency"].get(stage, {}).get(key)
+                if base is None:
+                    continue
+                current = stats[key]
+                if current > base * (1 + tolerance) and current - base > min_delta_ms:
+                    regressions.append(f"{config} {stage} {key}: {current:.2f} ms vs baseline {base:.2f} ms")
+
+    base_cold = baseline.get("cold_start", {}).get("total_s")
+    cold = results.get("cold_start", {}).get("total_s")
+    if base_cold and cold and cold > base_cold * (1 + tolerance):
+        regressions.append(f"cold start: {cold:.2f} s vs baseline {base_cold:.2f} s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Grad-CAM inference pipeline")
+    parser.add_argument("--image", default=os.path.join(BACKEND_DIR, "ml", "test.jpg"))
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, torch.get_num_threads()])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "benchmarks", "results.json"))
+    parser.add_argument("--baseline", default=os.path.join(BACKEND_DIR, "benchmarks", "baseline.json"))
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--skip-cold-start", action="store_true")
+    parser.add_argument("--update-baseline", action="store_true", help="Save this run as the new baseline")
+    parser.add_argument("--case", nargs=2, metavar=("MODE", "THREADS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.image, args.case[0], int(args.case[1]), args.warmup, args.iterations)))
+        return
+
+    results = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "cuda": torch.cuda.is_available(),
+        },
+        "configs": {},
+    }
+
+    if not args.skip_cold_start:
+        results["cold_start"] = measure_cold_start(args.image)
+        print(f"Cold start: {results['cold_start']['total_s']:.2f} s")
+
+    for threads in args.threads:
+        for mode in args.modes:
+            config = f"{mode},threads={threads}"
+            results["configs"][config] = case = measure_case(args, mode, threads)
+            total = case["latency"]["total"]
+            print(f"{config}: p50 {total['p50_ms']:.1f} ms, p95 {total['p95_ms']:.1f} ms, "
+                  f"p99 {total['p99_ms']:.1f} ms, peak RSS {case['peak_rss_mb']:.0f} MB")
+
+    results["peak_rss_mb"] = max((case["peak_rss_mb"] for case in results["configs"].values()), default=0.0)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated at {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("Performance regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Completion-time estimates for background jobs.
+
+Each job reports how long it spent in every stage. The estimator keeps
+an exponentially weighted mean per stage, seeded from defaults and from
+the stage durations stored on recent documents. A queued job's estimate
+adds the time it is likely to wait for a free worker, based on the jobs
+queued ahead of it.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class StageETA:
+    def __init__(self, stages, defaults, workers=1, alpha=0.2, queued_stage="queued"):
+        self.stages = list(stages)
+        self.queued_stage = queued_stage
+        self.workers = max(1, workers)
+        self.alpha = alpha
+        self._means = dict(defaults)
+        self._samples = {stage: 0 for stage in self.stages}
+        self._queued = OrderedDict()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    # Observations
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            # Plain average until there are enough samples, then a rolling one
+            count = self._samples.get(stage, 0) + 1
+            self._samples[stage] = count
+            weight = max(self.alpha, 1.0 / count)
+            mean = self._means.get(stage, seconds)
+            self._means[stage] = mean + weight * (seconds - mean)
+
+    def observe_job(self, stage_durations):
+        for stage in self.stages:
+            if stage in stage_durations:
+                self.observe(stage, stage_durations[stage])
+
+    def seed(self, documents):
+        """
+        Warms the estimator from stored documents, oldest first
+        """
+        for doc in documents:
+            if doc.get("stage_durations"):
+                self.observe_job(doc["stage_durations"])
+
+    # Queue bookkeeping
+
+    def job_queued(self, job_id):
+        with self._lock:
+            self._queued[job_id] = time.monotonic()
+
+    def job_started(self, job_id):
+        with self._lock:
+            self._queued.pop(job_id, None)
+            self._running += 1
+
+    def job_finished(self, job_id):
+        with self._lock:
+            self._running = max(0, self._running - 1)
+
+    @property
+    def queued(self):
+        return len(self._queued)
+
+    @property
+    def running(self):
+        return self._running
+
+    # Estimates
+
+    def expected(self, stage):
+        return self._means.get(stage, 0.0)
+
+    def job_seconds(self):
+        return sum(self.expected(stage) for stage in self.stages)
+
+    def queue_wait(self, job_id=None):
+        """
+        Expected wait before a queued job gets a worker
+        """
+        with self._lock:
+            ahead = list(self._queued).index(job_id) if job_id in self._queued else len(self._queued)
+            running = self._running
+        # Jobs are served in waves of `workers`; a free worker means no wait
+        waiting_for = running + ahead - self.workers + 1
+        if waiting_for <= 0:
+            return 0.0
+        return math.ceil(waiting_for / self.workers) * self.job_seconds()
+
+    def remaining(self, stage, stage_elapsed=0.0, job_id=None):
+        """
+        Expected seconds until a job in `stage` completes
+        """
+        if stage == self.queued_stage:
+            return self.queue_wait(job_id) + self.job_seconds()
+        if stage not in self.stages:
+            return 0.0
+        index = self.stages.index(stage)
+        # A stage running past its mean is assumed to be nearly done, not finished
+        current = self.expected(stage)
+        left = max(current - stage_elapsed, 0.1 * current)
+        later = sum(self.expected(s) for s in self.stages[index + 1:])
+        return left + later
+
+
+def poll_interval(remaining_seconds, minimum=1.0, maximum=30.0):
+    """
+    How long a client should wait before polling again
+    """
+    if remaining_seconds is None:
+        return maximum
+    return min(maximum, max(minimum, remaining_seconds / 4))
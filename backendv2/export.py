@@ -0,0 +1,309 @@
+"""
+Streaming export of scan records as NDJSON, CSV or Parquet.
+
+Scans are read through one server-side cursor in batches and written out
+as flat records, so memory stays bounded by a batch (or, for Parquet, a
+row group) however large the export is. Filters: creation date range,
+status and class label.
+
+Incremental exports use a watermark on updatedAt, which is set when a
+scan finishes. An export covers finished scans with
+since <= updatedAt < until, where until is fixed before the first read
+and held back by WATERMARK_LAG so that writes still in flight are not
+skipped. The next export starts from that until.
+
+Usage (from backendv2/):
+    python export.py --format parquet --output scans.parquet --start 2025-01-01
+    python export.py --format ndjson --output new.ndjson --state export_state.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+from datetime import datetime, timedelta
+
+FORMATS = ("ndjson", "csv", "parquet")
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Class labels in model output order, as in ml/GradCam.py
+CLASS_LABELS = ("notumor", "glioma", "meningioma", "pituitary")
+BATCH_SIZE = 1000
+ROW_GROUP_SIZE = 50000
+WATERMARK_LAG = timedelta(seconds=60)
+
+# Output columns and their Parquet types
+COLUMNS = [
+    ("id", "string"),
+    ("createdAt", "timestamp"),
+    ("updatedAt", "timestamp"),
+    ("status", "string"),
+    ("stage", "string"),
+    ("userId", "string"),
+    ("patientId", "string"),
+    ("tumorDetected", "bool"),
+    ("classLabel", "string"),
+] + [(f"probability_{label}", "float") for label in CLASS_LABELS] + [
+    ("location", "string"),
+    ("size", "string"),
+    ("turnaroundSeconds", "float"),
+    ("heatmapUrl", "string"),
+    ("visualizationId", "string"),
+    ("modelVersion", "string"),
+    ("error", "string"),
+]
+
+# Only what the columns need; embeddings in particular stay on the server
+PROJECTION = {
+    field: 1 for field in (
+        "created_at", "updatedAt", "status", "stage", "userId", "metadata.patientId", "tumorDetected",
+        "classLabel", "classProbabilities", "location", "size", "stage_durations", "heatmapUrl",
+        "visualizationId", "modelVersion", "error",
+    )
+}
+
+
+def ensure_indexes(scans):
+    scans.create_index("created_at")
+    scans.create_index("updatedAt")
+
+
+def parse_time(value):
+    """
+    datetime from an ISO date or timestamp, with or without a trailing Z
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.rstrip("Z"))
+
+
+def build_query(start=None, end=None, status=None, class_label=None, since=None, until=None):
+    """
+    Mongo filter for an export. status and class_label may be comma-separated lists.
+    since/until select finished scans by updatedAt, for incremental exports.
+    """
+    query = {}
+    if start or end:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = parse_time(start)
+        if end:
+            query["created_at"]["$lt"] = parse_time(end)
+    if status:
+        query["status"] = {"$in": [s.strip() for s in status.split(",")]}
+    if class_label:
+        query["classLabel"] = {"$in": [c.strip() for c in class_label.split(",")]}
+    if since or until:
+        query["updatedAt"] = {}
+        if since:
+            query["updatedAt"]["$gte"] = parse_time(since)
+        if until:
+            query["updatedAt"]["$lt"] = parse_time(until)
+    return query
+
+
+def next_watermark(now=None):
+    """
+    The until bound for an incremental export starting now
+    """
+    return (now or datetime.utcnow()) - WATERMARK_LAG
+
+
+def to_record(doc):
+    """
+    Flat export record for a scan document
+    """
+    probabilities = doc.get("classProbabilities") or {}
+    durations = doc.get("stage_durations")
+    record = {
+        "id": doc["_id"],
+        "createdAt": doc.get("created_at"),
+        "updatedAt": doc.get("updatedAt"),
+        "status": doc.get("status"),
+        "stage": doc.get("stage"),
+        "userId": doc.get("userId"),
+        "patientId": (doc.get("metadata") or {}).get("patientId"),
+        "tumorDetected": doc.get("tumorDetected"),
+        "classLabel": doc.get("classLabel"),
+    }
+    for label in CLASS_LABELS:
+        record[f"probability_{label}"] = probabilities.get(label)
+    record.update({
+        "location": doc.get("location"),
+        "size": doc.get("size"),
+        "turnaroundSeconds": sum(durations.values()) if durations else None,
+        "heatmapUrl": doc.get("heatmapUrl"),
+        "visualizationId": doc.get("visualizationId"),
+        "modelVersion": doc.get("modelVersion"),
+        "error": doc.get("error"),
+    })
+    return record
+
+
+def iter_batches(scans, query, batch_size=BATCH_SIZE):
+    """
+    Lists of up to batch_size records, read through one cursor. Incremental
+    exports are ordered by updatedAt, the others by creation time.
+    """
+    sort_field = "updatedAt" if "updatedAt" in query else "created_at"
+    cursor = scans.find(query, PROJECTION).sort(sort_field, 1).batch_size(batch_size)
+    batch = []
+    for doc in cursor:
+        batch.append(to_record(doc))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _text_value(value):
+    return value.isoformat() + "Z" if isinstance(value, datetime) else value
+
+
+def stream_ndjson(batches):
+    for batch in batches:
+        yield "".join(
+            json.dumps({k: _text_value(v) for k, v in record.items()}) + "\n" for record in batch
+        ).encode()
+
+
+def stream_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in COLUMNS])
+    for batch in batches:
+        for record in batch:
+            writer.writerow(["" if record[name] is None else _text_value(record[name]) for name, _ in COLUMNS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    # The header alone, for an empty export
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """
+    Write-only file object that collects what ParquetWriter writes, so it
+    can be streamed out after each row group
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    types = {"string": pa.string(), "timestamp": pa.timestamp("ms"), "bool": pa.bool_(), "float": pa.float64()}
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+def stream_parquet(batches, row_group_size=ROW_GROUP_SIZE):
+    """
+    Parquet bytes, one row group per row_group_size records
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    pending = []
+
+    def flush_row_group(rows):
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema), row_group_size=row_group_size)
+        return sink.drain()
+
+    for batch in batches:
+        pending.extend(batch)
+        while len(pending) >= row_group_size:
+            yield flush_row_group(pending[:row_group_size])
+            del pending[:row_group_size]
+    if pending:
+        yield flush_row_group(pending)
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(scans, export_format, query, row_group_size=ROW_GROUP_SIZE):
+    """
+    Iterator of byte chunks of the export in the given format
+    """
+    batches = iter_batches(scans, query, batch_size=min(BATCH_SIZE, row_group_size))
+    if export_format == "ndjson":
+        return stream_ndjson(batches)
+    if export_format == "csv":
+        return stream_csv(batches)
+    if export_format == "parquet":
+        return stream_parquet(batches, row_group_size)
+    raise ValueError(f"Unknown export format {export_format}")
+
+
+def main():
+    from pymongo.mongo_client import MongoClient
+
+    parser = argparse.ArgumentParser(description="Export scan records")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--output", required=True, help="File to write")
+    parser.add_argument("--start", help="Only scans created on or after this date")
+    parser.add_argument("--end", help="Only scans created before this date")
+    parser.add_argument("--status", help="Comma-separated statuses")
+    parser.add_argument("--class", dest="class_label", help="Comma-separated class labels")
+    parser.add_argument("--state", help="Watermark file; exports only scans finished since the last run")
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    since = until = None
+    if args.state:
+        if os.path.exists(args.state):
+            with open(args.state) as f:
+                since = json.load(f).get("watermark")
+        until = next_watermark()
+
+    scans = MongoClient(os.getenv("MONGO_URI")).neurosphere.scans
+    ensure_indexes(scans)
+    query = build_query(args.start, args.end, args.status, args.class_label, since, until)
+
+    written = 0
+    with open(args.output, "wb") as output:
+        for chunk in stream_export(scans, args.format, query, args.row_group_size):
+            output.write(chunk)
+            written += len(chunk)
+
+    # Only move the watermark once the export is safely written
+    if args.state:
+        with open(args.state + ".tmp", "w") as f:
+            json.dump({"watermark": until.isoformat() + "Z"}, f)
+        os.replace(args.state + ".tmp", args.state)
+    print(f"Wrote {written} bytes of {args.format} to {args.output}" + (f", watermark {until.isoformat()}Z" if until else ""))
+
+
+if __name__ == "__main__":
+    main()
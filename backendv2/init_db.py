@@ -1,201 +1,289 @@
 """
-Initialize the MongoDB database with sample data for Neurosphere.
-Run this script once to set up the database with test data.
+Fill the MongoDB database with synthetic data for Neurosphere.
+
+Generates any number of scans, from a handful for local development to
+millions for index, pagination and stats testing. Documents are built
+lazily and written in chunks with unordered insert_many, so memory stays
+flat and the server can apply each chunk in parallel. The rollup buckets
+are updated to match, so stats and trends agree with the generated scans.
+
+Status, class and date distributions are configurable. By default no
+files are written and scans point at placeholder URLs. --fixtures N writes
+N small real JPEGs (brain-like ellipses) shared at random by all scans
+so thumbnails and heatmaps actually load in the frontend.
+
+Usage (from backendv2/):
+    python init_db.py                                  # 15 scans, like before
+    python init_db.py --scans 2000000 --chunk-size 10000 --fixtures 20
+    python init_db.py --scans 50000 --no-drop --days 7 --dates recent
 """
 
+import argparse
 import os
+import random
+import time
 import uuid
 from datetime import datetime, timedelta
-from pymongo import MongoClient
-import random
-import shutil
-
-# Default MongoDB connection
-MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 
-# Connect to MongoDB
-client = MongoClient(MONGO_URI)
-db = client.neurosphere
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
-# Clear existing collections
-db.scans.drop()
-db.visualizations.drop()
+from rollups import bucket_start, rollup_increments
+from search import normalized_fields
 
-# Create sample directories if they don't exist
-os.makedirs("uploads", exist_ok=True)
-os.makedirs("thumbnails", exist_ok=True)
-os.makedirs("visualizations_html", exist_ok=True)
+DEFAULT_STATUSES = "completed=0.85,processing=0.10,failed=0.05"
+DEFAULT_CLASSES = "glioma=0.3,meningioma=0.25,pituitary=0.2,notumor=0.25"
 
-# Sample data
-scan_statuses = ["completed", "processing"]
 tumor_locations = ["Frontal lobe", "Temporal lobe", "Parietal lobe", "Occipital lobe", "Cerebellum"]
-tumor_sizes = ["1.2cm", "1.8cm", "2.3cm", "3.1cm", "0.9cm"]
-
-# Generate random dates within the last 3 months
-def random_date():
-    days_ago = random.randint(0, 90)
-    return datetime.utcnow() - timedelta(days=days_ago)
-
-# Create sample visualization HTML
-def create_sample_visualization(viz_id):
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>3D Brain Visualization</title>
-        <style>
-            body {{
-                margin: 0;
-                padding: 0;
-                overflow: hidden;
-                background-color: #f0f0f0;
-                font-family: Arial, sans-serif;
-            }}
-            #container {{
-                width: 100%;
-                height: 100vh;
-                display: flex;
-                flex-direction: column;
-                align-items: center;
-                justify-content: center;
-            }}
-            #brain-model {{
-                width: 100%;
-                height: 80vh;
-                background-color: #000;
-                color: white;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 1.5rem;
-            }}
-            #controls {{
-                margin-top: 20px;
-                display: flex;
-                gap: 10px;
-            }}
-            .btn {{
-                padding: 8px 16px;
-                background-color: #4a5568;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                cursor: pointer;
-            }}
-            .tumor {{
-                color: #f56565;
-                font-weight: bold;
-            }}
-        </style>
-    </head>
-    <body>
-        <div id="container">
-            <div id="brain-model">
-                <div>
-                    3D Brain Model <span class="tumor">(Visualization ID: {viz_id})</span>
-                    <div style="font-size: 0.8rem; margin-top: 10px;">
-                        This is a simulated visualization for demonstration purposes.
-                    </div>
-                </div>
-            </div>
-            <div id="controls">
-                <button class="btn">Rotate</button>
-                <button class="btn">Zoom</button>
-                <button class="btn">Highlight Tumor</button>
-                <button class="btn">Reset View</button>
-            </div>
-        </div>
-        <script>
-            // Simple demo script
-            document.querySelectorAll('.btn').forEach(btn => {{
-                btn.addEventListener('click', () => {{
-                    alert('This is a demo visualization. In a real application, this would trigger 3D model interactions.');
-                }});
-            }});
-        </script>
-    </body>
-    </html>
-    """
-    html_path = os.path.join("visualizations_html", f"{viz_id}.html")
-    with open(html_path, "w") as f:
-        f.write(html_content)
-    return html_path
-
-# Insert sample scans
-scans = []
-for i in range(15):
-    # Determine status and related properties
+processing_stages = ["uploading", "processing", "building_3d_model"]
+doctors = ["Dr. Smith", "Dr. Patel", "Dr. Garcia", "Dr. Chen", "Dr. Okafor"]
+
+
+def parse_weights(text):
+    """
+    'a=0.7,b=0.3' -> ([a, b], [0.7, 0.3])
+    """
+    names, weights = [], []
+    for part in text.split(","):
+        name, weight = part.split("=")
+        names.append(name.strip())
+        weights.append(float(weight))
+    return names, weights
+
+
+def random_date(rng, now, days, distribution):
+    """
+    A creation time within the last `days` days. "uniform" spreads scans
+    evenly; "recent" makes volume grow towards now, like a growing deployment.
+    """
+    if distribution == "recent":
+        # Exponential with a mean of a fifth of the range, clipped to it
+        days_ago = min(rng.expovariate(5 / days), days)
+    else:
+        days_ago = rng.uniform(0, days)
+    return now - timedelta(days=days_ago)
+
+
+def write_fixtures(count, rng):
+    """
+    Writes count small grayscale JPEGs to uploads/, thumbnails/ and heatmaps/.
+    Returns their file names.
+    """
+    import cv2
+    import numpy as np
+
+    names = []
+    for i in range(count):
+        # A bright elliptical "brain" with a brighter blob somewhere inside, plus noise
+        image = np.zeros((224, 224), dtype=np.uint8)
+        cv2.ellipse(image, (112, 112), (rng.randint(80, 100), rng.randint(90, 105)), 0, 0, 360, 150, -1)
+        cv2.circle(image, (rng.randint(70, 154), rng.randint(70, 154)), rng.randint(8, 25), 220, -1)
+        noise = np.random.default_rng(i).integers(0, 30, image.shape, dtype=np.uint8)
+        image = cv2.GaussianBlur(cv2.add(image, noise), (5, 5), 0)
+
+        name = f"fixture_{i}.jpg"
+        cv2.imwrite(os.path.join("uploads", name), image)
+        cv2.imwrite(os.path.join("thumbnails", name), image)
+        cv2.imwrite(os.path.join("heatmaps", name), cv2.applyColorMap(image, cv2.COLORMAP_JET))
+        names.append(name)
+    return names
+
+
+def generate_scan(rng, now, args, statuses, classes, fixtures, users):
+    """
+    One synthetic scan, plus its visualization document if it gets one
+    """
     scan_id = str(uuid.uuid4())
-    created_at = random_date()
-    
-    # 80% completed, 20% processing
-    status = scan_statuses[0] if random.random() < 0.8 else scan_statuses[1]
-    
-    # Basic scan data
+    created_at = random_date(rng, now, args.days, args.dates)
+    status = rng.choices(*statuses)[0]
+    image = fixtures[rng.randrange(len(fixtures))] if fixtures else None
+
     scan = {
         "_id": scan_id,
         "created_at": created_at,
         "status": status,
-        "stage": "completed" if status == "completed" else random.choice(["uploading", "processing", "building_3d_model"]),
-        "progress": 100 if status == "completed" else random.randint(10, 90),
-        "file_url": f"/uploads/{scan_id}_sample.jpg",
-        "estimated_completion_time": created_at + timedelta(minutes=5)
+        "stage": "completed" if status == "completed" else rng.choice(processing_stages),
+        "progress": 100 if status == "completed" else rng.randint(10, 90),
+        "metadata": {"patientId": f"patient_{rng.randrange(max(1, args.scans // 4))}"},
+        "userId": rng.choice(users),
+        "doctor": rng.choice(doctors),
+        "file_url": f"/uploads/{image or scan_id + '_sample.jpg'}",
+        "estimated_completion_time": created_at + timedelta(minutes=5),
+    }
+    if status == "failed":
+        scan["stage"] = "processing"
+        scan["error"] = "Synthetic failure"
+        return scan, None
+    if status != "completed":
+        return scan, None
+
+    # Stage timings around the defaults the ETA estimator starts from
+    stage_durations = {
+        "queued": rng.expovariate(1 / 2.0),
+        "uploading": rng.uniform(0.5, 1.5),
+        "processing": rng.uniform(1.0, 3.0),
+        "building_3d_model": rng.uniform(0.5, 2.0),
     }
-    
-    # For completed scans, add result data
-    if status == "completed":
-        # 70% chance of tumor detected for completed scans
-        tumor_detected = random.random() < 0.7
-        
-        if tumor_detected:
-            scan.update({
-                "tumorDetected": True,
-                "location": random.choice(tumor_locations),
-                "size": random.choice(tumor_sizes),
-                "notes": f"Tumor detected in the {scan['location']} region. Recommended for additional clinical evaluation.",
-                "thumbnailUrl": f"/thumbnails/{scan_id}.jpg",
-                "updatedAt": created_at + timedelta(minutes=random.randint(3, 10))
-            })
-            
-            # Create visualization for some completed scans with tumors
-            if random.random() < 0.8:
-                viz_id = str(uuid.uuid4())
-                create_sample_visualization(viz_id)
-                
-                # Add visualization reference
-                scan["visualizationId"] = viz_id
-                
-                # Add visualization record
-                db.visualizations.insert_one({
-                    "_id": viz_id,
-                    "scan_id": scan_id,
-                    "created_at": scan["updatedAt"],
-                    "status": "completed",
-                    "updated_at": scan["updatedAt"] + timedelta(minutes=2)
-                })
-        else:
-            scan.update({
-                "tumorDetected": False,
-                "notes": "No tumor detected. Brain scan appears normal.",
-                "thumbnailUrl": f"/thumbnails/{scan_id}.jpg",
-                "updatedAt": created_at + timedelta(minutes=random.randint(3, 10))
-            })
-    
-    scans.append(scan)
-    
-    # Create placeholder thumbnail image
-    # In a real app, you would generate actual thumbnails
-    # Here we'll just create placeholder files
-    if status == "completed":
-        with open(os.path.join("thumbnails", f"{scan_id}.jpg"), "w") as f:
-            f.write("Placeholder thumbnail")
-
-# Insert all scans
-db.scans.insert_many(scans)
-
-print(f"Initialized database with {len(scans)} sample scans")
-print(f"- Completed: {len([s for s in scans if s['status'] == 'completed'])}")
-print(f"- Processing: {len([s for s in scans if s['status'] == 'processing'])}")
-print(f"- With tumor: {len([s for s in scans if s.get('tumorDetected') == True])}")
-print(f"- Visualizations: {db.visualizations.count_documents({})}")
-print("\nDatabase initialization complete.") 
\ No newline at end of file
+    updated_at = created_at + timedelta(seconds=sum(stage_durations.values()))
+    label = rng.choices(*classes)[0]
+
+    # Probabilities peaked on the chosen label
+    weights = {name: rng.random() for name in classes[0]}
+    weights[label] += len(classes[0])
+    total = sum(weights.values())
+    probabilities = {name: weight / total for name, weight in weights.items()}
+
+    tumor_detected = label != "notumor"
+    scan.update({
+        "tumorDetected": tumor_detected,
+        "classLabel": label,
+        "classProbabilities": probabilities,
+        "notes": "No tumor detected. Brain scan appears normal.",
+        "thumbnailUrl": f"/thumbnails/{image or scan_id + '.jpg'}",
+        "heatmapUrl": f"/heatmaps/{image or scan_id + '_heatmap.jpg'}",
+        "stage_durations": stage_durations,
+        "updatedAt": updated_at,
+    })
+    if not tumor_detected:
+        return scan, None
+
+    location = rng.choice(tumor_locations)
+    scan.update({
+        "location": location,
+        "size": f"{rng.uniform(0.5, 4.0):.1f}cm",
+        "notes": f"Tumor detected in the {location} region. Recommended for additional clinical evaluation.",
+    })
+    scan.update(normalized_fields(scan))
+    if rng.random() >= args.visualization_rate:
+        return scan, None
+
+    viz_id = str(uuid.uuid4())
+    scan["visualizationId"] = viz_id
+    rendering = rng.uniform(1.0, 4.0)
+    visualization = {
+        "_id": viz_id,
+        "scan_id": scan_id,
+        "created_at": updated_at,
+        "status": "completed",
+        "params": {},
+        "stage_durations": {"rendering": rendering},
+        "updated_at": updated_at + timedelta(seconds=rendering),
+    }
+    return scan, visualization
+
+
+def insert_chunk(collection, docs):
+    """
+    Unordered insert_many; returns the number of documents written
+    """
+    if not docs:
+        return 0
+    try:
+        return len(collection.insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        # Unordered inserts carry on past bad documents; report them and move on
+        print(f"{len(e.details['writeErrors'])} documents failed to insert, e.g. {e.details['writeErrors'][0]['errmsg']}")
+        return e.details["nInserted"]
+
+
+def add_to_rollups(buckets, scan):
+    """
+    Accumulates a finished scan's rollup increments in memory, keyed by bucket
+    """
+    if scan["status"] not in ("completed", "failed"):
+        return
+    increments = rollup_increments(scan)
+    for interval in ("hour", "day"):
+        bucket = buckets[interval].setdefault(bucket_start(scan["created_at"], interval), {})
+        for key, value in increments.items():
+            bucket[key] = bucket.get(key, 0) + value
+
+
+def write_rollups(collection, buckets, chunk_size):
+    """
+    $inc upserts, so appending to existing data keeps the rollups correct
+    """
+    operations = [UpdateOne({"_id": start}, {"$inc": inc}, upsert=True) for start, inc in buckets.items()]
+    for i in range(0, len(operations), chunk_size):
+        collection.bulk_write(operations[i:i + chunk_size], ordered=False)
+
+
+def generate(db, args):
+    """
+    Writes args.scans synthetic scans (and their visualizations and rollups) to db.
+    Returns a dict of counts.
+    """
+    rng = random.Random(args.seed)
+    statuses = parse_weights(args.statuses)
+    classes = parse_weights(args.classes)
+    users = [f"user_synthetic_{i}" for i in range(args.users)]
+    now = datetime.utcnow()
+
+    if not args.no_drop:
+        for name in ("scans", "visualizations", "scan_rollups_hourly", "scan_rollups_daily"):
+            db[name].drop()
+
+    for directory in ("uploads", "thumbnails", "heatmaps"):
+        os.makedirs(directory, exist_ok=True)
+    fixtures = write_fixtures(args.fixtures, rng) if args.fixtures else []
+
+    counts = {"scans": 0, "visualizations": 0}
+    for status in statuses[0]:
+        counts[status] = 0
+    buckets = {"hour": {}, "day": {}}
+    scans, visualizations = [], []
+    started = time.perf_counter()
+
+    for i in range(args.scans):
+        scan, visualization = generate_scan(rng, now, args, statuses, classes, fixtures, users)
+        counts[scan["status"]] += 1
+        add_to_rollups(buckets, scan)
+        scans.append(scan)
+        if visualization:
+            visualizations.append(visualization)
+
+        if len(scans) >= args.chunk_size or i == args.scans - 1:
+            counts["scans"] += insert_chunk(db.scans, scans)
+            counts["visualizations"] += insert_chunk(db.visualizations, visualizations)
+            scans, visualizations = [], []
+            elapsed = time.perf_counter() - started
+            print(f"  {counts['scans']}/{args.scans} scans ({counts['scans'] / max(elapsed, 1e-9):.0f}/s)")
+
+    write_rollups(db.scan_rollups_hourly, buckets["hour"], args.chunk_size)
+    write_rollups(db.scan_rollups_daily, buckets["day"], args.chunk_size)
+    return counts
+
+
+def main():
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Generate synthetic Neurosphere data")
+    parser.add_argument("--scans", type=int, default=15, help="Number of scans to generate")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Documents per insert_many")
+    parser.add_argument("--statuses", default=DEFAULT_STATUSES, help="Status weights, e.g. " + DEFAULT_STATUSES)
+    parser.add_argument("--classes", default=DEFAULT_CLASSES, help="Class weights, e.g. " + DEFAULT_CLASSES)
+    parser.add_argument("--days", type=float, default=90, help="Spread creation dates over the last N days")
+    parser.add_argument("--dates", choices=("uniform", "recent"), default="uniform", help="Date distribution")
+    parser.add_argument("--users", type=int, default=10, help="Number of distinct uploading users")
+    parser.add_argument("--visualization-rate", type=float, default=0.8,
+                        help="Share of tumor scans that get a 3D visualization")
+    parser.add_argument("--fixtures", type=int, default=0, help="Write N small real images shared by the scans")
+    parser.add_argument("--no-drop", action="store_true", help="Append instead of dropping existing data")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable data")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    started = time.perf_counter()
+    counts = generate(client.neurosphere, args)
+    elapsed = time.perf_counter() - started
+
+    print(f"\nGenerated {counts['scans']} scans in {elapsed:.1f} s")
+    for status in parse_weights(args.statuses)[0]:
+        print(f"- {status.capitalize()}: {counts[status]}")
+    print(f"- Visualizations: {counts['visualizations']}")
+    if args.no_drop:
+        print(f"- Scans now in the database: {client.neurosphere.scans.estimated_document_count()}")
+
+
+if __name__ == "__main__":
+    main()
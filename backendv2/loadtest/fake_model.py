@@ -0,0 +1,76 @@
+"""
+Stub for ml.GradCam with a configurable latency, so the API can be load
+tested without torch or the model checkpoint.
+"""
+
+import random
+import sys
+import time
+import types
+
+import numpy as np
+
+from ml.registry import ModelRegistry
+
+class_names = ['notumor', 'glioma', 'meningioma', 'pituitary']
+
+
+def fake_cam(size=224):
+    """
+    A Gaussian blob at a random spot, shaped like a real CAM
+    """
+    cy, cx = np.random.uniform(0.2, 0.8, 2) * size
+    sigma = np.random.uniform(0.04, 0.12) * size
+    y, x = np.ogrid[:size, :size]
+    return np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / (2 * sigma ** 2)).astype(np.float32)
+
+
+def install_fake_model(latency_s=0.2, jitter_s=0.05):
+    """
+    Registers a fake ml.GradCam module; must run before main is imported
+    """
+
+    # Checkpoints are never read, but any existing file can be deployed as a new version
+    registry = ModelRegistry(load=lambda path: object(), warm=lambda model: time.sleep(latency_s), default_path=__file__)
+
+    def analyze_scan(image_path, timings=None, all_classes=True):
+        start = time.perf_counter()
+        latency = max(0.0, random.gauss(latency_s, jitter_s))
+        with registry.use() as entry:
+            # Forward pass, then Grad-CAM, each holding the model like the real one
+            with entry["lock"]:
+                time.sleep(latency / 2)
+            with entry["lock"]:
+                time.sleep(latency / 2)
+        if timings is not None:
+            timings["forward"] = timings.get("forward", 0.0) + time.perf_counter() - start
+        probabilities = np.random.dirichlet(np.ones(len(class_names)))
+        result = {
+            "overlay": np.zeros((224, 224, 3), dtype=np.uint8),
+            "predicted_class": class_names[int(np.argmax(probabilities))],
+            "probabilities": probabilities,
+            "embedding": np.random.rand(512).astype(np.float32),
+            "model_version": entry["version"],
+            "source_shape": (224, 224),
+        }
+        if result["predicted_class"] != "notumor":
+            result["cam"] = fake_cam()
+        if all_classes and result["predicted_class"] != "notumor":
+            result["class_cams"] = np.random.rand(len(class_names), 224, 224).astype(np.float32)
+            result["class_overlays"] = {label: result["overlay"] for label in class_names[1:]}
+        return result
+
+    def get_cam_overlay(image_path):
+        return analyze_scan(image_path, all_classes=False)["overlay"]
+
+    def warm_up():
+        registry.ensure_loaded()
+
+    module = types.ModuleType("ml.GradCam")
+    module.class_names = class_names
+    module.analyze_scan = analyze_scan
+    module.get_cam_overlay = get_cam_overlay
+    module.warm_up = warm_up
+    module.registry = registry
+    sys.modules["ml.GradCam"] = module
+    return module
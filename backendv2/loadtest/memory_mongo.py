@@ -0,0 +1,309 @@
+"""
+In-memory stand-in for the subset of the pymongo API used by main.py.
+
+It is only meant for load tests: documents live in a dict per collection,
+every operation takes a single lock, and queries are evaluated by a
+linear scan.
+"""
+
+import copy
+import threading
+from itertools import islice
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _match_condition(value, found, condition):
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op == "$exists" and found != bool(operand):
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if not found or value is None:
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$gte" and not value >= operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+        return True
+    return value == condition
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        else:
+            value, found = _get_path(doc, key)
+            if not _match_condition(value, found, condition):
+                return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v}
+    if include:
+        result = {}
+        for key in include:
+            value, found = _get_path(doc, key)
+            if found:
+                _set_path(result, key, copy.deepcopy(value))
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    result = copy.deepcopy(doc)
+    for key in projection:
+        _unset_path(result, key)
+    return result
+
+
+def _apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for key, value in fields.items():
+                _set_path(doc, key, copy.deepcopy(value))
+        elif op == "$inc":
+            for key, value in fields.items():
+                current, _ = _get_path(doc, key)
+                _set_path(doc, key, (current or 0) + value)
+        elif op == "$unset":
+            for key in fields:
+                _unset_path(doc, key)
+
+
+class UpdateResult:
+    def __init__(self, matched_count, modified_count, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+class DeleteResult:
+    def __init__(self, deleted_count):
+        self.deleted_count = deleted_count
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class InMemoryCursor:
+    def __init__(self, docs, projection):
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=1):
+        keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        # Stable sorts applied from the last key to the first give a multi-key sort
+        for key, key_direction in reversed(keys):
+            self._docs.sort(
+                key=lambda d: (_get_path(d, key)[0] is not None, _get_path(d, key)[0]),
+                reverse=key_direction < 0,
+            )
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def hint(self, index):
+        return self
+
+    def __iter__(self):
+        end = self._skip + self._limit if self._limit else None
+        for doc in islice(self._docs, self._skip, end):
+            yield _project(doc, self._projection)
+
+
+class InMemoryCollection:
+    def __init__(self, name):
+        self.name = name
+        self._docs = {}
+        self._lock = threading.RLock()
+        self._next_id = 0
+
+    def _new_id(self):
+        self._next_id += 1
+        return f"{self.name}-{self._next_id}"
+
+    def _matching(self, query):
+        return [doc for doc in self._docs.values() if matches(doc, query)]
+
+    def find_one(self, query=None, projection=None, **kwargs):
+        with self._lock:
+            if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+                doc = self._docs.get(query["_id"])
+                return _project(doc, projection) if doc is not None else None
+            for doc in self._docs.values():
+                if matches(doc, query):
+                    return _project(doc, projection)
+        return None
+
+    def find(self, query=None, projection=None, **kwargs):
+        with self._lock:
+            return InMemoryCursor(self._matching(query), projection)
+
+    def count_documents(self, query, **kwargs):
+        with self._lock:
+            return len(self._matching(query))
+
+    def insert_one(self, doc, **kwargs):
+        with self._lock:
+            doc.setdefault("_id", self._new_id())
+            if doc["_id"] in self._docs:
+                raise ValueError(f"Duplicate key {doc['_id']}")
+            self._docs[doc["_id"]] = copy.deepcopy(doc)
+            return InsertOneResult(doc["_id"])
+
+    def insert_many(self, docs, ordered=True, **kwargs):
+        ids = [self.insert_one(doc).inserted_id for doc in docs]
+        return InsertManyResult(ids)
+
+    def _update(self, query, update, upsert, many):
+        with self._lock:
+            targets = self._matching(query)
+            if not many:
+                targets = targets[:1]
+            for doc in targets:
+                _apply_update(doc, update)
+            if targets or not upsert:
+                return UpdateResult(len(targets), len(targets))
+
+            doc = {k: v for k, v in (query or {}).items() if not k.startswith("$") and not isinstance(v, dict)}
+            _apply_update(doc, update, inserting=True)
+            doc.setdefault("_id", self._new_id())
+            self._docs[doc["_id"]] = doc
+            return UpdateResult(0, 0, upserted_id=doc["_id"])
+
+    def update_one(self, query, update, upsert=False, **kwargs):
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query, update, upsert=False, **kwargs):
+        return self._update(query, update, upsert, many=True)
+
+    def replace_one(self, query, replacement, upsert=False, **kwargs):
+        with self._lock:
+            targets = self._matching(query)[:1]
+            if targets:
+                replacement = dict(replacement, _id=targets[0]["_id"])
+                self._docs[targets[0]["_id"]] = copy.deepcopy(replacement)
+                return UpdateResult(1, 1)
+            if upsert:
+                self.insert_one(dict(replacement))
+            return UpdateResult(0, 0)
+
+    def delete_one(self, query, **kwargs):
+        with self._lock:
+            for doc in self._matching(query)[:1]:
+                del self._docs[doc["_id"]]
+                return DeleteResult(1)
+            return DeleteResult(0)
+
+    def delete_many(self, query, **kwargs):
+        with self._lock:
+            targets = self._matching(query)
+            for doc in targets:
+                del self._docs[doc["_id"]]
+            return DeleteResult(len(targets))
+
+    def create_index(self, keys, **kwargs):
+        return kwargs.get("name", "index")
+
+    def create_indexes(self, indexes, **kwargs):
+        return [getattr(index, "document", {}).get("name", "index") for index in indexes]
+
+    def drop(self):
+        with self._lock:
+            self._docs.clear()
+
+
+class InMemoryDatabase:
+    def __init__(self, name="neurosphere"):
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = InMemoryCollection(name)
+            return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class InMemoryClient:
+    def __init__(self):
+        self._databases = {}
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase(name)
+        return self._databases[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def close(self):
+        pass
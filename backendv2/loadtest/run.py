@@ -0,0 +1,277 @@
+"""
+Hermetic load test for the Neurosphere API.
+
+Boots main.app in-process on uvicorn with an in-memory Mongo stand-in and
+a fake model of configurable latency, then drives a weighted mix of
+upload, list, status, stats and auth requests at increasing concurrency. For
+every step it reports throughput and latency percentiles per endpoint
+plus event-loop lag, which shows where the event loop or the threadpool
+saturates.
+
+Usage (from backendv2/):
+    python -m loadtest.run --concurrency 1 4 16 64 --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from auth.local_jwks import LocalJWKS
+from loadtest.fake_model import install_fake_model
+from loadtest.memory_mongo import InMemoryClient
+
+DEFAULT_MIX = "upload=0.05,list=0.40,status=0.35,stats=0.10,auth=0.10"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def boot_app(model_latency, model_jitter, threadpool_size):
+    """
+    Imports main with the fake model, swaps every Mongo collection for an in-memory one
+    and points session verification at a local key set
+    """
+    import anyio.to_thread
+    from pymongo.collection import Collection
+
+    install_fake_model(model_latency, model_jitter)
+    import main
+
+    memory_client = InMemoryClient()
+    memory_db = memory_client[main.db.name]
+    for name, value in list(vars(main).items()):
+        if isinstance(value, Collection):
+            setattr(main, name, memory_db[value.name])
+    main.client = memory_client
+    main.db = memory_db
+
+    local_jwks = LocalJWKS()
+    main.jwks_cache.fetch_keys = local_jwks
+    main.session_verifier.authorized_parties = []
+
+    loop_lag = []
+
+    async def configure_loop():
+        if threadpool_size:
+            anyio.to_thread.current_default_thread_limiter().total_tokens = threadpool_size
+
+        # Measures how late a 10 ms sleep wakes up: the event loop's queueing delay
+        async def probe():
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                loop_lag.append((time.perf_counter(), time.perf_counter() - start - 0.01))
+
+        asyncio.get_running_loop().create_task(probe())
+
+    main.app.router.on_startup.append(configure_loop)
+    return main, loop_lag, local_jwks
+
+
+def seed_scans(main, count):
+    now = datetime.utcnow()
+    ids = []
+    docs = []
+    for _ in range(count):
+        scan_id = str(uuid.uuid4())
+        created_at = now - timedelta(minutes=random.randint(0, 60 * 24 * 90))
+        docs.append({
+            "_id": scan_id,
+            "created_at": created_at,
+            "status": "completed",
+            "stage": "completed",
+            "progress": 100,
+            "file_url": f"/uploads/{scan_id}_sample.jpg",
+            "tumorDetected": random.random() < 0.7,
+            "location": "Frontal lobe",
+            "size": "2.3cm",
+            "thumbnailUrl": f"/thumbnails/{scan_id}.jpg",
+            "updatedAt": created_at + timedelta(minutes=5),
+        })
+        ids.append(scan_id)
+    if docs:
+        main.scans_collection.insert_many(docs)
+    return ids
+
+
+def start_server(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def sample_image():
+    import cv2
+
+    image = np.random.randint(0, 255, (256, 256, 3), dtype=np.uint8)
+    return cv2.imencode(".jpg", image)[1].tobytes()
+
+
+async def run_step(base_url, concurrency, duration, mix, scan_ids, image_bytes, tokens):
+    import httpx
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    records = []
+    deadline = time.perf_counter() + duration
+
+    async def request(client, name):
+        if name == "upload":
+            return await client.post(
+                "/api/scans/upload",
+                files={"file": ("scan.jpg", image_bytes, "image/jpeg")},
+                data={"metadata": json.dumps({"patient": "load-test"})},
+            )
+        if name == "list":
+            return await client.get("/api/scans", params={"page": random.randint(1, 20), "limit": 10})
+        if name == "status":
+            return await client.get(f"/api/scans/{random.choice(scan_ids)}/status")
+        if name == "stats":
+            return await client.get("/api/users/stats")
+        if name == "auth":
+            token = random.choice(tokens)
+            return await client.get("/api/auth/validate", headers={"Authorization": f"Bearer {token}"})
+        raise ValueError(f"Unknown operation {name}")
+
+    async def worker(client):
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await request(client, name)
+                ok = response.status_code < 400
+                if name == "upload" and ok:
+                    scan_ids.append(response.json()["scanId"])
+            except httpx.HTTPError:
+                ok = False
+            records.append((name, time.perf_counter() - start, ok))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return records, elapsed
+
+
+def summarize_step(records, elapsed, lag_samples):
+    endpoints = {}
+    for name in sorted({r[0] for r in records}):
+        latencies = np.array([r[1] for r in records if r[0] == name]) * 1000
+        errors = sum(1 for r in records if r[0] == name and not r[2])
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        endpoints[name] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput_rps": len(latencies) / elapsed,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+        }
+    lag = np.array(lag_samples) * 1000 if lag_samples else np.zeros(1)
+    return {
+        "throughput_rps": len(records) / elapsed,
+        "errors": sum(1 for r in records if not r[2]),
+        "loop_lag_p50_ms": float(np.percentile(lag, 50)),
+        "loop_lag_p99_ms": float(np.percentile(lag, 99)),
+        "endpoints": endpoints,
+    }
+
+
+def find_saturation(steps):
+    """
+    First concurrency step where throughput stops scaling while latency keeps climbing
+    """
+    def worst_p95(step):
+        return max(e["p95_ms"] for e in step["endpoints"].values())
+
+    for previous, current in zip(steps, steps[1:]):
+        gain = current["throughput_rps"] / max(previous["throughput_rps"], 1e-9)
+        if gain < 1.1 and worst_p95(current) > 1.5 * worst_p95(previous):
+            return current["concurrency"]
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Neurosphere API")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per concurrency step")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted operations, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--model-latency", type=float, default=0.2, help="Fake model latency in seconds")
+    parser.add_argument("--model-jitter", type=float, default=0.05)
+    parser.add_argument("--seed-scans", type=int, default=1000)
+    parser.add_argument("--threadpool-size", type=int, default=0, help="Override the 40-thread default")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    mix = parse_mix(args.mix)
+
+    # main.py writes uploads, thumbnails and heatmaps relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="neurosphere-loadtest-")
+    os.chdir(workdir)
+
+    app_module, loop_lag, local_jwks = boot_app(args.model_latency, args.model_jitter, args.threadpool_size)
+    scan_ids = seed_scans(app_module, args.seed_scans)
+    tokens = [local_jwks.issue_token(sub=f"user_load_{i}", expires_in=3600) for i in range(50)]
+    server, thread = start_server(app_module.app, args.port)
+    image_bytes = sample_image()
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    steps = []
+    try:
+        for concurrency in args.concurrency:
+            step_start = time.perf_counter()
+            records, elapsed = asyncio.run(
+                run_step(base_url, concurrency, args.duration, mix, scan_ids, image_bytes, tokens)
+            )
+            lag_samples = [lag for t, lag in list(loop_lag) if t >= step_start]
+            step = {"concurrency": concurrency, **summarize_step(records, elapsed, lag_samples)}
+            steps.append(step)
+
+            print(f"concurrency={concurrency}: {step['throughput_rps']:.1f} req/s, "
+                  f"loop lag p99 {step['loop_lag_p99_ms']:.1f} ms, errors {step['errors']}")
+            for name, stats in step["endpoints"].items():
+                print(f"  {name:<8} {stats['throughput_rps']:8.1f} req/s  "
+                      f"p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms")
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    results = {
+        "config": vars(args),
+        "steps": steps,
+        "saturation_concurrency": find_saturation(steps),
+    }
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saturation point: {results['saturation_concurrency']}")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,35 @@
 from fastapi import FastAPI, File, UploadFile, Form, Depends, HTTPException, status, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pymongo.mongo_client import MongoClient
+import asyncio
+import hmac
 import os
+import math
+import threading
+import time
 import uuid
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
-import httpx
-from clerk_backend_api import Clerk
-from clerk_backend_api.jwks_helpers import authenticate_request, AuthenticateRequestOptions
-import cv2
-import numpy as np
 
-# Import the GradCam functionality
-from ml.GradCam import get_cam_overlay
+# The GradCam functionality; torch and the model load lazily behind this
+from ml import inference, localization
+from ml.embedding_index import EmbeddingIndex
+from auth.jwks import InvalidSessionToken, JWKSCache, SessionVerifier, SigningKeysUnavailable
+from metrics import (
+    JOBS_FINISHED, JOBS_IN_FLIGHT, JOBS_QUEUED, PREDICTIONS, SCHEDULER_WAIT, MetricsMiddleware, MongoCommandTimer,
+    observe_stages, render_metrics, stats_collector, time_stage,
+)
+from eta import StageETA, poll_interval
+from rollups import INTERVALS, record_scan, timeseries
+import export
+import search
+from scheduler import AdmissionRejected, InferenceScheduler
+import response_cache
+import resumable
 
 # Initialize FastAPI
 app = FastAPI()
@@ -35,20 +49,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Resumable upload clients read the confirmed offset from these
+    expose_headers=["Upload-Offset", "Upload-Length", "Location", "ETag", "X-Export-Watermark"],
 )
 
+# Added last so it wraps everything else and times the full request
+app.add_middleware(MetricsMiddleware)
+
 # Connect to MongoDB
 mongo_uri = os.getenv("MONGO_URI")
-client = MongoClient(mongo_uri)
+client = MongoClient(mongo_uri, event_listeners=[MongoCommandTimer()])
 db = client.neurosphere
 scans_collection = db.scans
 visualizations_collection = db.visualizations
+upload_sessions_collection = db.upload_sessions
+model_settings_collection = db.model_settings
+# Hourly and daily aggregates of finished scans, for the dashboard trends
+scan_rollups_hourly = db.scan_rollups_hourly
+scan_rollups_daily = db.scan_rollups_daily
 
 # Ensure storage directories exist
 os.makedirs("uploads", exist_ok=True)
+os.makedirs(resumable.PARTIAL_DIR, exist_ok=True)
 os.makedirs("thumbnails", exist_ok=True)
 os.makedirs("visualizations_html", exist_ok=True)
 os.makedirs("heatmaps", exist_ok=True)  # Add directory for heatmaps
+os.makedirs("indexes", exist_ok=True)
+
+# Similar-case retrieval over the pooled feature vectors of completed scans
+embedding_index = EmbeddingIndex(os.path.join("indexes", "scan_embeddings"))
 
 # Serve static files
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -63,53 +92,338 @@ def create_json_response(content, status_code=200):
         headers={"Content-Type": "application/json"}
     )
 
+# Clerk session tokens are verified locally against a cached, background-refreshed JWKS
+authorized_parties = os.getenv("CLERK_AUTHORIZED_PARTIES", "").split(",") if os.getenv("CLERK_AUTHORIZED_PARTIES") else []
+jwks_cache = JWKSCache()
+session_verifier = SessionVerifier(jwks_cache, authorized_parties=authorized_parties)
+
+# Model inference runs on the scheduler: interactive requests ahead of bulk scan
+# processing, users served round-robin, and new work shed when SLOs are at risk
+inference_scheduler = InferenceScheduler(
+    bulk_workers=int(os.getenv("INFERENCE_BULK_WORKERS", "1")),
+    interactive_workers=int(os.getenv("INFERENCE_INTERACTIVE_WORKERS", "1")),
+    interactive_slo=float(os.getenv("INTERACTIVE_SLO_SECONDS", "2.0")),
+    bulk_max_wait=float(os.getenv("BULK_MAX_WAIT_SECONDS", "900")),
+)
+inference_scheduler.on_complete = lambda lane, wait, service: SCHEDULER_WAIT.labels(lane).observe(wait)
+
+# Completion-time estimates, learned from the stage durations of finished jobs.
+# Scans run on the scheduler's bulk lane, so its workers bound how many run at
+# once; visualizations are background tasks on the request threadpool.
+scan_eta = StageETA(
+    ["uploading", "processing", "building_3d_model"],
+    {"uploading": 1.0, "processing": 1.0, "building_3d_model": 3.0},
+    workers=inference_scheduler.bulk_workers,
+)
+visualization_eta = StageETA(
+    ["rendering"], {"rendering": 3.0}, workers=int(os.getenv("VISUALIZATION_WORKERS", "40"))
+)
+JOBS_QUEUED.set_function(lambda: scan_eta.queued)
+JOBS_IN_FLIGHT.set_function(lambda: scan_eta.running)
+
+@app.on_event("startup")
+def start_inference_scheduler():
+    inference_scheduler.start()
+
+@app.on_event("shutdown")
+def stop_inference_scheduler():
+    inference_scheduler.stop()
+
+def request_user(request: Request):
+    """
+    Who to account work to: the session's user if there is a valid token, else the client address.
+    Verification can fetch the JWKS, so async endpoints call this with run_in_threadpool.
+    """
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.lower().startswith("bearer "):
+        try:
+            return session_verifier.verify(auth_header.split(" ", 1)[1]).get("sub")
+        except InvalidSessionToken:
+            pass
+    return request.client.host if request.client else "anonymous"
+
+def admit_or_429(lane):
+    try:
+        inference_scheduler.admit(lane)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+# Rendered detail responses for finished scans and visualizations
+detail_cache = response_cache.ResponseCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "300")),
+)
+
+# Every write to a scan or visualization includes this, so cached responses in
+# any worker process can tell they are stale
+NEW_REVISION = {"$inc": {"rev": 1}}
+
+def scan_written(scan_id):
+    # Call after every write to a scan document
+    detail_cache.invalidate(f"scan:{scan_id}")
+
+def visualization_written(viz_id):
+    detail_cache.invalidate(f"visualization:{viz_id}")
+
+# Cache statistics are read when /metrics is scraped
+stats_collector.add_source("jwks", lambda: jwks_cache.stats())
+stats_collector.add_source("session", lambda: session_verifier.stats())
+stats_collector.add_source("embedding_index", lambda: embedding_index.stats())
+stats_collector.add_source("scheduler", lambda: inference_scheduler.stats())
+stats_collector.add_source("detail_cache", lambda: detail_cache.stats())
+
+@app.on_event("startup")
+def start_jwks_refresh():
+    jwks_cache.start()
+
+@app.on_event("shutdown")
+def stop_jwks_refresh():
+    jwks_cache.stop()
+
 # Dependency: Clerk authentication
 def get_current_user(request: Request):
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.lower().startswith("bearer "):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
     token = auth_header.split(" ", 1)[1]
-    # Initialize Clerk SDK
-    clerk = Clerk(bearer_auth=os.getenv("CLERK_SECRET_KEY"))
-    # Build an httpx.Request for verification
-    httpx_req = httpx.Request(request.method, str(request.url), headers=dict(request.headers))
-    # Configure authorized parties
-    authorized_parties = os.getenv("CLERK_AUTHORIZED_PARTIES", "").split(",") if os.getenv("CLERK_AUTHORIZED_PARTIES") else []
-    auth_options = AuthenticateRequestOptions(authorized_parties=authorized_parties)
-    # Authenticate
-    state = clerk.authenticate_request(httpx_req, auth_options)
-    if not state.is_signed_in:
+    try:
+        return session_verifier.verify(token)  # claims (e.g., sub for user_id)
+    except SigningKeysUnavailable:
+        # Clerk's JWKS is unreachable: the token may be fine, so don't sign the client out
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session verification unavailable",
+                            headers={"Retry-After": str(jwks_cache.min_refetch_interval)})
+    except InvalidSessionToken:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session")
-    return state.payload  # payload contains claims (e.g., sub for user_id)
 
-# Endpoint: Validate user session
+def optional_user(request: Request):
+    # Claims for a valid session, None for a missing or invalid one
+    try:
+        return get_current_user(request)
+    except HTTPException:
+        return None
+
+# Endpoint: Validate user session; always 200, isAuthenticated says whether the token was good
 @app.get("/api/auth/validate")
-async def api_validate_user():
-    return create_json_response({"isAuthenticated": True, "userId": None, "permissions": []})
+def api_validate_user(claims: Optional[dict] = Depends(optional_user)):
+    return create_json_response({
+        "isAuthenticated": claims is not None,
+        "userId": claims.get("sub") if claims else None,
+        "permissions": []
+    })
+
+# The similarity index follows the embeddings stored on scans, so every worker
+# process sees scans finished by the others within EMBEDDING_SYNC_SECONDS
+EMBEDDING_SYNC_SECONDS = float(os.getenv("EMBEDDING_SYNC_SECONDS", "5"))
+# updatedAt is set just before the write lands, so re-read a window behind the watermark
+EMBEDDING_SYNC_LAG = timedelta(seconds=60)
+embedding_sync_stop = threading.Event()
+
+def sync_embedding_index():
+    """
+    Merges embeddings written since the index's watermark, or all of them if it has none
+    """
+    query = {"embedding": {"$exists": True}}
+    if embedding_index.watermark:
+        query["updatedAt"] = {"$gte": embedding_index.watermark - EMBEDDING_SYNC_LAG}
+    cursor = scans_collection.find(query, {"embedding": 1, "updatedAt": 1})
+    return embedding_index.merge((doc["_id"], doc["embedding"], doc.get("updatedAt")) for doc in cursor)
+
+def embedding_sync_loop():
+    while not embedding_sync_stop.wait(EMBEDDING_SYNC_SECONDS):
+        try:
+            sync_embedding_index()
+            embedding_index.maybe_save()
+        except Exception as e:
+            print(f"Error syncing embedding index: {e}")
+
+# Load the similarity index from its snapshot, then catch up from the scans collection
+@app.on_event("startup")
+def load_embedding_index():
+    found = embedding_index.load()
+    sync_embedding_index()
+    if not found:
+        embedding_index.save()
+    threading.Thread(target=embedding_sync_loop, name="embedding-sync", daemon=True).start()
+
+# Load the model in the background; /api/health/ready reports when it is hot
+@app.on_event("startup")
+def warm_up_model():
+    if os.getenv("MODEL_WARMUP", "1") != "0":
+        # Start on the pinned version if one was deployed, so a restart doesn't revert it
+        pinned = pinned_model()
+        inference.start_warm_up(pinned and pinned["path"], pinned and pinned["version"])
+    threading.Thread(target=sync_model_version, name="model-sync", daemon=True).start()
+
+# Model deployment: the pinned checkpoint is kept in Mongo so every worker
+# process (and every restart) converges on it
+MODEL_DIR = os.path.abspath(os.getenv("MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml")))
+MODEL_SYNC_SECONDS = float(os.getenv("MODEL_SYNC_SECONDS", "15"))
+model_sync_stop = threading.Event()
+
+def pinned_model():
+    """
+    The pinned {"version", "path"}, or None
+    """
+    try:
+        pinned = model_settings_collection.find_one({"_id": "active"})
+    except Exception as e:
+        print(f"Error reading pinned model: {e}")
+        return None
+    # Pins from before versions were recorded only name a path, which may hold other bytes now
+    if not pinned or not pinned.get("version"):
+        return None
+    return {"version": pinned["version"], "path": pinned["path"]}
+
+def pin_model(version, path):
+    model_settings_collection.update_one(
+        {"_id": "active"}, {"$set": {"version": version, "path": path, "updated_at": datetime.utcnow()}}, upsert=True
+    )
+
+def sync_model_version():
+    # Picks up deploys and rollbacks made through another worker. Versions are
+    # compared, not paths, so a new checkpoint written over the old path is noticed too
+    while not model_sync_stop.wait(MODEL_SYNC_SECONDS):
+        pinned = pinned_model()
+        if not pinned or not inference.is_ready():
+            continue
+        try:
+            status = inference.model_status()
+            if status["deploying"] is not None or pinned["version"] == status["active"]:
+                continue
+            if pinned["version"] in {v["version"] for v in status["versions"]}:
+                inference.activate_model(pinned["version"])
+            else:
+                inference.deploy_model(pinned["path"], expected_version=pinned["version"])
+        except Exception as e:
+            print(f"Error syncing model version: {e}")
+
+@app.on_event("shutdown")
+def stop_model_sync():
+    model_sync_stop.set()
+
+def checkpoint_path(path):
+    """
+    Resolves a checkpoint path, which must be a .pth/.pt file under MODEL_DIR
+    """
+    resolved = os.path.abspath(os.path.join(MODEL_DIR, path))
+    if os.path.commonpath([resolved, MODEL_DIR]) != MODEL_DIR or not resolved.endswith((".pth", ".pt")):
+        raise HTTPException(status_code=400, detail="Checkpoint must be a .pth or .pt file in the model directory")
+    if not os.path.isfile(resolved):
+        raise HTTPException(status_code=404, detail="Checkpoint not found")
+    return resolved
+
+# Who may change the model for everyone: a deploy token (for CI), or a session
+# whose user is listed in MODEL_ADMIN_USERS or carries an admin role
+MODEL_DEPLOY_TOKEN = os.getenv("MODEL_DEPLOY_TOKEN")
+MODEL_ADMIN_USERS = {u.strip() for u in os.getenv("MODEL_ADMIN_USERS", "").split(",") if u.strip()}
+
+def require_model_admin(request: Request):
+    deploy_token = request.headers.get("X-Deploy-Token")
+    if MODEL_DEPLOY_TOKEN and deploy_token and hmac.compare_digest(deploy_token, MODEL_DEPLOY_TOKEN):
+        return {"sub": "deploy-token"}
+    claims = get_current_user(request)
+    metadata = claims.get("metadata") if isinstance(claims.get("metadata"), dict) else {}
+    if (claims.get("sub") in MODEL_ADMIN_USERS or claims.get("org_role") == "org:admin"
+            or metadata.get("role") == "admin"):
+        return claims
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Model deployment requires an admin role")
+
+# Endpoint: Loaded model versions
+@app.get("/api/models")
+def get_models(claims: dict = Depends(get_current_user)):
+    return create_json_response({**inference.model_status(), "pinned": pinned_model()})
+
+# Endpoint: Deploy a checkpoint; it is loaded and warmed before it takes traffic
+@app.post("/api/models/deploy")
+def deploy_model(params: dict, claims: dict = Depends(require_model_admin)):
+    path = checkpoint_path(str(params.get("path") or ""))
+    # Pinned only once it is live here, so a bad checkpoint never reaches the other workers
+    inference.deploy_model(path, on_deployed=lambda version: pin_model(version, path))
+    return create_json_response({"status": "deploying", "path": path}, status_code=202)
+
+# Endpoint: Switch back to the previously active version
+@app.post("/api/models/rollback")
+def rollback_model(claims: dict = Depends(require_model_admin)):
+    try:
+        version = inference.rollback_model()
+    except KeyError as e:
+        raise HTTPException(status_code=409, detail=str(e.args[0]))
+    pin_model(version, inference.active_model_path())
+    return create_json_response({"status": "active", "version": version})
+
+# Seed the estimators from the most recent finished jobs
+@app.on_event("startup")
+def seed_eta_estimators():
+    recent_scans = scans_collection.find(
+        {"stage_durations": {"$exists": True}}, {"stage_durations": 1}
+    ).sort("created_at", -1).limit(200)
+    scan_eta.seed(reversed(list(recent_scans)))
+    recent_visualizations = visualizations_collection.find(
+        {"stage_durations": {"$exists": True}}, {"stage_durations": 1}
+    ).sort("created_at", -1).limit(200)
+    visualization_eta.seed(reversed(list(recent_visualizations)))
+
+@app.on_event("shutdown")
+def save_embedding_index():
+    embedding_sync_stop.set()
+    # A no-op unless this process is the snapshot writer
+    embedding_index.save()
 
 # Function to generate a heatmap for an MRI scan
 def generate_scan_heatmap(input_file_path, scan_id):
+    """
+    Runs the model on a scan and saves its heatmap.
+    Returns the analysis with the heatmap URL added, or None on failure.
+    """
+    import cv2
     try:
         # Create paths for the heatmap
         heatmap_path = os.path.join("heatmaps", f"{scan_id}_heatmap.jpg")
         
         # Use the GradCam functionality to generate the heatmap
-        overlay = get_cam_overlay(input_file_path)
+        timings = {}
+        analysis = inference.analyze_scan(input_file_path, timings=timings)
+        observe_stages(timings)
+        PREDICTIONS.labels(analysis["predicted_class"]).inc()
         
-        # Save the heatmap
-        cv2.imwrite(heatmap_path, overlay)
+        # Save the heatmap, plus one per tumor class so they can be compared
+        analysis["class_heatmap_urls"] = {}
+        with time_stage("encode"):
+            cv2.imwrite(heatmap_path, analysis["overlay"])
+            for label, overlay in analysis.get("class_overlays", {}).items():
+                cv2.imwrite(os.path.join("heatmaps", f"{scan_id}_{label}_heatmap.jpg"), overlay)
+                analysis["class_heatmap_urls"][label] = f"/heatmaps/{scan_id}_{label}_heatmap.jpg"
         
         # Return the relative URL for the heatmap
-        return f"/heatmaps/{scan_id}_heatmap.jpg"
+        analysis["heatmap_url"] = f"/heatmaps/{scan_id}_heatmap.jpg"
+        return analysis
     except Exception as e:
         print(f"Error generating heatmap: {e}")
         return None
 
 # Background task: process MRI scan
+def update_rollups(scan):
+    # A rollup failure must never fail the scan itself
+    try:
+        record_scan(scan_rollups_hourly, scan_rollups_daily, scan)
+    except Exception as e:
+        print(f"Error updating rollups: {e}")
+
+def scan_notes(analysis, located):
+    if not analysis:
+        return "Automated analysis was not available for this scan."
+    if analysis["predicted_class"] == "notumor":
+        return "No tumor detected."
+    if not located:
+        return f"{analysis['predicted_class'].capitalize()} detected; the heatmap did not localize it."
+    return f"{analysis['predicted_class'].capitalize()} detected in the {located['location'].lower()} region."
+
 def process_scan_task(scan_id: str):
+    scan_eta.job_started(scan_id)
+    scan_data = None
     try:
         # Get the scan data from the database
-        scan_data = scans_collection.find_one({"_id": scan_id})
+        scan_data = scans_collection.find_one({"_id": scan_id}, {"embedding": 0})
         if not scan_data:
             print(f"Scan {scan_id} not found")
             return
@@ -117,48 +431,110 @@ def process_scan_task(scan_id: str):
         # Get the file path from the database
         file_path = scan_data["file_url"].replace("/uploads/", "uploads/")
         
-        stages = [("uploading", 10), ("processing", 50), ("building_3d_model", 75)]
-        for stage, progress in stages:
-            scans_collection.update_one({"_id": scan_id}, {"$set": {"stage": stage, "progress": progress}})
-            import time; time.sleep(1)
+        # Time spent in each stage, kept on the scan for the ETA estimator
+        stage_durations = {"queued": (datetime.utcnow() - scan_data["created_at"]).total_seconds()}
+        current_stage, stage_started = None, time.monotonic()
         
-        # Generate the heatmap
-        heatmap_url = None
-        if os.path.exists(file_path):
-            heatmap_url = generate_scan_heatmap(file_path, scan_id)
+        def advance(stage, progress):
+            nonlocal current_stage, stage_started
+            if current_stage:
+                stage_durations[current_stage] = time.monotonic() - stage_started
+            current_stage, stage_started = stage, time.monotonic()
+            scans_collection.update_one({"_id": scan_id}, {"$set": {
+                "stage": stage,
+                "progress": progress,
+                "stage_started_at": datetime.utcnow(),
+                "stage_durations": stage_durations,
+            }, **NEW_REVISION})
+            scan_written(scan_id)
+        
+        # Stages mark real work: reading the upload, the analysis, then the derived outputs
+        advance("uploading", 10)
+        has_file = os.path.exists(file_path)
+        
+        # Generate the heatmap; this already runs on a bulk inference worker
+        advance("processing", 50)
+        analysis = generate_scan_heatmap(file_path, scan_id) if has_file else None
+        heatmap_url = analysis["heatmap_url"] if analysis else None
+        
+        advance("building_3d_model", 75)
         
         # Create a thumbnail of the original image
         thumbnail_path = os.path.join("thumbnails", f"{scan_id}.jpg")
-        if os.path.exists(file_path):
+        if has_file:
             try:
                 # Load the image and create a thumbnail
-                img = cv2.imread(file_path)
-                if img is not None:
-                    img_resized = cv2.resize(img, (224, 224))
-                    cv2.imwrite(thumbnail_path, img_resized)
+                with time_stage("thumbnail"):
+                    import cv2
+                    img = cv2.imread(file_path)
+                    if img is not None:
+                        img_resized = cv2.resize(img, (224, 224))
+                        cv2.imwrite(thumbnail_path, img_resized)
             except Exception as e:
                 print(f"Error creating thumbnail: {e}")
         
+        # Location and extent come from the CAM already in memory
+        located = None
+        if analysis and analysis.get("cam") is not None:
+            with time_stage("localize"):
+                located = localization.localize(
+                    analysis["cam"],
+                    analysis.get("source_shape"),
+                    localization.pixel_spacing_mm(scan_data.get("metadata")),
+                    analysis["predicted_class"],
+                )
+        
         # Finalize scan
         result = {
-            "tumorDetected": True,
-            "location": "Frontal lobe",
-            "size": "2.3cm",
-            "notes": "Tumor detected in the frontal lobe region.",
+            "tumorDetected": analysis["predicted_class"] != "notumor" if analysis else True,
+            "classLabel": analysis["predicted_class"] if analysis else None,
+            "location": located["location"] if located else None,
+            "size": located["size"] if located else None,
+            "extent": located["extent"] if located else None,
+            "tumorCoordinates": located["tumorCoordinates"] if located else None,
+            "notes": scan_notes(analysis, located),
             "thumbnailUrl": f"/thumbnails/{scan_id}.jpg",
             "heatmapUrl": heatmap_url,  # Add the heatmap URL
             "updatedAt": datetime.utcnow()
         }
-        scans_collection.update_one({"_id": scan_id}, {"$set": {"status": "completed", **result, "progress": 100, "stage": "completed"}})
+        result.update(search.normalized_fields(result))
+        if analysis:
+            result["embedding"] = analysis["embedding"].tolist()
+            result["classProbabilities"] = {
+                label: float(p) for label, p in zip(inference.class_names(), analysis["probabilities"])
+            }
+            result["classHeatmapUrls"] = analysis["class_heatmap_urls"]
+            result["modelVersion"] = analysis.get("model_version")
+        stage_durations[current_stage] = time.monotonic() - stage_started
+        result["stage_durations"] = stage_durations
+        scan_eta.observe_job(stage_durations)
+        scans_collection.update_one({"_id": scan_id}, {"$set": {"status": "completed", **result, "progress": 100, "stage": "completed"}, **NEW_REVISION})
+        scan_written(scan_id)
+        update_rollups({**scan_data, **result, "status": "completed"})
+        JOBS_FINISHED.labels("completed").inc()
+        if analysis:
+            # Visible here at once; other workers merge it from the scan document.
+            # The scan is already completed, so a failure here only delays that until the next sync.
+            try:
+                with time_stage("index_add"):
+                    embedding_index.add(scan_id, analysis["embedding"])
+            except Exception as e:
+                print(f"Error adding scan {scan_id} to the embedding index: {e}")
     except Exception as e:
         print(f"Error in process_scan_task: {e}")
+        JOBS_FINISHED.labels("failed").inc()
         # Update the scan status to failed
-        scans_collection.update_one({"_id": scan_id}, {"$set": {"status": "failed", "error": str(e)}})
+        scans_collection.update_one({"_id": scan_id}, {"$set": {"status": "failed", "error": str(e), "updatedAt": datetime.utcnow()}, **NEW_REVISION})
+        scan_written(scan_id)
+        if scan_data:
+            update_rollups({**scan_data, "status": "failed"})
+    finally:
+        scan_eta.job_finished(scan_id)
 
 # Endpoint: Upload MRI scan
 @app.post("/api/scans/upload")
 async def upload_scan(
-    background_tasks: BackgroundTasks,
+    request: Request,
     file: UploadFile = File(...),
     metadata: str = Form(...)
 ):
@@ -166,20 +542,33 @@ async def upload_scan(
     ext = file.filename.split(".")[-1].lower()
     if ext not in ("jpg", "jpeg", "png", "dcm"):
         raise HTTPException(status_code=400, detail="Invalid file type")
+    # Shed bulk work before accepting the file
+    admit_or_429("bulk")
     scan_id = str(uuid.uuid4())
     # Save file locally
     upload_name = f"{scan_id}_{file.filename}"
     upload_path = os.path.join("uploads", upload_name)
-    contents = await file.read()
-    with open(upload_path, "wb") as f:
-        f.write(contents)
+    with time_stage("upload_write"):
+        contents = await file.read()
+        with open(upload_path, "wb") as f:
+            f.write(contents)
     # Parse metadata JSON
     try:
         meta_obj = json.loads(metadata)
     except:
         raise HTTPException(status_code=400, detail="Invalid metadata JSON")
+    user_id = await run_in_threadpool(request_user, request)
+    return create_json_response(await run_in_threadpool(queue_scan, scan_id, upload_name, meta_obj, user_id))
+
+def queue_scan(scan_id, upload_name, meta_obj, user_id=None):
+    """
+    Records an uploaded file as a new scan and queues its processing on the
+    bulk inference lane; the whole job runs on a scheduler worker, so no
+    request thread waits for it
+    """
     now = datetime.utcnow()
-    est_complete = now + timedelta(minutes=5)
+    scan_eta.job_queued(scan_id)
+    est_complete = now + timedelta(seconds=scan_eta.remaining("queued", job_id=scan_id))
     scans_collection.insert_one({
         "_id": scan_id,
         "created_at": now,
@@ -187,17 +576,157 @@ async def upload_scan(
         "stage": "queued",
         "progress": 0,
         "metadata": meta_obj,
+        "userId": user_id,
+        "doctor": meta_obj.get("doctor") if isinstance(meta_obj, dict) else None,
         "file_url": f"/uploads/{upload_name}",
         "estimated_completion_time": est_complete
     })
-    background_tasks.add_task(process_scan_task, scan_id)
-    return create_json_response({
+    inference_scheduler.submit(lambda: process_scan_task(scan_id), "bulk", user_id, admit=False)
+    return {
         "scanId": scan_id,
         "status": "processing",
         "createdAt": now.isoformat() + "Z",
         "estimatedCompletionTime": est_complete.isoformat() + "Z"
+    }
+
+# Resumable uploads: create a session, PATCH chunks at offsets, then complete it
+def upload_error_response(error):
+    headers = {"Cache-Control": "no-store"}
+    if error.offset is not None:
+        headers["Upload-Offset"] = str(error.offset)
+    return JSONResponse(
+        content={"detail": error.detail, "offset": error.offset},
+        status_code=error.status_code,
+        headers=headers
+    )
+
+def upload_session_response(session, status_code=200):
+    return JSONResponse(
+        content={
+            "uploadId": session["_id"],
+            "filename": session["filename"],
+            "offset": session["offset"],
+            "size": session["size"],
+            "chunkSize": resumable.RECOMMENDED_CHUNK_SIZE,
+            "expiresAt": session["expires_at"].isoformat() + "Z"
+        },
+        status_code=status_code,
+        headers={
+            "Location": f"/api/uploads/{session['_id']}",
+            "Upload-Offset": str(session["offset"]),
+            "Upload-Length": str(session["size"]),
+            "Cache-Control": "no-store"
+        }
+    )
+
+# Endpoint: Start a resumable upload
+@app.post("/api/uploads")
+def create_upload(params: dict, request: Request):
+    filename = str(params.get("filename") or "")
+    if filename.split(".")[-1].lower() not in ("jpg", "jpeg", "png", "dcm"):
+        raise HTTPException(status_code=400, detail="Invalid file type")
+    # Admission is checked before the client sends any bytes, never at completion
+    admit_or_429("bulk")
+    try:
+        size = int(params.get("size"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="size must be the file size in bytes")
+    metadata = params.get("metadata") or {}
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid metadata JSON")
+    try:
+        session = resumable.create_session(
+            upload_sessions_collection, filename, size, metadata, params.get("checksum"), user_id=request_user(request)
+        )
+    except resumable.UploadError as e:
+        return upload_error_response(e)
+    return upload_session_response(session, status_code=201)
+
+# Endpoint: Where to resume an upload
+@app.get("/api/uploads/{upload_id}")
+def get_upload(upload_id: str):
+    try:
+        return upload_session_response(resumable.get_session(upload_sessions_collection, upload_id))
+    except resumable.UploadError as e:
+        return upload_error_response(e)
+
+@app.head("/api/uploads/{upload_id}")
+def head_upload(upload_id: str):
+    try:
+        session = resumable.get_session(upload_sessions_collection, upload_id)
+    except resumable.UploadError as e:
+        return Response(status_code=e.status_code, headers={"Cache-Control": "no-store"})
+    return Response(headers={
+        "Upload-Offset": str(session["offset"]),
+        "Upload-Length": str(session["size"]),
+        "Cache-Control": "no-store"
     })
 
+# Endpoint: Send one chunk; needs Upload-Offset and Upload-Checksum headers
+@app.patch("/api/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request):
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Offset header is required")
+    checksum = request.headers.get("Upload-Checksum")
+    if not checksum:
+        raise HTTPException(status_code=400, detail="Upload-Checksum header is required")
+    try:
+        with time_stage("upload_chunk"):
+            new_offset = await resumable.write_chunk(
+                upload_sessions_collection, upload_id, offset, checksum, request.stream()
+            )
+    except resumable.UploadError as e:
+        return upload_error_response(e)
+    return Response(status_code=204, headers={"Upload-Offset": str(new_offset), "Cache-Control": "no-store"})
+
+# Endpoint: Turn a fully received upload into a scan
+@app.post("/api/uploads/{upload_id}/complete")
+def complete_upload(upload_id: str):
+    scan_id = str(uuid.uuid4())
+    try:
+        session = resumable.get_session(upload_sessions_collection, upload_id)
+        upload_name = f"{scan_id}_{session['filename']}"
+        resumable.finalize_session(upload_sessions_collection, upload_id, os.path.join("uploads", upload_name))
+    except resumable.UploadError as e:
+        return upload_error_response(e)
+    return create_json_response(
+        queue_scan(scan_id, upload_name, session["metadata"], session.get("userId"))
+    )
+
+# Endpoint: Abandon an upload
+@app.delete("/api/uploads/{upload_id}")
+def delete_upload(upload_id: str):
+    resumable.abort_session(upload_sessions_collection, upload_id)
+    return Response(status_code=204)
+
+# Garbage-collect abandoned upload sessions in the background
+upload_gc_stop = threading.Event()
+
+def collect_upload_sessions(interval=900):
+    while True:
+        try:
+            removed = resumable.collect_expired_sessions(upload_sessions_collection)
+            if removed:
+                print(f"Removed {removed} expired upload sessions")
+        except Exception as e:
+            print(f"Error collecting upload sessions: {e}")
+        if upload_gc_stop.wait(interval):
+            return
+
+@app.on_event("startup")
+def start_upload_gc():
+    upload_sessions_collection.create_index("expires_at")
+    threading.Thread(target=collect_upload_sessions, name="upload-gc", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_upload_gc():
+    upload_gc_stop.set()
+
 # Endpoint: List scans
 @app.get("/api/scans")
 def list_scans(
@@ -211,7 +740,7 @@ def list_scans(
         query["status"] = status
     total = scans_collection.count_documents(query)
     total_pages = (total + limit - 1) // limit
-    cursor = scans_collection.find(query).sort("created_at", -1).skip((page-1)*limit).limit(limit)
+    cursor = scans_collection.find(query, {"embedding": 0}).sort("created_at", -1).skip((page-1)*limit).limit(limit)
     scans = []
     for doc in cursor:
         scans.append({
@@ -225,14 +754,95 @@ def list_scans(
         })
     return create_json_response({"scans": scans, "total": total, "page": page, "totalPages": total_pages})
 
+@app.on_event("startup")
+def create_export_indexes():
+    export.ensure_indexes(scans_collection)
+    search.ensure_indexes(scans_collection)
+
+# Endpoint: Search scans by class, location, doctor, date and size
+@app.get("/api/scans/search")
+def search_scans(
+    classLabel: Optional[str] = None,
+    location: Optional[str] = None,
+    doctor: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    minSizeMm: Optional[float] = None,
+    maxSizeMm: Optional[float] = None,
+    page: int = 1,
+    limit: int = 10
+):
+    page, limit = max(1, page), max(1, min(limit, 100))
+    try:
+        start_time, end_time = export.parse_time(start), export.parse_time(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be ISO 8601")
+    query, index = search.build_query(classLabel, location, doctor, start_time, end_time, minSizeMm, maxSizeMm)
+
+    # Ids and total come from the index alone; only this page's documents are read
+    ids, total = search.search_ids(scans_collection, query, index, (page - 1) * limit, limit)
+    scans = []
+    for doc in search.fetch_page(scans_collection, ids, {"embedding": 0}):
+        scans.append({
+            "id": doc["_id"],
+            "date": doc["created_at"].isoformat() + "Z",
+            "status": doc["status"],
+            "tumorDetected": doc.get("tumorDetected"),
+            "classLabel": doc.get("classLabel"),
+            "location": doc.get("location"),
+            "size": doc.get("size"),
+            "sizeMm": doc.get("sizeMm"),
+            "doctor": doc.get("doctor"),
+            "thumbnailUrl": doc.get("thumbnailUrl")
+        })
+    return create_json_response({"scans": scans, "total": total, "page": page, "totalPages": (total + limit - 1) // limit})
+
+# Endpoint: Bulk export of scan records
+@app.get("/api/scans/export")
+def export_scans(
+    format: str = "ndjson",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None,
+    classLabel: Optional[str] = None,
+    since: Optional[str] = None,
+    incremental: bool = False,
+):
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    # An incremental export covers [since, watermark); pass the watermark as since next time
+    until = export.next_watermark() if incremental or since else None
+    try:
+        query = export.build_query(start, end, status, classLabel, since, until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be ISO 8601")
+
+    headers = {"Content-Disposition": f'attachment; filename="scans.{format}"'}
+    if until:
+        headers["X-Export-Watermark"] = until.isoformat() + "Z"
+    return StreamingResponse(
+        export.stream_export(scans_collection, format, query),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
 # Endpoint: Get scan details
 @app.get("/api/scans/{scan_id}")
-def get_scan_details(scan_id: str):
+def get_scan_details(scan_id: str, request: Request):
+    # Completed scans are served from the response cache
     # no authentication: fetch by id only
-    doc = scans_collection.find_one({"_id": scan_id})
+    key = f"scan:{scan_id}"
+    stamp = scans_collection.find_one({"_id": scan_id}, {"rev": 1})
+    if not stamp:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    cached = detail_cache.get(key, stamp.get("rev"))
+    if cached:
+        return response_cache.respond(request, *cached)
+
+    doc = scans_collection.find_one({"_id": scan_id}, {"embedding": 0})
     if not doc:
         raise HTTPException(status_code=404, detail="Scan not found")
-    return create_json_response({
+    body, etag = response_cache.render({
         "id": doc["_id"],
         "date": doc["created_at"].isoformat() + "Z",
         "status": doc["status"],
@@ -240,42 +850,99 @@ def get_scan_details(scan_id: str):
         "location": doc.get("location"),
         "size": doc.get("size"),
         "notes": doc.get("notes"),
+        "extent": doc.get("extent"),
+        "tumorCoordinates": doc.get("tumorCoordinates"),
         "visualizationUrl": f"/api/visualizations/{doc.get('visualizationId') or 'default'}",
         "originalImageUrl": doc.get("file_url"),
         "heatmapUrl": doc.get("heatmapUrl"),  # Include the heatmap URL
+        "classHeatmapUrls": doc.get("classHeatmapUrls"),
+        "classProbabilities": doc.get("classProbabilities"),
+        "modelVersion": doc.get("modelVersion"),
         "doctor": doc.get("doctor"),
         "createdAt": doc["created_at"].isoformat() + "Z",
         "updatedAt": doc.get("updatedAt") and doc.get("updatedAt").isoformat() + "Z"
     })
+    if doc["status"] == "completed":
+        detail_cache.put(key, body, etag, doc.get("rev"))
+    return response_cache.respond(request, body, etag)
+
+# Endpoint: Similar prior scans
+@app.get("/api/scans/{scan_id}/similar")
+def get_similar_scans(scan_id: str, k: int = 5):
+    # no authentication: fetch by id only
+    vector = embedding_index.get(scan_id)
+    if vector is None:
+        doc = scans_collection.find_one({"_id": scan_id}, {"embedding": 1})
+        if not doc:
+            raise HTTPException(status_code=404, detail="Scan not found")
+        if not doc.get("embedding"):
+            raise HTTPException(status_code=409, detail="Scan has no embedding yet")
+        vector = doc["embedding"]
+
+    matches = embedding_index.search(vector, k=max(1, min(k, 50)), exclude=scan_id)
+    docs = {doc["_id"]: doc for doc in scans_collection.find({"_id": {"$in": [m[0] for m in matches]}}, {"embedding": 0})}
+    similar = []
+    for match_id, score in matches:
+        doc = docs.get(match_id)
+        if not doc:
+            continue
+        similar.append({
+            "id": doc["_id"],
+            "similarity": score,
+            "date": doc["created_at"].isoformat() + "Z",
+            "tumorDetected": doc.get("tumorDetected"),
+            "location": doc.get("location"),
+            "size": doc.get("size"),
+            "thumbnailUrl": doc.get("thumbnailUrl")
+        })
+    return create_json_response({"id": scan_id, "similar": similar})
 
 # Endpoint: Check scan status
 @app.get("/api/scans/{scan_id}/status")
 def check_scan_status(scan_id: str):
     # no authentication: fetch by id only
-    doc = scans_collection.find_one({"_id": scan_id})
+    doc = scans_collection.find_one({"_id": scan_id}, {"embedding": 0})
     if not doc:
         raise HTTPException(status_code=404, detail="Scan not found")
-    now = datetime.utcnow()
-    est_remain = int((doc["estimated_completion_time"] - now).total_seconds()) if doc.get("estimated_completion_time") else None
+    est_remain = 0
+    if doc["status"] == "processing":
+        stage = doc.get("stage")
+        stage_started_at = doc.get("stage_started_at") or doc["created_at"]
+        stage_elapsed = (datetime.utcnow() - stage_started_at).total_seconds()
+        est_remain = math.ceil(scan_eta.remaining(stage, stage_elapsed, job_id=scan_id))
     return create_json_response({
         "id": doc["_id"],
         "status": doc["status"],
         "progress": doc.get("progress"),
         "stage": doc.get("stage"),
-        "estimatedTimeRemaining": est_remain
+        "estimatedTimeRemaining": est_remain,
+        # Clients can poll rarely while the ETA is far away
+        "pollIntervalMs": int(poll_interval(est_remain) * 1000) if doc["status"] == "processing" else None
     })
 
 # Background task: generate 3D visualization
 def generate_visualization_task(viz_id: str, scan_id: str, params: dict):
-    import time
-    for step in range(1, 4):
-        visualizations_collection.update_one({"_id": viz_id}, {"$set": {"status": "processing", "progress": step * 30}})
-        time.sleep(1)
-    html_content = f"<html><body><h1>3D Visualization for {scan_id}</h1></body></html>"
-    html_path = os.path.join("visualizations_html", f"{viz_id}.html")
-    with open(html_path, "w") as f:
-        f.write(html_content)
-    visualizations_collection.update_one({"_id": viz_id}, {"$set": {"status": "completed", "updated_at": datetime.utcnow()}})
+    visualization_eta.job_started(viz_id)
+    try:
+        started = time.monotonic()
+        for step in range(1, 4):
+            visualizations_collection.update_one({"_id": viz_id}, {"$set": {"status": "processing", "progress": step * 30}, **NEW_REVISION})
+            visualization_written(viz_id)
+            time.sleep(1)
+        html_content = f"<html><body><h1>3D Visualization for {scan_id}</h1></body></html>"
+        html_path = os.path.join("visualizations_html", f"{viz_id}.html")
+        with open(html_path, "w") as f:
+            f.write(html_content)
+        stage_durations = {"rendering": time.monotonic() - started}
+        visualization_eta.observe_job(stage_durations)
+        visualizations_collection.update_one({"_id": viz_id}, {"$set": {
+            "status": "completed",
+            "stage_durations": stage_durations,
+            "updated_at": datetime.utcnow()
+        }, **NEW_REVISION})
+        visualization_written(viz_id)
+    finally:
+        visualization_eta.job_finished(viz_id)
 
 # Endpoint: Generate 3D model
 @app.post("/api/scans/{scan_id}/visualize")
@@ -289,7 +956,8 @@ def generate_visualization(
         raise HTTPException(status_code=404, detail="Scan not found")
     viz_id = str(uuid.uuid4())
     now = datetime.utcnow()
-    est_complete = now + timedelta(minutes=5)
+    visualization_eta.job_queued(viz_id)
+    est_complete = now + timedelta(seconds=visualization_eta.remaining("queued", job_id=viz_id))
     visualizations_collection.insert_one({
         "_id": viz_id,
         "scan_id": scan_id,
@@ -298,7 +966,8 @@ def generate_visualization(
         "params": params,
         "estimated_completion_time": est_complete
     })
-    scans_collection.update_one({"_id": scan_id}, {"$set": {"visualizationId": viz_id}})
+    scans_collection.update_one({"_id": scan_id}, {"$set": {"visualizationId": viz_id}, **NEW_REVISION})
+    scan_written(scan_id)
     background_tasks.add_task(generate_visualization_task, viz_id, scan_id, params)
     return create_json_response({
         "visualizationId": viz_id,
@@ -316,6 +985,34 @@ def get_visualization(viz_id: str):
         raise HTTPException(status_code=404, detail="Visualization file not found")
     return FileResponse(html_path, media_type="text/html")
 
+# Endpoint: Visualization metadata
+@app.get("/api/visualizations/{viz_id}/metadata")
+def get_visualization_metadata(viz_id: str, request: Request):
+    key = f"visualization:{viz_id}"
+    stamp = visualizations_collection.find_one({"_id": viz_id}, {"rev": 1})
+    if not stamp:
+        raise HTTPException(status_code=404, detail="Visualization not found")
+    cached = detail_cache.get(key, stamp.get("rev"))
+    if cached:
+        return response_cache.respond(request, *cached)
+
+    doc = visualizations_collection.find_one({"_id": viz_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Visualization not found")
+    body, etag = response_cache.render({
+        "id": doc["_id"],
+        "scanId": doc["scan_id"],
+        "status": doc["status"],
+        "progress": 100 if doc["status"] == "completed" else doc.get("progress", 0),
+        "params": doc.get("params") or {},
+        "createdAt": doc["created_at"].isoformat() + "Z",
+        "updatedAt": doc.get("updated_at") and doc["updated_at"].isoformat() + "Z",
+        "url": f"/api/visualizations/{doc['_id']}",
+    })
+    if doc["status"] == "completed":
+        detail_cache.put(key, body, etag, doc.get("rev"))
+    return response_cache.respond(request, body, etag)
+
 # Endpoint: User dashboard stats
 @app.get("/api/users/stats")
 def get_user_stats():
@@ -326,7 +1023,7 @@ def get_user_stats():
     tumor_detected = scans_collection.count_documents({"tumorDetected": True})
     
     # Get recent scans
-    recent_cursor = scans_collection.find({}).sort("created_at", -1).limit(5)
+    recent_cursor = scans_collection.find({}, {"embedding": 0}).sort("created_at", -1).limit(5)
     recent_scans = []
     for doc in recent_cursor:
         recent_scans.append({
@@ -345,19 +1042,78 @@ def get_user_stats():
         "recentScans": recent_scans
     })
 
+def as_naive_utc(value):
+    """
+    Naive UTC datetime, as stored in Mongo; offsets are converted, not dropped
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+# Endpoint: Scan trends, read from the rollup collections only
+@app.get("/api/stats/timeseries")
+def get_stats_timeseries(
+    interval: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(INTERVALS)}")
+    end = as_naive_utc(end or datetime.utcnow())
+    start = as_naive_utc(start or end - timedelta(days=30))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    # Hourly points are capped at about a month, everything else at ten years
+    max_span = timedelta(days=31) if interval == "hour" else timedelta(days=3660)
+    if end - start > max_span:
+        raise HTTPException(status_code=400, detail="Range too large for this interval")
+    points = timeseries(scan_rollups_hourly, scan_rollups_daily, interval, start, end)
+    return create_json_response({
+        "interval": interval,
+        "start": start.isoformat() + "Z",
+        "end": end.isoformat() + "Z",
+        "points": points
+    })
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Add health check endpoint
 @app.get("/api/health")
 def health_check():
     return create_json_response({"status": "ok", "version": "2.0.0"})
 
+# Liveness: the process is up and serving, even while the model warms up
+@app.get("/api/health/live")
+def liveness_check():
+    return create_json_response({"status": "ok"})
+
+# Readiness: only route traffic here once the model is loaded and warmed up
+@app.get("/api/health/ready")
+def readiness_check():
+    model_state = {
+        "ready": inference.state["ready"],
+        "warmingUp": inference.state["warming_up"],
+        "error": inference.state["error"],
+        "warmupSeconds": inference.state["warmup_seconds"],
+    }
+    if not inference.is_ready():
+        return create_json_response({"status": "not_ready", "model": model_state}, status_code=503)
+    return create_json_response({"status": "ready", "model": model_state})
+
 # Endpoint to generate a heatmap for an MRI scan
 @app.post("/api/mri/heatmap")
 async def mri_heatmap(
+    request: Request,
     file: UploadFile = File(...)
 ):
     # Validate file extension
     if not file.filename.lower().endswith((".jpg", ".jpeg", ".png", ".dcm")):
         raise HTTPException(status_code=400, detail="Invalid file type")
+    admit_or_429("interactive")
     
     # Save uploaded file
     file_id = str(uuid.uuid4())
@@ -366,16 +1122,35 @@ async def mri_heatmap(
     with open(input_path, "wb") as f:
         f.write(await file.read())
     
-    # Generate heatmap using GradCam
-    try:
+    # Generate heatmap using GradCam, in the interactive lane
+    heatmap_path = f"heatmaps/{file_id}_heatmap.jpg"
+
+    def render_heatmap():
         # Use the GradCam functionality to generate the heatmap
-        heatmap_path = f"heatmaps/{file_id}_heatmap.jpg"
-        overlay = get_cam_overlay(input_path)
-        cv2.imwrite(heatmap_path, overlay)
-        
+        analysis = inference.analyze_scan(input_path, all_classes=False)
+        with time_stage("encode"):
+            import cv2
+            cv2.imwrite(heatmap_path, analysis["overlay"])
+        located = None
+        if analysis.get("cam") is not None:
+            located = localization.localize(analysis["cam"], analysis.get("source_shape"),
+                                            predicted_class=analysis["predicted_class"])
+        return analysis.get("model_version"), located
+
+    try:
+        # Verifying the token may fetch keys, so it stays off the event loop
+        user_id = await run_in_threadpool(request_user, request)
+        model_version, located = await asyncio.wrap_future(
+            inference_scheduler.submit(render_heatmap, "interactive", user_id, admit=False)
+        )
         return create_json_response({
             "heatmapUrl": f"/heatmaps/{file_id}_heatmap.jpg",
-            "originalUrl": f"/uploads/{file_id}_input.jpg"
+            "originalUrl": f"/uploads/{file_id}_input.jpg",
+            "modelVersion": model_version,
+            "location": located["location"] if located else None,
+            "size": located["size"] if located else None,
+            "extent": located["extent"] if located else None,
+            "tumorCoordinates": located["tumorCoordinates"] if located else None
         })
     except Exception as e:
         print(f"Error generating heatmap: {e}")
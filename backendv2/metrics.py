@@ -0,0 +1,213 @@
+"""
+Prometheus metrics for the API and the scan pipeline.
+
+Request latency is recorded by a plain ASGI middleware and labelled with
+the route template (/api/scans/{scan_id}) rather than the raw path, so the
+number of series stays bounded. Pipeline stages, Mongo commands, the
+background job queue and the caches each get their own series. Cache
+statistics are read from their owners at scrape time, so keeping them
+costs nothing on the request path.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+
+# Request latencies run from a few ms (status polls) to seconds (uploads)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Pipeline stages and Mongo commands, down to sub-millisecond
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "neurosphere_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=REQUEST_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "neurosphere_http_requests_in_progress",
+    "HTTP requests currently being served",
+)
+STAGE_LATENCY = Histogram(
+    "neurosphere_stage_duration_seconds",
+    "Duration of upload and inference pipeline stages",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+MONGO_LATENCY = Histogram(
+    "neurosphere_mongo_command_duration_seconds",
+    "MongoDB command latency",
+    ["command", "collection"],
+    buckets=STAGE_BUCKETS,
+)
+MONGO_FAILURES = Counter(
+    "neurosphere_mongo_command_failures_total",
+    "Failed MongoDB commands",
+    ["command", "collection"],
+)
+JOBS_QUEUED = Gauge(
+    "neurosphere_jobs_queued",
+    "Scan jobs accepted but not started",
+)
+JOBS_IN_FLIGHT = Gauge(
+    "neurosphere_jobs_in_flight",
+    "Scan jobs currently running",
+)
+JOBS_FINISHED = Counter(
+    "neurosphere_jobs_finished_total",
+    "Scan jobs finished, by result",
+    ["result"],
+)
+SCHEDULER_WAIT = Histogram(
+    "neurosphere_inference_queue_wait_seconds",
+    "Time inference jobs wait in the scheduler, by lane",
+    ["lane"],
+    buckets=STAGE_BUCKETS,
+)
+PREDICTIONS = Counter(
+    "neurosphere_predictions_total",
+    "Model predictions by class",
+    ["predicted_class"],
+)
+
+
+@contextmanager
+def time_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+
+def observe_stages(timings):
+    """
+    Records a dict of stage name -> seconds, as filled in by analyze_scan
+    """
+    for stage, seconds in timings.items():
+        STAGE_LATENCY.labels(stage).observe(seconds)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency per (method, route template, status)
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route_path(self, scope):
+        # Newer Starlette puts the matched route in the scope; older versions
+        # only the endpoint, which we map back to its route once
+        route = scope.get("route")
+        if route is not None:
+            return getattr(route, "path", "unmatched")
+        if self._route_paths is None:
+            self._route_paths = {}
+            for route in scope["app"].routes:
+                endpoint = getattr(route, "endpoint", None) or getattr(route, "app", None)
+                if endpoint is not None:
+                    self._route_paths[endpoint] = route.path
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_LATENCY.labels(scope["method"], self._route_path(scope), str(status_code)).observe(
+                time.perf_counter() - start
+            )
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    Times every MongoDB command; register with MongoClient(event_listeners=[...])
+    """
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._started[event.request_id] = (time.perf_counter(), collection)
+
+    def _finish(self, event):
+        with self._lock:
+            started = self._started.pop(event.request_id, None)
+        if started is None:
+            return None
+        return started[1]
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        if collection is not None:
+            MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        if collection is not None:
+            MONGO_LATENCY.labels(event.command_name, collection).observe(event.duration_micros / 1e6)
+            MONGO_FAILURES.labels(event.command_name, collection).inc()
+
+
+class StatsCollector:
+    """
+    Exposes counters and gauges kept by other objects, read at scrape time.
+    Each source is a callable returning a dict of name -> value; names
+    ending in _total become counters, everything else a gauge.
+    """
+
+    def __init__(self):
+        self._sources = {}
+
+    def add_source(self, prefix, read_stats):
+        self._sources[prefix] = read_stats
+
+    def collect(self):
+        for prefix, read_stats in list(self._sources.items()):
+            try:
+                stats = read_stats()
+            except Exception as e:
+                print(f"Error reading {prefix} stats: {e}")
+                continue
+            for name, value in stats.items():
+                full_name = f"neurosphere_{prefix}_{name}"
+                if name.endswith("_total"):
+                    yield CounterMetricFamily(full_name[:-len("_total")], f"{prefix} {name}", value=value)
+                else:
+                    yield GaugeMetricFamily(full_name, f"{prefix} {name}", value=value)
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def render_metrics():
+    """
+    Current metrics in the Prometheus text format, with its content type
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,22 +1,50 @@
 import torch
 import torch.nn as nn
-from torchvision import transforms, models
-from PIL import Image
+from torchvision import models
 import numpy as np
 import cv2
+from PIL import Image
+import functools
 import os
+import threading
+import time
 
 import torch.nn.functional as F
 
+from ml.registry import ModelRegistry
+
 # Get the directory of this file
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Class index to label, as in mlclassifier/model.ipynb
+class_names = ['notumor', 'glioma', 'meningioma', 'pituitary']
+
+# The checkpoint served until another one is deployed
+MODEL_PATH = os.getenv("MODEL_PATH", os.path.join(CURRENT_DIR, 'resnet18_finetuned.pth'))
+
+# Content-addressed copies of every loaded checkpoint, shared by the worker processes
+MODEL_SNAPSHOT_DIR = os.getenv("MODEL_SNAPSHOT_DIR", os.path.join(CURRENT_DIR, 'snapshots'))
+
+# ImageNet statistics the classifier was trained with. x / 255 followed by
+# (x - mean) / std is folded into one multiply-add per channel.
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+_input_scale = 1.0 / (255.0 * IMAGENET_STD)
+_input_bias = -IMAGENET_MEAN / IMAGENET_STD
+
+# Heatmap weight in the overlay; the scan gets the rest
+OVERLAY_ALPHA = float(os.getenv("HEATMAP_ALPHA", "0.5"))
+
+# Per-thread scratch arrays, reused from one image to the next
+_buffers = threading.local()
+
 class GradCAM:
     def __init__(self, model, target_layer):
         self.model = model
         self.target_layer = target_layer
         self.gradients = None
         self.activations = None
+        self.handles = []
         self.hook_layers()
 
     def hook_layers(self):
@@ -26,54 +54,199 @@ class GradCAM:
         def backward_hook(module, grad_in, grad_out):
             self.gradients = grad_out[0]
 
-        self.target_layer.register_forward_hook(forward_hook)
-        self.target_layer.register_backward_hook(backward_hook)
+        self.handles.append(self.target_layer.register_forward_hook(forward_hook))
+        self.handles.append(self.target_layer.register_backward_hook(backward_hook))
 
-    def generate_cam(self, input_tensor, class_idx=None):
+    def remove_hooks(self):
+        for handle in self.handles:
+            handle.remove()
+        self.handles = []
+
+    def generate_cam(self, input_tensor, class_idx=None, timings=None):
         self.model.eval()
+        start = time.perf_counter()
+        # The weights are frozen (and may be a read-only mapping), so the
+        # graph is rooted at the input instead
+        input_tensor = input_tensor.detach().requires_grad_()
         output = self.model(input_tensor)
 
         if class_idx is None:
             class_idx = torch.argmax(output, dim=1).item()
+        record_timing(timings, "cam_forward", start)
 
+        start = time.perf_counter()
         self.model.zero_grad()
         class_score = output[:, class_idx]
         class_score.backward()
 
         gradients = self.gradients.detach().cpu().numpy()
         activations = self.activations.detach().cpu().numpy()
+        record_timing(timings, "backward", start)
+        return cam_from_gradients(gradients[0], activations[0], (input_tensor.shape[2], input_tensor.shape[3]))
 
-        weights = np.mean(gradients, axis=(2, 3))
-        cam = np.zeros(activations.shape[2:], dtype=np.float32)
+    def generate_all_cams(self, input_tensor, timings=None):
+        """
+        Grad-CAM maps for every class of one image from a single forward and
+        a single batched backward pass. Returns a (classes, H, W) array of
+        maps in [0, 1] and the class probabilities.
+        """
+        self.model.eval()
+        start = time.perf_counter()
+        input_tensor = input_tensor.detach().requires_grad_()
+        output = self.model(input_tensor)
+        activations = self.activations
+        record_timing(timings, "cam_forward", start)
+
+        start = time.perf_counter()
+        num_classes = output.shape[1]
+        # One one-hot row per class: autograd vmaps the vector-Jacobian
+        # product over the rows, giving d(score_c)/d(activations) for every c at once
+        one_hot = torch.eye(num_classes, device=output.device, dtype=output.dtype).unsqueeze(1)
+        try:
+            gradients = torch.autograd.grad(output, activations, grad_outputs=one_hot, is_grads_batched=True)[0]
+        except RuntimeError:
+            # Some backends lack batching rules for an op; fall back to one pass per class
+            gradients = torch.stack([
+                torch.autograd.grad(output[:, c].sum(), activations, retain_graph=c < num_classes - 1)[0]
+                for c in range(num_classes)
+            ])
+        gradients = gradients[:, 0].detach().cpu().numpy()
+        activations = activations[0].detach().cpu().numpy()
+        probabilities = torch.softmax(output.detach(), dim=1)[0].cpu().numpy()
+        record_timing(timings, "backward", start)
+        return cams_from_gradients(gradients, activations, (input_tensor.shape[2], input_tensor.shape[3])), probabilities
+
+def record_timing(timings, stage, start):
+    """
+    Adds the time since start to timings[stage], if timings were requested
+    """
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def cam_from_gradients(gradients, activations, size):
+    """
+    Grad-CAM map for one image from (C, h, w) gradients and activations,
+    resized to size and scaled to [0, 1]
+    """
+    weights = np.mean(gradients, axis=(1, 2))
+    cam = np.zeros(activations.shape[1:], dtype=np.float32)
+
+    for i, w in enumerate(weights):
+        cam += w * activations[i, :, :]
 
-        for i, w in enumerate(weights[0]):
-            cam += w * activations[0, i, :, :]
+    cam = np.maximum(cam, 0)
+    cam = cv2.resize(cam, size)
+    cam = cam - np.min(cam)
+    cam = cam / np.max(cam)
+    return cam
 
-        cam = np.maximum(cam, 0)
-        cam = cv2.resize(cam, (input_tensor.shape[2], input_tensor.shape[3]))
+def cams_from_gradients(gradients, activations, size):
+    """
+    Grad-CAM maps for several classes at once from (classes, C, h, w)
+    gradients and the shared (C, h, w) activations; returns (classes, H, W)
+    """
+    weights = gradients.mean(axis=(2, 3))
+    cams = np.maximum(np.einsum("kc,chw->khw", weights, activations), 0).astype(np.float32)
+
+    resized = np.empty((len(cams), size[1], size[0]), dtype=np.float32)
+    for k, cam in enumerate(cams):
+        cam = cv2.resize(cam, size)
         cam = cam - np.min(cam)
-        cam = cam / np.max(cam)
-        return cam
+        peak = np.max(cam)
+        # A class with no positive evidence gets an all-zero map
+        resized[k] = cam / peak if peak > 0 else cam
+    return resized
+
+def scratch(name, shape, dtype):
+    """
+    A per-thread array of the given shape, reused across calls. The next
+    call from the same thread overwrites it, so copy anything kept longer.
+    """
+    arrays = getattr(_buffers, "arrays", None)
+    if arrays is None:
+        arrays = _buffers.arrays = {}
+    array = arrays.get(name)
+    if array is None or array.shape != shape or array.dtype != dtype:
+        array = arrays[name] = np.empty(shape, dtype=dtype)
+    return array
+
+def decode_image(image_path):
+    """
+    Decodes an image as BGR uint8 at its own size
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Could not read image {image_path}")
+    return image
+
+def load_image(image_path, size=(224, 224)):
+    """
+    Decodes an image as BGR uint8 and resizes it to size (width, height)
+    into a per-thread buffer
+    """
+    return resize_image(decode_image(image_path), size)
+
+def resize_image(image, size):
+    """
+    image resized to size (width, height) in a per-thread buffer
+    """
+    # The same PIL bilinear resize as training (mlclassifier/packed_dataset.decode_image);
+    # cv2's area/linear filters shift pixels by up to ~0.4 std. Channels are resized
+    # independently, so BGR order doesn't matter.
+    resized = scratch("resized", (size[1], size[0], 3), np.uint8)
+    np.copyto(resized, np.asarray(Image.fromarray(image).resize(size, Image.BILINEAR)))
+    return resized
+
+def preprocess_array(image):
+    """
+    Model input (1, 3, H, W) float32 from a BGR uint8 image, written into a
+    per-thread buffer. BGR->RGB, HWC->CHW, /255 and normalization happen in
+    a single pass over each channel.
+    """
+    height, width = image.shape[:2]
+    batch = scratch("input", (1, 3, height, width), np.float32)
+    for c in range(3):
+        # RGB channel c is BGR channel 2 - c
+        np.multiply(image[:, :, 2 - c], _input_scale[c], out=batch[0, c])
+        batch[0, c] += _input_bias[c]
+    return batch
 
 def preprocess_image(image_path, input_size):
-    transform = transforms.Compose([
-        transforms.Resize(input_size),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
-    image = Image.open(image_path).convert('RGB')
-    return transform(image).unsqueeze(0)
-
-def overlay_cam_on_image(image, cam, alpha=0.5):
-    heatmap = cv2.applyColorMap(np.uint8(255 * cam), cv2.COLORMAP_JET)
-    heatmap = np.float32(heatmap) / 255
-    overlay = heatmap + np.float32(image)
-    overlay = overlay / np.max(overlay)
-    return np.uint8(255 * overlay)
+    """
+    Model input tensor for an image file. On CPU it shares the per-thread
+    buffer, so use it before preprocessing the next image.
+    """
+    return torch.from_numpy(preprocess_array(load_image(image_path, input_size)))
 
-def get_cam_overlay(image_path):
-    # Load trained brain tumor model
-    model = models.resnet18(pretrained=True)
+@functools.lru_cache(maxsize=16)
+def overlay_luts(alpha):
+    """
+    The JET colormap pre-multiplied by alpha, and the intensity table for (1 - alpha)
+    """
+    ramp = np.arange(256, dtype=np.uint8).reshape(256, 1)
+    heat_lut = np.round(cv2.applyColorMap(ramp, cv2.COLORMAP_JET) * alpha).astype(np.uint8)
+    image_lut = np.round(np.arange(256) * (1 - alpha)).astype(np.uint8)
+    return heat_lut, image_lut
+
+def overlay_cam_on_image(image, cam, alpha=OVERLAY_ALPHA):
+    """
+    Blends a [0, 1] CAM, coloured with JET, over a BGR uint8 image:
+    alpha * heatmap + (1 - alpha) * image. Every step is a uint8 table
+    lookup or saturating add; only the returned overlay is allocated.
+    """
+    heat_lut, image_lut = overlay_luts(float(alpha))
+    cam_u8 = scratch("cam_u8", cam.shape, np.uint8)
+    cv2.convertScaleAbs(cam, dst=cam_u8, alpha=255)
+    heat = scratch("heat", image.shape, np.uint8)
+    cv2.applyColorMap(cam_u8, heat_lut, dst=heat)
+    overlay = cv2.LUT(image, image_lut)
+    cv2.add(overlay, heat, dst=overlay)
+    return overlay
+
+def load_model(device, model_path=MODEL_PATH):
+    # Load trained brain tumor model; every weight comes from the checkpoint,
+    # so there is no need to fetch the ImageNet weights first
+    model = models.resnet18()
     num_ftrs = model.fc.in_features
     model.fc = nn.Sequential(
         nn.Linear(num_ftrs, 512),  
@@ -81,53 +254,152 @@ def get_cam_overlay(image_path):
         nn.Dropout(0.5),           
         nn.Linear(512, 4)          
     )
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    
-    # Use absolute path for model loading
-    model_path = os.path.join(CURRENT_DIR, 'resnet18_finetuned.pth')
-    model.load_state_dict(torch.load(model_path, map_location=device))
-    model.to(device)
+
+    if device.type == "cpu" and os.getenv("MODEL_MMAP", "1") != "0":
+        # Map the checkpoint instead of copying it: the weights stay in the page
+        # cache and every worker process maps the same physical pages
+        state_dict = torch.load(model_path, map_location="cpu", mmap=True, weights_only=True)
+        model.load_state_dict(state_dict, assign=True)
+    else:
+        model.load_state_dict(torch.load(model_path, map_location=device))
+        model.to(device)
+    # Inference only: no weight gradients, and nothing ever writes to the weights
+    model.requires_grad_(False)
     model.eval()
+    return model
 
-    # Load the original image for visualization
-    original_image = cv2.imread(image_path)
-    original_image = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
-    original_image = cv2.resize(original_image, (224, 224))
+def get_device():
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-    # Check if tumor actually exists
-    test_transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ])
+def warm_model(model):
+    """
+    Pushes a dummy image through the classifier and Grad-CAM, so the first
+    real scan doesn't pay for lazy initialisation
+    """
+    dummy = torch.zeros(1, 3, 224, 224, device=get_device())
+    with torch.no_grad():
+        model(dummy)
+    grad_cam = GradCAM(model, model.layer4[-1])
+    try:
+        grad_cam.generate_all_cams(dummy)
+    finally:
+        grad_cam.remove_hooks()
 
-    img = Image.open(image_path).convert('RGB')
-    img = test_transform(img).unsqueeze(0).to(device)
+# Loaded model versions, one active; a checkpoint is warmed before it is swapped in
+registry = ModelRegistry(
+    load=lambda path: load_model(get_device(), path),
+    warm=warm_model,
+    default_path=MODEL_PATH,
+    # Versions are mapped from private copies, so overwriting a checkpoint can't touch loaded weights
+    snapshot_dir=MODEL_SNAPSHOT_DIR,
+)
 
-    with torch.no_grad():
-        outputs = model(img)
-        _, predicted = torch.max(outputs, 1)
+def get_model():
+    """
+    The active model, loaded on first call
+    """
+    with registry.use() as entry:
+        return entry["model"]
+
+def warm_up():
+    """
+    Loads and warms the default checkpoint
+    """
+    registry.ensure_loaded()
+
+def analyze_scan(image_path, timings=None, all_classes=True):
+    """
+    Classifies an MRI image and builds its Grad-CAM overlay.
+
+    Returns a dict with the overlay, the predicted class and class
+    probabilities, the 512-d pooled feature vector of the image and
+    the decoded image's (height, width) as source_shape. A positive scan
+    also gets the predicted class's CAM as cam. For a positive scan with all_classes set, it also holds the
+    (classes, H, W) Grad-CAM stack and an overlay per tumor class.
+    If a timings dict is passed, the seconds spent in each stage are
+    added to it. model_version names the checkpoint that produced it.
+    """
+    start = time.perf_counter()
+    # The version active now serves the whole call, even if a new one is swapped in meanwhile
+    with registry.use() as entry:
+        record_timing(timings, "model_load", start)
+        result = run_analysis(entry["model"], entry["lock"], image_path, timings, all_classes)
+    result["model_version"] = entry["version"]
+    return result
+
+def run_analysis(model, model_lock, image_path, timings, all_classes):
+    device = get_device()
+
+    # Decode and resize once: the same pixels feed the model and the overlay
+    start = time.perf_counter()
+    decoded = decode_image(image_path)
+    original_image = resize_image(decoded, (224, 224))
+    img = torch.from_numpy(preprocess_array(original_image)).to(device)
+    record_timing(timings, "decode", start)
+
+    # Keep the pooled features that feed the classifier head
+    pooled = {}
+    start = time.perf_counter()
+    with model_lock:
+        pool_hook = model.avgpool.register_forward_hook(lambda module, input, output: pooled.update(features=output))
+        try:
+            with torch.no_grad():
+                outputs = model(img)
+                _, predicted = torch.max(outputs, 1)
+        finally:
+            pool_hook.remove()
+
+    result = {
+        "predicted_class": class_names[predicted.item()],
+        "probabilities": torch.softmax(outputs, dim=1)[0].cpu().numpy(),
+        "embedding": torch.flatten(pooled["features"], 1)[0].cpu().numpy(),
+        # Localization maps the CAM back to the uploaded image's pixels
+        "source_shape": decoded.shape[:2],
+    }
+    record_timing(timings, "forward", start)
 
     # Do not add overlay if no tumor is detected
     if predicted.item() == 0:
-        return original_image
+        result["overlay"] = original_image.copy()
+        return result
+
+    # Grad-CAM reuses the classification input
+    input_tensor = img
 
     # Select target layer in neural network for Grad CAM
     target_layer = model.layer4[-1]  # Replace with the correct target layer
 
-    # Initialize Grad-CAM
-    grad_cam = GradCAM(model, target_layer)
+    # The lock is taken again for Grad-CAM, so queued interactive work can use the model in between
+    with model_lock:
+        # Initialize Grad-CAM
+        grad_cam = GradCAM(model, target_layer)
 
-    # Preprocess the input image
-    input_tensor = preprocess_image(image_path, input_size=(224, 224)).to(device)
-
-    # Generate Grad-CAM
-    cam = grad_cam.generate_cam(input_tensor)
+        # Generate Grad-CAM, for every class in one backward pass if asked
+        try:
+            if all_classes:
+                cams, _ = grad_cam.generate_all_cams(input_tensor, timings=timings)
+                cam = cams[predicted.item()]
+            else:
+                cam = grad_cam.generate_cam(input_tensor, timings=timings)
+        finally:
+            grad_cam.remove_hooks()
 
     # Overlay CAM on the image
-    overlay = overlay_cam_on_image(original_image / 255.0, cam)
-    
-    return overlay
+    start = time.perf_counter()
+    result["cam"] = cam
+    result["overlay"] = overlay_cam_on_image(original_image, cam)
+    if all_classes:
+        result["class_cams"] = cams
+        result["class_overlays"] = {
+            class_names[k]: overlay_cam_on_image(original_image, cams[k])
+            for k in range(1, len(class_names))
+        }
+    record_timing(timings, "overlay", start)
+
+    return result
+
+def get_cam_overlay(image_path):
+    return analyze_scan(image_path, all_classes=False)["overlay"]
 
 # Only run this if the script is executed directly
 if __name__ == "__main__":
@@ -0,0 +1,285 @@
+"""
+Approximate nearest-neighbour index over scan embeddings, built with NumPy.
+
+Embeddings are L2-normalised so the inner product is the cosine
+similarity. Once enough vectors are present the index trains k-means
+centroids and becomes an inverted file (IVF): every vector is filed under
+its nearest centroid and a query only scans the nprobe closest lists.
+
+The scans collection is the source of truth: every stored embedding is
+also on its scan document. Each process keeps its own index and catches
+up from Mongo with merge(), using the newest updatedAt it has seen as its
+watermark, so scans finished by any worker reach every worker.
+
+The .npz snapshot only speeds up startup: it holds the vectors and the
+watermark they are complete up to, and a process that loads it catches
+up from there. Only one process writes it at a time, whichever holds an
+exclusive lock on <path>.lock, so workers forked by serve.py never
+overwrite each other's snapshots with a partial view.
+"""
+
+import fcntl
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+
+class EmbeddingIndex:
+    def __init__(self, path, dim=512, nlist=256, nprobe=8, snapshot_every=1000):
+        self.path = path
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.snapshot_every = snapshot_every
+
+        self._lock = threading.RLock()
+        self._vectors = np.empty((1024, dim), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        self._centroids = None
+        self._assignments = np.empty(1024, dtype=np.int32)
+        self._lists = []
+        self._list_cache = {}
+        self._unsaved = 0
+        self._lock_file = None
+        # Newest updatedAt merged from the scans collection
+        self.watermark = None
+
+    @property
+    def snapshot_path(self):
+        return self.path + ".npz"
+
+    @property
+    def lock_path(self):
+        return self.path + ".lock"
+
+    def __len__(self):
+        return len(self._ids)
+
+    # Storage
+
+    def _ensure_capacity(self, size):
+        if size <= len(self._vectors):
+            return
+        capacity = max(size, 2 * len(self._vectors))
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self._ids)] = self._vectors[:len(self._ids)]
+        self._vectors = vectors
+        assignments = np.empty(capacity, dtype=np.int32)
+        assignments[:len(self._ids)] = self._assignments[:len(self._ids)]
+        self._assignments = assignments
+
+    def _normalize(self, vector):
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _insert(self, scan_id, vector):
+        """
+        Files a vector under scan_id; returns True if the scan is new to the index
+        """
+        vector = self._normalize(vector)
+        row = self._rows.get(scan_id)
+        is_new = row is None
+        if row is None:
+            row = len(self._ids)
+            self._ensure_capacity(row + 1)
+            self._ids.append(scan_id)
+            self._rows[scan_id] = row
+        elif self._centroids is not None:
+            # Re-filed below under its new nearest centroid
+            old_list = self._assignments[row]
+            self._lists[old_list].remove(row)
+            self._list_cache.pop(old_list, None)
+
+        self._vectors[row] = vector
+        if self._centroids is not None:
+            nearest = int(np.argmax(self._centroids @ vector))
+            self._assignments[row] = nearest
+            self._lists[nearest].append(row)
+            self._list_cache.pop(nearest, None)
+        elif len(self._ids) >= self.nlist * 40:
+            self.train()
+        return is_new
+
+    # Training
+
+    def train(self, iterations=10, sample_size=50_000, seed=0):
+        """
+        Fits k-means centroids on a sample and files every vector under its nearest one
+        """
+        with self._lock:
+            count = len(self._ids)
+            if count < self.nlist:
+                return
+            vectors = self._vectors[:count]
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(count, size=min(count, sample_size), replace=False)]
+
+            centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)].copy()
+            for _ in range(iterations):
+                nearest = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, nearest, sample)
+                counts = np.bincount(nearest, minlength=self.nlist)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+            self._centroids = centroids.astype(np.float32)
+            self._assignments[:count] = self._assign(vectors)
+            self._lists = [[] for _ in range(self.nlist)]
+            for row, list_id in enumerate(self._assignments[:count]):
+                self._lists[list_id].append(row)
+            self._list_cache = {}
+
+    def _assign(self, vectors, chunk_size=65536):
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            assignments[start:start + chunk_size] = np.argmax(chunk @ self._centroids.T, axis=1)
+        return assignments
+
+    # Public API
+
+    def add(self, scan_id, vector):
+        """
+        Adds or replaces the embedding of a scan in this process's index
+        """
+        with self._lock:
+            self._insert(scan_id, vector)
+            self._unsaved += 1
+
+    def merge(self, items):
+        """
+        Adds (scan_id, vector, updated_at) triples read from the scans
+        collection and advances the watermark. Returns how many were new.
+        """
+        added = 0
+        with self._lock:
+            for scan_id, vector, updated_at in items:
+                added += self._insert(scan_id, vector)
+                if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                    self.watermark = updated_at
+            self._unsaved += added
+        return added
+
+    def stats(self):
+        return {
+            "vectors": len(self._ids),
+            "lists": len(self._lists) if self._centroids is not None else 0,
+            "unsaved_entries": self._unsaved,
+            "snapshot_writer": int(self._lock_file is not None),
+        }
+
+    def get(self, scan_id):
+        with self._lock:
+            row = self._rows.get(scan_id)
+            return None if row is None else self._vectors[row].copy()
+
+    def search(self, vector, k=5, exclude=None):
+        """
+        Top-k most similar scans as (scan_id, cosine similarity) pairs
+        """
+        query = self._normalize(vector)
+        with self._lock:
+            count = len(self._ids)
+            if count == 0:
+                return []
+            if self._centroids is None:
+                rows = np.arange(count)
+            else:
+                probes = np.argsort(self._centroids @ query)[::-1][:self.nprobe]
+                rows = np.concatenate([self._list_rows(int(p)) for p in probes])
+            if not len(rows):
+                return []
+            scores = self._vectors[rows] @ query
+            ids = self._ids
+
+        # One extra candidate in case the query scan itself is among them
+        top = min(k + 1, len(rows))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        results = [(ids[rows[i]], float(scores[i])) for i in best if ids[rows[i]] != exclude]
+        return results[:k]
+
+    def _list_rows(self, list_id):
+        rows = self._list_cache.get(list_id)
+        if rows is None:
+            rows = np.array(self._lists[list_id], dtype=np.int64)
+            self._list_cache[list_id] = rows
+        return rows
+
+    # Persistence
+
+    def _is_writer(self):
+        """
+        Takes the snapshot lock if no other process holds it; kept until exit
+        """
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            lock_file = open(self.lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._lock_file = lock_file
+        return True
+
+    def save(self):
+        """
+        Writes a full snapshot if this process is the snapshot writer.
+        Returns whether it wrote one.
+        """
+        with self._lock:
+            if not self._is_writer():
+                return False
+            count = len(self._ids)
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                vectors=self._vectors[:count],
+                ids=np.array(self._ids, dtype=object),
+                centroids=self._centroids if self._centroids is not None else np.empty((0, self.dim), np.float32),
+                watermark=np.array(self.watermark.isoformat() if self.watermark else ""),
+            )
+            os.replace(tmp_path, self.snapshot_path)
+            self._unsaved = 0
+            return True
+
+    def maybe_save(self):
+        """
+        Snapshots once snapshot_every entries have been added since the last one
+        """
+        if self._unsaved >= self.snapshot_every:
+            self.save()
+
+    def load(self):
+        """
+        Restores the snapshot and its watermark; returns False if there is none
+        """
+        with self._lock:
+            found = False
+            if os.path.exists(self.snapshot_path):
+                snapshot = np.load(self.snapshot_path, allow_pickle=True)
+                vectors, ids = snapshot["vectors"], list(snapshot["ids"])
+                self._ensure_capacity(len(ids))
+                self._vectors[:len(ids)] = vectors
+                self._ids = ids
+                self._rows = {scan_id: row for row, scan_id in enumerate(ids)}
+                if len(snapshot["centroids"]):
+                    self._centroids = snapshot["centroids"]
+                    self.nlist = len(self._centroids)
+                    self._assignments[:len(ids)] = self._assign(vectors)
+                    self._lists = [[] for _ in range(self.nlist)]
+                    for row, list_id in enumerate(self._assignments[:len(ids)]):
+                        self._lists[list_id].append(row)
+                    self._list_cache = {}
+                # Snapshots without a watermark are caught up from the start
+                watermark = str(snapshot["watermark"]) if "watermark" in snapshot else ""
+                self.watermark = datetime.fromisoformat(watermark) if watermark else None
+                found = True
+            return found
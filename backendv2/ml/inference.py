@@ -0,0 +1,128 @@
+"""
+Inference layer between the API and ml.GradCam.
+
+Importing ml.GradCam pulls in torch, torchvision and cv2, which takes
+seconds. The API imports this module instead: the heavy import happens on
+first use or during warm_up(), which also loads the model and runs a dummy
+image through it. Readiness reflects whether that warm-up has finished.
+Model versions are managed by the registry in ml.GradCam; see ml/registry.py.
+"""
+
+import importlib
+import threading
+import time
+
+_module = None
+_import_lock = threading.Lock()
+
+state = {
+    "ready": False,
+    "warming_up": False,
+    "error": None,
+    "import_seconds": None,
+    "warmup_seconds": None,
+}
+
+
+def gradcam():
+    """
+    The ml.GradCam module, imported on first call
+    """
+    global _module
+    if _module is None:
+        with _import_lock:
+            if _module is None:
+                start = time.perf_counter()
+                _module = importlib.import_module("ml.GradCam")
+                state["import_seconds"] = time.perf_counter() - start
+    return _module
+
+
+def warm_up(model_path=None, version=None):
+    """
+    Imports the model code, loads the weights (model_path, checked against
+    version, if given, else the default checkpoint) and runs a dummy batch.
+    If model_path fails the default checkpoint is loaded instead, and the
+    failure is kept in state["error"].
+    """
+    state["warming_up"] = True
+    state["error"] = None
+    start = time.perf_counter()
+    try:
+        try:
+            if model_path:
+                gradcam().registry.deploy(model_path, expected_version=version)
+            else:
+                gradcam().warm_up()
+        except Exception as e:
+            if not model_path:
+                raise
+            # A missing or broken pinned checkpoint must not leave the worker unready for good
+            print(f"Error loading pinned model {model_path}, using the default checkpoint: {e}")
+            state["error"] = f"Pinned model {model_path} failed to load: {e}"
+            gradcam().warm_up()
+        state["warmup_seconds"] = time.perf_counter() - start
+        state["ready"] = True
+    except Exception as e:
+        print(f"Error warming up model: {e}")
+        state["error"] = str(e)
+    finally:
+        state["warming_up"] = False
+
+
+def start_warm_up(model_path=None, version=None):
+    """
+    Warms up on a background thread so the server can answer liveness checks meanwhile
+    """
+    thread = threading.Thread(target=warm_up, args=(model_path, version), name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    return state["ready"]
+
+
+def analyze_scan(image_path, timings=None, all_classes=True):
+    return gradcam().analyze_scan(image_path, timings=timings, all_classes=all_classes)
+
+
+def class_names():
+    return gradcam().class_names
+
+
+def get_cam_overlay(image_path):
+    return gradcam().get_cam_overlay(image_path)
+
+
+def model_status():
+    return gradcam().registry.status()
+
+
+def active_model_path():
+    """
+    Checkpoint path of the active version, or None before the first load
+    """
+    status = model_status()
+    for version in status["versions"]:
+        if version["active"]:
+            return version["path"]
+    return None
+
+
+def deploy_model(model_path, on_deployed=None, expected_version=None):
+    """
+    Loads and warms model_path in the background, then swaps it in
+    """
+    return gradcam().registry.deploy_in_background(model_path, on_deployed, expected_version)
+
+
+def activate_model(version):
+    """
+    Switches to a version that is already loaded
+    """
+    gradcam().registry.activate(version)
+
+
+def rollback_model():
+    return gradcam().registry.rollback()
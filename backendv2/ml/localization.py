@@ -0,0 +1,141 @@
+"""
+Tumor location and extent from a Grad-CAM map, without decoding the image again.
+
+The predicted class's CAM is thresholded and split into connected
+components; the component holding the CAM peak is taken as the tumor.
+Its CAM-weighted centroid, bounding box and area are mapped back to the
+pixels of the uploaded image and, through the pixel spacing, to
+millimetres.
+
+Pixel spacing comes from the scan metadata when the uploader sent it
+("pixelSpacing", row then column in mm as in DICOM). Otherwise the image
+is assumed to span ASSUMED_FOV_MM, a typical brain MRI field of view,
+and spacingSource says so.
+
+The region is a coarse guess from where the centroid falls in an axial
+slice in radiological orientation: anterior at the top, the patient's
+left on the right of the image. Pituitary tumors always sit at the sella.
+"""
+
+import os
+import re
+
+import cv2
+import numpy as np
+
+# CAM value, after scaling to [0, 1], above which a pixel counts as tumor
+CAM_THRESHOLD = float(os.getenv("CAM_THRESHOLD", "0.5"))
+
+# Field of view assumed when the spacing is unknown
+ASSUMED_FOV_MM = float(os.getenv("ASSUMED_FOV_MM", "240"))
+
+
+def pixel_spacing_mm(metadata):
+    """
+    (row, column) spacing in mm from scan metadata, or None if not given.
+    Accepts a number, a pair, or text like "0.5\\0.5" or "0.5 x 0.5".
+    """
+    if not isinstance(metadata, dict):
+        return None
+    value = metadata.get("pixelSpacing", metadata.get("pixelSpacingMm"))
+    if value is None:
+        return None
+    try:
+        if isinstance(value, str):
+            spacing = [float(v) for v in re.split(r"[\\,x\s]+", value.strip()) if v]
+        elif isinstance(value, (int, float)):
+            spacing = [float(value)]
+        else:
+            spacing = [float(v) for v in value]
+    except (TypeError, ValueError):
+        return None
+    if len(spacing) == 1:
+        spacing = spacing * 2
+    if len(spacing) != 2 or min(spacing) <= 0:
+        return None
+    return spacing[0], spacing[1]
+
+
+def region_name(x, y, predicted_class=None):
+    """
+    Region for a centroid given as fractions of the image width and height
+    """
+    if predicted_class == "pituitary":
+        return "Pituitary region"
+    side = "Left" if x >= 0.5 else "Right"
+    off_center = abs(x - 0.5)
+    if off_center < 0.12 and 0.4 <= y <= 0.65:
+        return f"{side} thalamus"
+    if y < 0.4:
+        return f"{side} frontal lobe"
+    if y > 0.75:
+        return f"{side} occipital lobe"
+    if off_center > 0.3:
+        return f"{side} temporal lobe"
+    return f"{side} parietal lobe"
+
+
+def viewer_coordinates(x, y, radius):
+    """
+    Tumor position for the 3D viewer as fractions of the brain's extent along
+    (anterior-posterior, dorsal-ventral, left-right), the atlas axis order.
+    An axial slice has no depth, so dorsal-ventral is the middle.
+    """
+    return {"normalized": [round(y, 4), 0.5, round(x, 4)], "radius": round(radius, 4)}
+
+
+def localize(cam, source_shape=None, spacing=None, predicted_class=None, threshold=CAM_THRESHOLD):
+    """
+    Location, extent and viewer coordinates of the hottest CAM region, or
+    None if nothing reaches the threshold. cam is (H, W) in [0, 1];
+    source_shape is the (height, width) of the image before it was resized
+    for the model, and spacing its (row, column) pixel spacing in mm.
+    """
+    height, width = cam.shape
+    mask = (cam >= threshold).astype(np.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    if count < 2:
+        return None
+    component = labels[np.unravel_index(np.argmax(cam), cam.shape)]
+    if component == 0:
+        component = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    left, top, box_width, box_height, area = (int(v) for v in stats[component])
+
+    # Centroid weighted by CAM intensity, from the row and column sums of the component
+    weights = np.where(labels == component, cam, 0).astype(np.float64)
+    total = float(weights.sum())
+    cy = float(weights.sum(axis=1) @ np.arange(height)) / total
+    cx = float(weights.sum(axis=0) @ np.arange(width)) / total
+
+    # CAM pixels -> source pixels -> mm
+    source_height, source_width = source_shape or (height, width)
+    scale_y, scale_x = source_height / height, source_width / width
+    if spacing:
+        row_mm, column_mm = spacing
+        spacing_source = "metadata"
+    else:
+        row_mm = column_mm = ASSUMED_FOV_MM / max(source_height, source_width)
+        spacing_source = "assumed"
+    mm_y, mm_x = scale_y * row_mm, scale_x * column_mm
+    width_mm, height_mm = box_width * mm_x, box_height * mm_y
+    size_mm = max(width_mm, height_mm)
+
+    x, y = cx / width, cy / height
+    return {
+        "location": region_name(x, y, predicted_class),
+        "size": f"{size_mm / 10:.1f}cm",
+        "extent": {
+            "widthMm": round(width_mm, 1),
+            "heightMm": round(height_mm, 1),
+            "areaMm2": round(area * mm_x * mm_y, 1),
+            "centroidPx": [round(cx * scale_x, 1), round(cy * scale_y, 1)],
+            "boundingBoxPx": [round(left * scale_x), round(top * scale_y),
+                              round(box_width * scale_x), round(box_height * scale_y)],
+            "areaPx": round(area * scale_x * scale_y),
+            "pixelSpacingMm": [round(row_mm, 4), round(column_mm, 4)],
+            "spacingSource": spacing_source,
+            "components": count - 1,
+            "threshold": threshold,
+        },
+        "tumorCoordinates": viewer_coordinates(x, y, max(box_width / width, box_height / height) / 2),
+    }
@@ -0,0 +1,237 @@
+"""
+Registry of loaded model versions, for swapping checkpoints without a restart.
+
+deploy(path) loads a checkpoint on a background thread, warms it up with a
+dummy batch and only then makes it the active version, in one assignment.
+Requests take the active version with use() and keep it to the end, so
+anything in flight when the swap happens finishes on the version it
+started with. The previously active version stays loaded, which makes
+rollback() a pointer swap. Versions that are neither active, the rollback
+target, nor in use are unloaded.
+
+A version is the checkpoint's file name plus the start of its SHA-256, so
+the same bytes always get the same version whatever the path.
+
+With a snapshot_dir, each checkpoint is copied to <snapshot_dir>/<version>.pth
+as it is hashed, and the model is loaded from that copy. A deploy that
+overwrites the original file in place can then never change, or unmap,
+the weights of a version that is already loaded (the rollback target
+included). A version whose snapshot exists can be loaded again later even
+after its original path holds different bytes.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from scheduler import PriorityLock
+
+
+def checkpoint_version(path, copy_to=None):
+    """
+    Version of the checkpoint at path. If copy_to is an open file, the bytes
+    hashed are also written to it, so the copy matches the version exactly.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+            if copy_to is not None:
+                copy_to.write(block)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{name}@{digest.hexdigest()[:12]}"
+
+
+class ModelRegistry:
+    def __init__(self, load, warm, default_path, snapshot_dir=None):
+        """
+        load(path) returns a model; warm(model) runs a dummy batch through it
+        """
+        self._load = load
+        self._warm = warm
+        self.default_path = default_path
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._versions = {}
+        self._active = None
+        self._previous = None
+        self.deploying = None
+        self.last_error = None
+
+    # Loading
+
+    def _snapshot_path(self, version):
+        return os.path.join(self.snapshot_dir, f"{version}.pth")
+
+    def _snapshot(self, path):
+        """
+        Copies path into snapshot_dir; returns its version and the copy's path
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.snapshot_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as copy:
+                version = checkpoint_version(path, copy_to=copy)
+            # Replacing an existing snapshot is harmless: same bytes, and mappings keep the old inode
+            os.replace(temporary, self._snapshot_path(version))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return version, self._snapshot_path(version)
+
+    def _load_version(self, path, expected_version=None):
+        with self._lock:
+            if expected_version in self._versions:
+                return expected_version
+        if expected_version and self.snapshot_dir and os.path.isfile(self._snapshot_path(expected_version)):
+            version, source = expected_version, self._snapshot_path(expected_version)
+        elif self.snapshot_dir:
+            version, source = self._snapshot(path)
+        else:
+            version, source = checkpoint_version(path), path
+        if expected_version and version != expected_version:
+            raise ValueError(f"{path} now holds {version}, not {expected_version}")
+        with self._lock:
+            if version in self._versions:
+                return version
+        start = time.perf_counter()
+        model = self._load(source)
+        self._warm(model)
+        entry = {
+            "version": version,
+            "path": path,
+            "model": model,
+            # Grad-CAM hooks are per call on a shared model, so each version runs one image at a time;
+            # interactive work gets the lock ahead of bulk
+            "lock": PriorityLock(),
+            "in_flight": 0,
+            "loaded_at": time.time(),
+            "load_seconds": time.perf_counter() - start,
+        }
+        with self._lock:
+            self._versions.setdefault(version, entry)
+        return version
+
+    def deploy(self, path, expected_version=None):
+        """
+        Loads, warms and activates the checkpoint at path, blocking until done.
+        With expected_version, refuses any other bytes. Returns the new active version.
+        """
+        self.deploying = path
+        try:
+            version = self._load_version(path, expected_version)
+            self.activate(version)
+            self.last_error = None
+            return version
+        except Exception as e:
+            print(f"Error deploying model {path}: {e}")
+            self.last_error = str(e)
+            raise
+        finally:
+            self.deploying = None
+
+    def deploy_in_background(self, path, on_deployed=None, expected_version=None):
+        """
+        deploy() on a thread; on_deployed(version) is called if it succeeds
+        """
+        thread = threading.Thread(
+            target=self._deploy_quietly, args=(path, on_deployed, expected_version), name="model-deploy", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _deploy_quietly(self, path, on_deployed, expected_version):
+        try:
+            version = self.deploy(path, expected_version)
+        except Exception:
+            return
+        if on_deployed:
+            on_deployed(version)
+
+    # Switching
+
+    def activate(self, version):
+        """
+        Makes a loaded version active; new requests use it from now on
+        """
+        with self._lock:
+            if version not in self._versions:
+                raise KeyError(f"Model version {version} is not loaded")
+            if version != self._active:
+                self._previous, self._active = self._active, version
+            self._evict()
+
+    def rollback(self):
+        """
+        Swaps back to the previously active version. Returns it.
+        """
+        with self._lock:
+            if self._previous is None:
+                raise KeyError("No previous model version to roll back to")
+            self._active, self._previous = self._previous, self._active
+            return self._active
+
+    def _evict(self):
+        keep = {self._active, self._previous}
+        for version, entry in list(self._versions.items()):
+            if version not in keep and entry["in_flight"] == 0:
+                del self._versions[version]
+
+    # Serving
+
+    def ensure_loaded(self):
+        """
+        Loads and activates the default checkpoint if nothing is active yet
+        """
+        if self._active is None:
+            with self._init_lock:
+                if self._active is None:
+                    version = self._load_version(self.default_path)
+                    with self._lock:
+                        if self._active is None:
+                            self._active = version
+
+    @contextmanager
+    def use(self):
+        """
+        The active version's entry, held until the block exits even if
+        another version is activated meanwhile
+        """
+        self.ensure_loaded()
+        with self._lock:
+            entry = self._versions[self._active]
+            entry["in_flight"] += 1
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry["in_flight"] -= 1
+                self._evict()
+
+    def active_version(self):
+        return self._active
+
+    def status(self):
+        with self._lock:
+            versions = [
+                {
+                    "version": entry["version"],
+                    "path": entry["path"],
+                    "active": entry["version"] == self._active,
+                    "rollbackTarget": entry["version"] == self._previous,
+                    "inFlight": entry["in_flight"],
+                    "loadSeconds": entry["load_seconds"],
+                }
+                for entry in self._versions.values()
+            ]
+        return {
+            "active": self._active,
+            "previous": self._previous,
+            "deploying": self.deploying,
+            "lastError": self.last_error,
+            "versions": versions,
+        }
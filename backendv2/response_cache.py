@@ -0,0 +1,111 @@
+"""
+In-process cache of rendered JSON responses, with strong ETags.
+
+Completed scans and visualizations almost never change, so their detail
+responses are rendered once and kept here as bytes together with an ETag
+(a hash of those bytes). A repeat request is answered from memory, and a
+request whose If-None-Match matches gets a bodyless 304 - neither touches
+Mongo nor serializes anything.
+
+Every write to a cacheable document increments its rev field, and each
+entry is stored with the rev it was rendered from. A request first reads
+the document's current rev (an _id lookup returning one field) and only
+uses the entry if the revs match. Workers under the pre-fork launcher
+share nothing but Mongo, so this is what stops one worker from serving,
+or 304-validating, a body another worker's write has made stale.
+invalidate() additionally drops the entry in the writing process.
+"""
+
+import hashlib
+import threading
+
+from cachetools import TTLCache
+from fastapi.responses import JSONResponse, Response
+
+# Revalidate every time, so an invalidated entry is never served from the browser cache
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    If-None-Match uses weak comparison, so W/"x" matches "x"
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def render(content):
+    """
+    The JSON body and ETag for content, serialized the same way JSONResponse does
+    """
+    body = JSONResponse(content).body
+    return body, make_etag(body)
+
+
+def respond(request, body, etag):
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
+
+
+class ResponseCache:
+    def __init__(self, maxsize=4096, ttl=300):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def get(self, key, rev):
+        """
+        (body, etag) for key if it was rendered from revision rev, else None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] != rev:
+                # Written since, possibly by another process
+                del self._entries[key]
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, body, etag, rev):
+        with self._lock:
+            self._entries[key] = (body, etag, rev)
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits_total": self.hits,
+                "misses_total": self.misses,
+                "invalidations_total": self.invalidations,
+                "stale_total": self.stale,
+            }
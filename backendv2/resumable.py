@@ -0,0 +1,241 @@
+"""
+Resumable chunked uploads, modelled on the tus protocol.
+
+A client creates a session with the file's name and total size, then
+sends the file in chunks, each with its byte offset and a SHA-256 of
+the chunk (Upload-Offset and Upload-Checksum headers). The session's
+offset only moves forward once a chunk is fully received and verified,
+so after a dropped connection the client asks for the current offset
+and carries on from there. Once offset == size the session is finalized
+into a normal scan.
+
+Sessions live in Mongo so any worker can take the next chunk; the bytes
+go to uploads/partial/<upload_id>.part, written at explicit offsets so a
+retried chunk simply overwrites itself. Sessions untouched for
+SESSION_TTL are garbage-collected together with their partial files.
+"""
+
+import base64
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from starlette.concurrency import run_in_threadpool
+
+PARTIAL_DIR = os.path.join("uploads", "partial")
+SESSION_TTL = timedelta(hours=24)
+MAX_UPLOAD_SIZE = 2 * 1024 ** 3
+MAX_CHUNK_SIZE = 16 * 1024 ** 2
+RECOMMENDED_CHUNK_SIZE = 5 * 1024 ** 2
+WRITE_BLOCK_SIZE = 1024 ** 2
+
+
+class UploadError(Exception):
+    """
+    A rejected upload request; status_code is the HTTP status to answer with
+    """
+
+    def __init__(self, status_code, detail, offset=None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.offset = offset
+
+
+def partial_path(upload_id):
+    return os.path.join(PARTIAL_DIR, f"{upload_id}.part")
+
+
+def parse_checksum(header):
+    """
+    Decodes an 'sha256 <base64 digest>' checksum header
+    """
+    try:
+        algorithm, encoded = header.strip().split(" ", 1)
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except Exception:
+        raise UploadError(400, "Upload-Checksum must be 'sha256 <base64 digest>'")
+    if algorithm.lower() != "sha256" or len(digest) != 32:
+        raise UploadError(400, "Only sha256 checksums are supported")
+    return digest
+
+
+def create_session(sessions, filename, size, metadata, checksum=None, user_id=None):
+    if size <= 0 or size > MAX_UPLOAD_SIZE:
+        raise UploadError(413 if size > 0 else 400, f"Upload size must be between 1 byte and {MAX_UPLOAD_SIZE} bytes")
+    if checksum is not None:
+        parse_checksum(checksum)
+
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    upload_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    session = {
+        "_id": upload_id,
+        "filename": os.path.basename(filename),
+        "size": size,
+        "offset": 0,
+        "metadata": metadata,
+        "userId": user_id,
+        "checksum": checksum,
+        "status": "uploading",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + SESSION_TTL,
+    }
+    # Reserve the file up front so chunks can be written at any offset
+    with open(partial_path(upload_id), "wb") as f:
+        f.truncate(size)
+    sessions.insert_one(session)
+    return session
+
+
+def get_session(sessions, upload_id):
+    session = sessions.find_one({"_id": upload_id})
+    if not session or session["expires_at"] < datetime.utcnow():
+        raise UploadError(404, "Upload session not found or expired")
+    return session
+
+
+def open_chunk(sessions, upload_id, offset, checksum_header):
+    """
+    Checks a chunk's session, offset and checksum header. Returns the
+    session, the expected digest and the partial file opened at offset.
+    """
+    session = get_session(sessions, upload_id)
+    if session["status"] != "uploading":
+        raise UploadError(409, "Upload already finalized", session["offset"])
+    if offset != session["offset"]:
+        # The client is out of step, e.g. its last chunk did land; tell it where to resume
+        raise UploadError(409, "Offset does not match the upload", session["offset"])
+    expected_digest = parse_checksum(checksum_header)
+    f = open(partial_path(upload_id), "r+b")
+    f.seek(offset)
+    return session, expected_digest, f
+
+
+def acknowledge_chunk(sessions, upload_id, offset, received):
+    """
+    Advances the session past a verified chunk. Returns the new offset.
+    """
+    now = datetime.utcnow()
+    result = sessions.update_one(
+        {"_id": upload_id, "offset": offset, "status": "uploading"},
+        {"$set": {"offset": offset + received, "updated_at": now, "expires_at": now + SESSION_TTL}},
+    )
+    if result.matched_count == 0:
+        # A concurrent retry of the same chunk got there first
+        return get_session(sessions, upload_id)["offset"]
+    return offset + received
+
+
+async def write_chunk(sessions, upload_id, offset, checksum_header, chunks):
+    """
+    Streams one chunk to disk at offset, verifies its checksum and advances
+    the session. chunks is an async iterator of bytes (the request body).
+    Returns the new offset. Mongo and file I/O run in the threadpool, so the
+    event loop only receives the body.
+    """
+    session, expected_digest, f = await run_in_threadpool(open_chunk, sessions, upload_id, offset, checksum_header)
+
+    digest = hashlib.sha256()
+    received = 0
+    pending, pending_size = [], 0
+    try:
+        async for chunk in chunks:
+            received += len(chunk)
+            if received > MAX_CHUNK_SIZE or offset + received > session["size"]:
+                raise UploadError(413, "Chunk too large", session["offset"])
+            digest.update(chunk)
+            pending.append(chunk)
+            pending_size += len(chunk)
+            # Body pieces are small; write them in larger blocks to keep thread hops down
+            if pending_size >= WRITE_BLOCK_SIZE:
+                await run_in_threadpool(f.write, b"".join(pending))
+                pending, pending_size = [], 0
+        if pending:
+            await run_in_threadpool(f.write, b"".join(pending))
+    finally:
+        await run_in_threadpool(f.close)
+
+    if received == 0:
+        raise UploadError(400, "Empty chunk", session["offset"])
+    if digest.digest() != expected_digest:
+        # Nothing is acknowledged, so the next attempt overwrites these bytes
+        raise UploadError(460, "Checksum mismatch", session["offset"])
+
+    return await run_in_threadpool(acknowledge_chunk, sessions, upload_id, offset, received)
+
+
+def finalize_session(sessions, upload_id, destination):
+    """
+    Checks a complete session, moves its file to destination and closes it.
+    Returns the session.
+    """
+    session = get_session(sessions, upload_id)
+    if session["offset"] != session["size"]:
+        raise UploadError(409, "Upload is incomplete", session["offset"])
+
+    claimed = sessions.update_one(
+        {"_id": upload_id, "status": "uploading"},
+        {"$set": {"status": "finalizing", "updated_at": datetime.utcnow()}},
+    )
+    if claimed.matched_count == 0:
+        raise UploadError(409, "Upload already finalized", session["offset"])
+
+    path = partial_path(upload_id)
+    if session.get("checksum"):
+        expected_digest = parse_checksum(session["checksum"])
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        if digest.digest() != expected_digest:
+            # Every chunk verified, so there is no telling which bytes are wrong:
+            # clear the file and reopen the session at offset 0 to be sent again
+            with open(path, "r+b") as f:
+                f.truncate(0)
+                f.truncate(session["size"])
+            now = datetime.utcnow()
+            sessions.update_one({"_id": upload_id}, {"$set": {
+                "status": "uploading",
+                "offset": 0,
+                "updated_at": now,
+                "expires_at": now + SESSION_TTL,
+            }})
+            raise UploadError(460, "Checksum of the assembled file does not match; upload it again from offset 0", 0)
+
+    os.replace(path, destination)
+    sessions.delete_one({"_id": upload_id})
+    return session
+
+
+def abort_session(sessions, upload_id):
+    sessions.delete_one({"_id": upload_id})
+    try:
+        os.remove(partial_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def collect_expired_sessions(sessions, now=None):
+    """
+    Deletes expired sessions and their partial files, and partial files
+    with no session. Returns the number of files removed.
+    """
+    now = now or datetime.utcnow()
+    removed = 0
+    for session in sessions.find({"expires_at": {"$lt": now}}, {"_id": 1}):
+        abort_session(sessions, session["_id"])
+        removed += 1
+
+    # Orphans from sessions that were deleted while their file was still open
+    if os.path.isdir(PARTIAL_DIR):
+        cutoff = (now - SESSION_TTL).timestamp()
+        for name in os.listdir(PARTIAL_DIR):
+            path = os.path.join(PARTIAL_DIR, name)
+            upload_id = name.rsplit(".", 1)[0]
+            if os.path.getmtime(path) < cutoff and not sessions.find_one({"_id": upload_id}, {"_id": 1}):
+                os.remove(path)
+                removed += 1
+    return removed
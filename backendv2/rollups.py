@@ -0,0 +1,216 @@
+"""
+Hourly and daily rollups of scan outcomes.
+
+Every finished scan adds one $inc upsert to its hour bucket and to its
+day bucket, keyed by the scan's creation time truncated to the hour or
+day (UTC). Each bucket document holds:
+
+    scans, completed, failed, tumorDetected, classes.<label>,
+    timedScans, turnaroundSeconds (over the scans with stage timings)
+
+Time-series queries read only these documents, so a year of daily
+points is 365 documents however many scans there are. backfill()
+rebuilds the buckets over a range from the raw scans collection.
+
+Usage (from backendv2/):
+    python rollups.py backfill --start 2025-01-01
+"""
+
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne
+
+INTERVALS = ("hour", "day", "week", "month")
+COUNTERS = ("scans", "completed", "failed", "tumorDetected", "timedScans", "turnaroundSeconds")
+
+
+def bucket_start(moment, interval):
+    """
+    Start of the hour, day, ISO week (Monday) or month containing moment
+    """
+    if interval == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start, interval):
+    if interval == "hour":
+        return start + timedelta(hours=1)
+    if interval == "week":
+        return start + timedelta(days=7)
+    if interval == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def rollup_increments(scan):
+    """
+    The $inc document a finished scan contributes to its buckets
+    """
+    increments = {"scans": 1}
+    if scan.get("status") == "failed":
+        increments["failed"] = 1
+        return increments
+
+    increments["completed"] = 1
+    if scan.get("tumorDetected"):
+        increments["tumorDetected"] = 1
+    if scan.get("classLabel"):
+        increments[f"classes.{scan['classLabel']}"] = 1
+    if scan.get("stage_durations"):
+        increments["timedScans"] = 1
+        increments["turnaroundSeconds"] = sum(scan["stage_durations"].values())
+    return increments
+
+
+def record_scan(hourly, daily, scan):
+    """
+    Adds a finished scan to its hour and day buckets
+    """
+    increments = rollup_increments(scan)
+    hourly.update_one({"_id": bucket_start(scan["created_at"], "hour")}, {"$inc": increments}, upsert=True)
+    daily.update_one({"_id": bucket_start(scan["created_at"], "day")}, {"$inc": increments}, upsert=True)
+
+
+def empty_bucket(start):
+    bucket = {"_id": start, "classes": {}}
+    for counter in COUNTERS:
+        bucket[counter] = 0
+    return bucket
+
+
+def merge_bucket(target, source):
+    for counter in COUNTERS:
+        target[counter] += source.get(counter, 0)
+    for label, count in source.get("classes", {}).items():
+        target["classes"][label] = target["classes"].get(label, 0) + count
+
+
+def backfill(scans, hourly, daily, start, end):
+    """
+    Recomputes every bucket in [start, end) from the scans collection,
+    replacing what is there. The range is widened to whole days so that
+    the daily buckets stay consistent with the hourly ones. Live scans in
+    the range are not locked out, so backfill closed periods.
+    Returns the number of (hourly, daily) buckets written.
+    """
+    start = bucket_start(start, "day")
+    end_day = bucket_start(end, "day")
+    end = end_day if end_day == end else end_day + timedelta(days=1)
+
+    pipeline = [
+        {"$match": {
+            "created_at": {"$gte": start, "$lt": end},
+            "status": {"$in": ["completed", "failed"]},
+        }},
+        {"$group": {
+            "_id": {
+                "year": {"$year": "$created_at"},
+                "month": {"$month": "$created_at"},
+                "day": {"$dayOfMonth": "$created_at"},
+                "hour": {"$hour": "$created_at"},
+                "status": "$status",
+                "tumorDetected": {"$eq": ["$tumorDetected", True]},
+                "classLabel": "$classLabel",
+            },
+            "scans": {"$sum": 1},
+            "timedScans": {"$sum": {"$cond": [{"$ne": [{"$ifNull": ["$stage_durations", None]}, None]}, 1, 0]}},
+            "turnaroundSeconds": {"$sum": {"$sum": {"$map": {
+                "input": {"$objectToArray": {"$ifNull": ["$stage_durations", {}]}},
+                "in": "$$this.v",
+            }}}},
+        }},
+    ]
+
+    hours = {}
+    for group in scans.aggregate(pipeline, allowDiskUse=True):
+        key = group["_id"]
+        hour = datetime(key["year"], key["month"], key["day"], key["hour"])
+        bucket = hours.setdefault(hour, empty_bucket(hour))
+        bucket["scans"] += group["scans"]
+        if key["status"] == "failed":
+            bucket["failed"] += group["scans"]
+            continue
+        bucket["completed"] += group["scans"]
+        bucket["timedScans"] += group["timedScans"]
+        bucket["turnaroundSeconds"] += group["turnaroundSeconds"]
+        if key["tumorDetected"]:
+            bucket["tumorDetected"] += group["scans"]
+        if key.get("classLabel"):
+            bucket["classes"][key["classLabel"]] = bucket["classes"].get(key["classLabel"], 0) + group["scans"]
+
+    days = {}
+    for hour, bucket in hours.items():
+        day = bucket_start(hour, "day")
+        merge_bucket(days.setdefault(day, empty_bucket(day)), bucket)
+
+    for collection, buckets in ((hourly, hours), (daily, days)):
+        collection.delete_many({"_id": {"$gte": start, "$lt": end}})
+        if buckets:
+            collection.bulk_write(
+                [ReplaceOne({"_id": key}, bucket, upsert=True) for key, bucket in buckets.items()],
+                ordered=False,
+            )
+    return len(hours), len(days)
+
+
+def timeseries(hourly, daily, interval, start, end):
+    """
+    Points from start to end (exclusive) at the given interval, read from the
+    rollups only. Weeks and months are summed from daily buckets, and empty
+    periods come back as zero points so charts need no gap handling.
+    """
+    source = hourly if interval == "hour" else daily
+    first = bucket_start(start, interval)
+
+    points = {}
+    cursor = source.find({"_id": {"$gte": first, "$lt": end}}).sort("_id", 1)
+    for doc in cursor:
+        period = bucket_start(doc["_id"], interval)
+        merge_bucket(points.setdefault(period, empty_bucket(period)), doc)
+
+    series = []
+    period = first
+    while period < end:
+        bucket = points.get(period) or empty_bucket(period)
+        completed = bucket["completed"]
+        series.append({
+            "start": period.isoformat() + "Z",
+            "scans": bucket["scans"],
+            "completed": completed,
+            "failed": bucket["failed"],
+            "tumorDetected": bucket["tumorDetected"],
+            "tumorDetectionRate": bucket["tumorDetected"] / completed if completed else 0,
+            "averageTurnaroundSeconds": bucket["turnaroundSeconds"] / bucket["timedScans"] if bucket["timedScans"] else None,
+            "classes": bucket["classes"],
+        })
+        period = next_bucket(period, interval)
+    return series
+
+
+def main():
+    from pymongo.mongo_client import MongoClient
+
+    parser = argparse.ArgumentParser(description="Maintain the scan rollup collections")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Rebuild rollups from the scans collection")
+    backfill_parser.add_argument("--start", default="2000-01-01", help="First day to rebuild (YYYY-MM-DD)")
+    backfill_parser.add_argument("--end", default=None, help="Day after the last one to rebuild; defaults to today")
+    args = parser.parse_args()
+
+    db = MongoClient(os.getenv("MONGO_URI")).neurosphere
+    start = datetime.fromisoformat(args.start)
+    end = datetime.fromisoformat(args.end) if args.end else bucket_start(datetime.utcnow(), "day")
+    hours, days = backfill(db.scans, db.scan_rollups_hourly, db.scan_rollups_daily, start, end)
+    print(f"Rebuilt {hours} hourly and {days} daily buckets from {start.date()} to {end.date()}")
+
+
+if __name__ == "__main__":
+    main()
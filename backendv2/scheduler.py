@@ -0,0 +1,263 @@
+"""
+Inference scheduler with priority lanes, per-user fairness and admission
+control.
+
+Jobs go into one of two lanes. "interactive" is for a clinician waiting
+on a response (/api/mri/heatmap); "bulk" is for queued scan processing.
+Workers always take queued interactive work first, so an interactive
+request jumps ahead of any backlog of bulk jobs. One worker is reserved
+for interactive work, so it never waits for a bulk job to be picked up.
+To keep bulk from starving entirely, every bulk_every-th pick goes to
+bulk when both lanes are waiting.
+
+Workers share one model, guarded by a PriorityLock. Each job records its
+lane on the worker thread. When the lock is released it goes to a
+waiting interactive job before any bulk job, and a bulk analysis takes
+the lock separately for each stage (forward pass, Grad-CAM). A running
+stage can't be interrupted, so the longest an interactive request waits
+behind bulk is one stage of one image, never a whole job or the queue.
+
+Within a lane, jobs are kept per user and served round-robin, so one
+user's import of a thousand scans doesn't push everyone else's scans to
+the back.
+
+Admission control rejects new work before it queues: interactive work
+when its expected wait already exceeds the interactive SLO, and bulk
+work when its expected wait is too long or when recent interactive
+latency is over the SLO. Rejections carry a Retry-After estimate.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+LANES = ("interactive", "bulk")
+
+# Lane of the job running on the current thread
+_current = threading.local()
+
+
+def current_lane():
+    """
+    Lane of the job on this thread; work outside the scheduler counts as interactive
+    """
+    return getattr(_current, "lane", "interactive")
+
+
+class PriorityLock:
+    """
+    A lock that is handed to waiting interactive threads before bulk ones
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._held = False
+        self._interactive_waiting = 0
+
+    def acquire(self):
+        interactive = current_lane() == "interactive"
+        with self._cond:
+            if interactive:
+                self._interactive_waiting += 1
+            try:
+                while self._held or (not interactive and self._interactive_waiting):
+                    self._cond.wait()
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+            self._held = True
+        return True
+
+    def release(self):
+        with self._cond:
+            self._held = False
+            self._cond.notify_all()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, lane, retry_after):
+        super().__init__(f"{lane} inference is over capacity, retry in {retry_after} s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class InferenceScheduler:
+    def __init__(self, bulk_workers=1, interactive_workers=1, interactive_slo=2.0,
+                 bulk_max_wait=900.0, bulk_every=8, window=200):
+        self.bulk_workers = max(1, bulk_workers)
+        self.interactive_workers = max(0, interactive_workers)
+        self.interactive_slo = interactive_slo
+        self.bulk_max_wait = bulk_max_wait
+        self.bulk_every = bulk_every
+        self.on_complete = None
+
+        self._cond = threading.Condition()
+        self._queues = {lane: OrderedDict() for lane in LANES}
+        self._queued = {lane: 0 for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._service_time = {lane: 1.0 for lane in LANES}
+        self._recent_interactive = deque(maxlen=window)
+        self._interactive_streak = 0
+        self._stopping = False
+        self._threads = []
+        self.rejected = {lane: 0 for lane in LANES}
+        self.completed = {lane: 0 for lane in LANES}
+
+    # Lifecycle
+
+    def start(self):
+        workers = [False] * self.bulk_workers + [True] * self.interactive_workers
+        for index, interactive_only in enumerate(workers):
+            thread = threading.Thread(
+                target=self._worker, args=(interactive_only,), name=f"inference-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    # Admission
+
+    def estimated_wait(self, lane):
+        """
+        Seconds a job admitted to lane now is expected to wait before it starts
+        """
+        with self._cond:
+            if lane == "interactive":
+                ahead = self._queued["interactive"]
+                workers = self.bulk_workers + self.interactive_workers
+            else:
+                ahead = self._queued["interactive"] + self._queued["bulk"]
+                workers = self.bulk_workers
+            return ahead * self._service_time[lane] / workers
+
+    def interactive_p99(self):
+        with self._cond:
+            # Only recent samples count; an idle minute means no pressure
+            cutoff = time.monotonic() - 60
+            latencies = sorted(latency for at, latency in self._recent_interactive if at >= cutoff)
+        if len(latencies) < 20:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(0.99 * len(latencies)) - 1)]
+
+    def admit(self, lane):
+        """
+        Raises AdmissionRejected if lane should shed this job
+        """
+        wait = self.estimated_wait(lane)
+        if lane == "interactive":
+            if wait > self.interactive_slo:
+                self._reject(lane, wait)
+            return
+        p99 = self.interactive_p99()
+        if wait > self.bulk_max_wait or (p99 is not None and p99 > self.interactive_slo):
+            self._reject(lane, wait)
+
+    def _reject(self, lane, wait):
+        with self._cond:
+            self.rejected[lane] += 1
+        raise AdmissionRejected(lane, max(1, math.ceil(min(wait, self.bulk_max_wait))))
+
+    # Submission
+
+    def submit(self, fn, lane="bulk", user=None, admit=True):
+        """
+        Queues fn() and returns a Future of its result
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane {lane}")
+        if admit:
+            self.admit(lane)
+        future = Future()
+        with self._cond:
+            user_queue = self._queues[lane].setdefault(user or "anonymous", deque())
+            user_queue.append((fn, future, time.monotonic(), lane))
+            self._queued[lane] += 1
+            self._cond.notify_all()
+        return future
+
+    def run(self, fn, lane="bulk", user=None, admit=False):
+        """
+        Queues fn() and blocks until it has run
+        """
+        return self.submit(fn, lane, user, admit).result()
+
+    # Workers
+
+    def _next_job(self, interactive_only):
+        has_interactive = self._queued["interactive"] > 0
+        has_bulk = self._queued["bulk"] > 0 and not interactive_only
+        if has_interactive and not (has_bulk and self._interactive_streak >= self.bulk_every):
+            lane = "interactive"
+            self._interactive_streak = self._interactive_streak + 1 if has_bulk else 0
+        elif has_bulk:
+            lane = "bulk"
+            self._interactive_streak = 0
+        else:
+            return None
+
+        # Round-robin: serve the user at the front, then move them to the back
+        queues = self._queues[lane]
+        user, user_queue = queues.popitem(last=False)
+        job = user_queue.popleft()
+        if user_queue:
+            queues[user] = user_queue
+        self._queued[lane] -= 1
+        self._running[lane] += 1
+        return job
+
+    def _worker(self, interactive_only):
+        while True:
+            with self._cond:
+                job = self._next_job(interactive_only)
+                while job is None and not self._stopping:
+                    self._cond.wait()
+                    job = self._next_job(interactive_only)
+                if job is None:
+                    return
+
+            fn, future, queued_at, lane = job
+            started = time.monotonic()
+            if future.set_running_or_notify_cancel():
+                _current.lane = lane
+                try:
+                    future.set_result(fn())
+                except BaseException as e:
+                    future.set_exception(e)
+                finally:
+                    del _current.lane
+            finished = time.monotonic()
+            self._record(lane, started - queued_at, finished - started, finished)
+
+    def _record(self, lane, wait, service, finished):
+        with self._cond:
+            self._running[lane] -= 1
+            self.completed[lane] += 1
+            self._service_time[lane] += 0.2 * (service - self._service_time[lane])
+            if lane == "interactive":
+                self._recent_interactive.append((finished, wait + service))
+        if self.on_complete:
+            self.on_complete(lane, wait, service)
+
+    def stats(self):
+        with self._cond:
+            stats = {}
+            for lane in LANES:
+                stats[f"{lane}_queued"] = self._queued[lane]
+                stats[f"{lane}_running"] = self._running[lane]
+                stats[f"{lane}_users_waiting"] = len(self._queues[lane])
+                stats[f"{lane}_service_seconds"] = self._service_time[lane]
+                stats[f"{lane}_completed_total"] = self.completed[lane]
+                stats[f"{lane}_rejected_total"] = self.rejected[lane]
+            return stats
@@ -0,0 +1,223 @@
+"""
+Indexed scan search over normalized fields.
+
+size is stored as text ("2.3cm") and location as free text, so neither
+can be range-filtered or reliably matched. Every finished scan also gets:
+
+    sizeMm       largest dimension in millimetres, as a number
+    locationKey  canonical region slug, e.g. "frontal_lobe"
+
+Searches filter on classLabel, locationKey, doctor, a created_at range
+and a sizeMm range, newest first. Each query is sent to one of the
+declared INDEXES, chosen by its equality filters (equality keys first,
+then the created_at sort, then the range and remaining filter keys). _id
+is the last key, so finding a page of ids and counting the matches are
+covered index scans; only the page itself is fetched from the documents.
+
+Usage (from backendv2/):
+    python search.py migrate    # backfill sizeMm/locationKey, build the indexes
+    python search.py explain    # show the plan used for each index
+"""
+
+import argparse
+import os
+import re
+
+from pymongo import DESCENDING, UpdateOne
+
+# Remaining keys after the equality prefix; every index ends with them so
+# any filter combination stays inside the index
+_TAIL = [("created_at", DESCENDING), ("sizeMm", 1)]
+
+INDEXES = {
+    "search_class_location": [("classLabel", 1), ("locationKey", 1), *_TAIL, ("doctor", 1), ("_id", 1)],
+    "search_class": [("classLabel", 1), *_TAIL, ("locationKey", 1), ("doctor", 1), ("_id", 1)],
+    "search_location": [("locationKey", 1), *_TAIL, ("classLabel", 1), ("doctor", 1), ("_id", 1)],
+    "search_doctor": [("doctor", 1), *_TAIL, ("classLabel", 1), ("locationKey", 1), ("_id", 1)],
+    "search_date": [*_TAIL, ("classLabel", 1), ("locationKey", 1), ("doctor", 1), ("_id", 1)],
+}
+
+UNITS_TO_MM = {"mm": 1.0, "cm": 10.0, "m": 1000.0, "in": 25.4}
+_NUMBER = r"\d+(?:\.\d+)?"
+_SIZE_PATTERN = re.compile(rf"({_NUMBER}(?:\s*[x×*]\s*{_NUMBER})*)\s*(mm|cm|m|in)?\b", re.IGNORECASE)
+
+# Canonical regions and the words that identify them
+REGIONS = {
+    "frontal_lobe": ("frontal",),
+    "temporal_lobe": ("temporal",),
+    "parietal_lobe": ("parietal",),
+    "occipital_lobe": ("occipital",),
+    "cerebellum": ("cerebellum", "cerebellar"),
+    "brainstem": ("brainstem", "brain stem", "pons", "medulla", "midbrain"),
+    "pituitary": ("pituitary", "sella", "sellar"),
+    "ventricles": ("ventricle", "ventricular"),
+    "thalamus": ("thalamus", "thalamic"),
+}
+
+
+def parse_size_mm(size):
+    """
+    Largest dimension in mm from text like "2.3cm", "23 mm" or "1.2 x 0.8 cm".
+    A bare number is taken to be centimetres, as the pipeline writes them.
+    """
+    if size is None:
+        return None
+    if isinstance(size, (int, float)):
+        return float(size) * UNITS_TO_MM["cm"]
+    match = _SIZE_PATTERN.search(str(size))
+    if not match:
+        return None
+    dimensions = [float(d) for d in re.findall(_NUMBER, match.group(1))]
+    unit = (match.group(2) or "cm").lower()
+    return round(max(dimensions) * UNITS_TO_MM[unit], 2)
+
+
+def normalize_location(location):
+    """
+    Canonical region slug for free-text location, or a slug of the text itself
+    """
+    if not location:
+        return None
+    text = str(location).strip().lower()
+    for key, words in REGIONS.items():
+        if any(word in text for word in words):
+            return key
+    return re.sub(r"[^a-z0-9]+", "_", text).strip("_") or None
+
+
+def normalized_fields(doc):
+    """
+    The $set of normalized fields for a scan document
+    """
+    return {"sizeMm": parse_size_mm(doc.get("size")), "locationKey": normalize_location(doc.get("location"))}
+
+
+def ensure_indexes(scans):
+    for name, keys in INDEXES.items():
+        scans.create_index(keys, name=name)
+
+
+def build_query(class_label=None, location=None, doctor=None, start=None, end=None,
+                min_size_mm=None, max_size_mm=None):
+    """
+    Mongo filter and the name of the index that serves it
+    """
+    query = {}
+    if class_label:
+        query["classLabel"] = class_label
+    if location:
+        query["locationKey"] = normalize_location(location)
+    if doctor:
+        query["doctor"] = doctor
+    if start or end:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = start
+        if end:
+            query["created_at"]["$lt"] = end
+    if min_size_mm is not None or max_size_mm is not None:
+        query["sizeMm"] = {}
+        if min_size_mm is not None:
+            query["sizeMm"]["$gte"] = min_size_mm
+        if max_size_mm is not None:
+            query["sizeMm"]["$lte"] = max_size_mm
+
+    if class_label and location:
+        index = "search_class_location"
+    elif class_label:
+        index = "search_class"
+    elif location:
+        index = "search_location"
+    elif doctor:
+        index = "search_doctor"
+    else:
+        index = "search_date"
+    return query, index
+
+
+def search_ids(scans, query, index, skip, limit):
+    """
+    One page of matching ids, newest first, plus the total - both from the index alone
+    """
+    cursor = scans.find(query, {"_id": 1}).hint(index).sort("created_at", DESCENDING).skip(skip).limit(limit)
+    ids = [doc["_id"] for doc in cursor]
+    total = scans.count_documents(query, hint=index)
+    return ids, total
+
+
+def fetch_page(scans, ids, projection):
+    """
+    Documents for ids, in the order of ids
+    """
+    docs = {doc["_id"]: doc for doc in scans.find({"_id": {"$in": ids}}, projection)}
+    return [docs[scan_id] for scan_id in ids if scan_id in docs]
+
+
+def migrate(scans, batch_size=1000):
+    """
+    Sets sizeMm and locationKey on every scan that has a size or location but
+    no normalized fields yet, then builds the search indexes. Safe to rerun.
+    Returns the number of scans updated.
+    """
+    query = {
+        "$or": [{"size": {"$exists": True}}, {"location": {"$exists": True}}],
+        "sizeMm": {"$exists": False},
+    }
+    updated = 0
+    operations = []
+    for doc in scans.find(query, {"size": 1, "location": 1}).batch_size(batch_size):
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": normalized_fields(doc)}))
+        if len(operations) >= batch_size:
+            updated += scans.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += scans.bulk_write(operations, ordered=False).modified_count
+    ensure_indexes(scans)
+    return updated
+
+
+def explain(scans):
+    """
+    Prints the winning plan for a typical query on each index; a covered
+    plan has no FETCH stage and examines no documents
+    """
+    examples = {
+        "search_class_location": {"class_label": "glioma", "location": "Frontal lobe", "min_size_mm": 10},
+        "search_class": {"class_label": "meningioma"},
+        "search_location": {"location": "Temporal lobe", "max_size_mm": 30},
+        "search_doctor": {"doctor": "Dr. Smith"},
+        "search_date": {"min_size_mm": 20},
+    }
+    for name, filters in examples.items():
+        query, index = build_query(**filters)
+        stats = scans.find(query, {"_id": 1}).hint(index).sort("created_at", DESCENDING).limit(10).explain()
+        execution = stats.get("executionStats", {})
+        stages = []
+        stage = stats["queryPlanner"]["winningPlan"]
+        # Newer servers nest the classic plan tree under queryPlan
+        stage = stage.get("queryPlan", stage)
+        while stage:
+            stages.append(stage["stage"])
+            stage = stage.get("inputStage")
+        print(f"{name}: {' <- '.join(stages)}, "
+              f"keys examined {execution.get('totalKeysExamined')}, docs examined {execution.get('totalDocsExamined')}")
+
+
+def main():
+    from pymongo.mongo_client import MongoClient
+
+    parser = argparse.ArgumentParser(description="Maintain the scan search fields and indexes")
+    parser.add_argument("command", choices=("migrate", "explain"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    scans = MongoClient(os.getenv("MONGO_URI")).neurosphere.scans
+    if args.command == "migrate":
+        updated = migrate(scans, args.batch_size)
+        print(f"Normalized {updated} scans and built {len(INDEXES)} search indexes")
+    else:
+        explain(scans)
+
+
+if __name__ == "__main__":
+    main()
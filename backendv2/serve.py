@@ -0,0 +1,153 @@
+"""
+Pre-fork launcher for the API.
+
+The parent process imports the model code and loads the weights once,
+freezes the garbage collector's view of those objects, then forks the
+workers. The workers share the parent's pages copy-on-write, and since
+the weights are memory-mapped from the checkpoint and never written,
+those pages stay shared for the life of the workers. Each worker runs
+its own uvicorn server on the shared listening socket.
+
+Per-process state is kept consistent through Mongo: each worker's
+similarity index catches up from the embeddings stored on scans, and
+only one worker at a time writes the index snapshot.
+
+Usage (from backendv2/):
+    python serve.py --workers 4 --port 8000 --report-interval 60
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid):
+    """
+    Memory of one process in MB from /proc/<pid>/smaps_rollup (Linux only)
+    """
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            name = parts[0].rstrip(":")
+            if name in SMAPS_FIELDS:
+                memory[name] = int(parts[1]) / 1024
+    return memory
+
+
+def memory_report(pids):
+    """
+    RSS and PSS per process. PSS splits shared pages between the processes
+    mapping them, so summing PSS gives the real footprint of the group.
+    """
+    rows = []
+    for pid in pids:
+        try:
+            rows.append((pid, read_memory(pid)))
+        except OSError as e:
+            print(f"Error reading memory of {pid}: {e}")
+
+    lines = [f"{'pid':>8} {'rss_mb':>9} {'pss_mb':>9} {'shared_mb':>10} {'private_mb':>11}"]
+    for pid, memory in rows:
+        shared = memory.get("Shared_Clean", 0) + memory.get("Shared_Dirty", 0)
+        private = memory.get("Private_Clean", 0) + memory.get("Private_Dirty", 0)
+        lines.append(f"{pid:>8} {memory.get('Rss', 0):9.1f} {memory.get('Pss', 0):9.1f} {shared:10.1f} {private:11.1f}")
+    total_rss = sum(memory.get("Rss", 0) for _, memory in rows)
+    total_pss = sum(memory.get("Pss", 0) for _, memory in rows)
+    lines.append(f"{'total':>8} {total_rss:9.1f} {total_pss:9.1f}")
+    return "\n".join(lines)
+
+
+def preload_model():
+    """
+    Loads the weights in the parent so every worker inherits them. The dummy
+    batch is left to each worker's warm-up: the parent never starts torch's
+    thread pool, which is not safe to carry across fork.
+    """
+    from ml import inference
+
+    start = time.perf_counter()
+    inference.gradcam().get_model()
+    print(f"Model preloaded in {time.perf_counter() - start:.2f} s")
+
+
+def run_worker(sock, args):
+    import uvicorn
+
+    # Each worker gets its own database connection and background threads
+    config = uvicorn.Config("main:app", log_level=args.log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked workers sharing the model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-preload", action="store_true", help="Let each worker load the model itself")
+    parser.add_argument("--report-interval", type=float, default=0, help="Print a memory report every N seconds")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not args.no_preload:
+        preload_model()
+
+    # Everything allocated so far lives as long as the workers; keeping it out
+    # of the collector's generations stops GC passes from dirtying shared pages
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    workers = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(sock, args)
+            finally:
+                os._exit(0)
+        workers.append(pid)
+    print(f"Started {len(workers)} workers on {args.host}:{args.port}: {workers}")
+
+    def stop(signum, frame):
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    alive = set(workers)
+    next_report = time.monotonic() + args.report_interval
+    while alive:
+        pid, _ = os.waitpid(-1, os.WNOHANG)
+        if pid:
+            alive.discard(pid)
+            continue
+        if args.report_interval and time.monotonic() >= next_report:
+            print(memory_report([os.getpid()] + sorted(alive)), flush=True)
+            next_report = time.monotonic() + args.report_interval
+        time.sleep(0.5)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Session verification while Clerk's JWKS endpoint is unreachable
+"""
+
+import httpx
+import pytest
+
+from auth.jwks import InvalidSessionToken, JWKSCache, SessionVerifier, SigningKeysUnavailable
+from auth.local_jwks import LocalJWKS
+
+
+class FlakyJWKS:
+    """
+    Serves a key set over an httpx mock transport that can be switched off
+    """
+
+    def __init__(self, key_set):
+        self.key_set = key_set
+        self.up = True
+        self.requests = 0
+        self.client = httpx.Client(transport=httpx.MockTransport(self.handle))
+
+    def handle(self, request):
+        self.requests += 1
+        if not self.up:
+            raise httpx.ConnectError("JWKS endpoint unreachable", request=request)
+        return httpx.Response(200, json=self.key_set())
+
+    def __call__(self):
+        response = self.client.get("https://clerk.test/.well-known/jwks.json")
+        response.raise_for_status()
+        return response.json()
+
+
+def test_unreachable_jwks_is_throttled_and_rejected():
+    old, rotated = LocalJWKS(kid="old"), LocalJWKS(kid="rotated")
+    endpoint = FlakyJWKS(old)
+    cache = JWKSCache(fetch_keys=endpoint, min_refetch_interval=30)
+    verifier = SessionVerifier(cache)
+    cache.refresh()
+    assert verifier.verify(old.issue_token())["sub"] == "user_local_test"
+
+    # A token signed with an unknown kid makes one fetch attempt, which fails
+    endpoint.up = False
+    cache._last_fetch -= 60
+    with pytest.raises(SigningKeysUnavailable):
+        verifier.verify(rotated.issue_token())
+    assert endpoint.requests == 2
+    assert cache.stats()["refresh_failures_total"] == 1
+
+    # Within min_refetch_interval nothing is fetched again, and known keys still verify
+    for _ in range(5):
+        with pytest.raises(InvalidSessionToken):
+            verifier.verify(rotated.issue_token())
+    assert endpoint.requests == 2
+    assert verifier.verify(old.issue_token(sub="other"))["sub"] == "other"
+
+
+def test_start_without_jwks():
+    endpoint = FlakyJWKS(LocalJWKS())
+    endpoint.up = False
+    cache = JWKSCache(fetch_keys=endpoint, refresh_interval=3600)
+    cache.start()
+    cache.stop()
+    with pytest.raises(SigningKeysUnavailable):
+        SessionVerifier(cache).verify(LocalJWKS().issue_token())
+    assert endpoint.requests == 1
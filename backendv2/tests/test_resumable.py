@@ -0,0 +1,77 @@
+"""
+Resumable uploads against the in-memory Mongo of the load-test harness
+"""
+
+import asyncio
+import base64
+import hashlib
+
+import pytest
+
+import resumable
+from loadtest.memory_mongo import InMemoryClient
+
+
+def checksum(data):
+    return "sha256 " + base64.b64encode(hashlib.sha256(data).digest()).decode()
+
+
+def send(sessions, upload_id, offset, data):
+    async def body():
+        yield data
+    return asyncio.run(resumable.write_chunk(sessions, upload_id, offset, checksum(data), body()))
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "uploads").mkdir()
+    return InMemoryClient()["test"]["upload_sessions"]
+
+
+def test_upload_in_chunks(sessions, tmp_path):
+    data = bytes(range(256)) * 40
+    session = resumable.create_session(sessions, "scan.png", len(data), {}, checksum(data))
+    offset = 0
+    for start in range(0, len(data), 4096):
+        offset = send(sessions, session["_id"], offset, data[start:start + 4096])
+    assert offset == len(data)
+
+    destination = tmp_path / "uploads" / "scan.png"
+    resumable.finalize_session(sessions, session["_id"], str(destination))
+    assert destination.read_bytes() == data
+
+
+def test_bad_chunk_is_not_acknowledged(sessions):
+    session = resumable.create_session(sessions, "scan.png", 100, {})
+
+    async def body():
+        yield b"x" * 50
+    with pytest.raises(resumable.UploadError) as error:
+        asyncio.run(resumable.write_chunk(sessions, session["_id"], 0, checksum(b"y" * 50), body()))
+    assert error.value.status_code == 460
+    assert resumable.get_session(sessions, session["_id"])["offset"] == 0
+
+
+def test_corrupted_file_restarts_from_zero(sessions, tmp_path):
+    data = b"brain scan bytes" * 1000
+    corrupted = data[:5000] + b"?" + data[5001:]
+    session = resumable.create_session(sessions, "scan.png", len(data), {}, checksum(data))
+    upload_id = session["_id"]
+
+    # Every chunk matches its own checksum, but the file as a whole is wrong
+    assert send(sessions, upload_id, 0, corrupted) == len(data)
+    destination = tmp_path / "uploads" / "scan.png"
+    with pytest.raises(resumable.UploadError) as error:
+        resumable.finalize_session(sessions, upload_id, str(destination))
+    assert error.value.status_code == 460
+    assert error.value.offset == 0
+    assert not destination.exists()
+
+    # The session reopens at 0, so the client can send the file again and finish
+    reopened = resumable.get_session(sessions, upload_id)
+    assert (reopened["offset"], reopened["status"]) == (0, "uploading")
+    assert send(sessions, upload_id, 0, data[:8000]) == 8000
+    assert send(sessions, upload_id, 8000, data[8000:]) == len(data)
+    resumable.finalize_session(sessions, upload_id, str(destination))
+    assert destination.read_bytes() == data
@@ -1,18 +1,38 @@
+import json
+import sys
+
 from brainrender import Scene
 from brainrender.actors import Points
 import numpy as np
 
 
+def tumor_from_scan(scan_path, atlas):
+    """
+    Tumor position (microns) and radius from a scan's details as returned by
+    GET /api/scans/{id}; tumorCoordinates holds fractions of the brain's extent
+    """
+    with open(scan_path) as f:
+        viewer = json.load(f).get("tumorCoordinates")
+    if not viewer:
+        return None, None
+    extent = np.array(atlas.shape) * np.array(atlas.resolution)
+    coords = np.array([viewer["normalized"]]) * extent
+    return coords, viewer["radius"] * extent[2]
+
+
 # Initialize scene with Allen Mouse Brain Atlas
 scene = Scene(atlas_name="allen_mouse_25um", title="3D Brain Viewer")
 
-tumor_coords = np.array([[200, 50, 150]])
+# Usage: python brainrender_practice.py [scan.json]
+tumor_coords, tumor_radius = tumor_from_scan(sys.argv[1], scene.atlas) if len(sys.argv) > 1 else (None, None)
+if tumor_coords is None:
+    tumor_coords, tumor_radius = np.array([[200, 50, 150]]), 150
 
 tumors = Points(
     tumor_coords, 
     name="Tumors",
     colors="darkred", 
-    radius=150,  # Adjust based on tumor size
+    radius=tumor_radius,
     alpha=0.7
 )
 scene.add(tumors)
@@ -1,24 +1,43 @@
+import argparse
+import threading
+import time
+from contextlib import contextmanager
+
 from brainrender import Scene
-from leap.connection import Connection, Listener
-from leap.events import TrackingEvent
 import vedo
 import numpy as np
-import time
+
+from tracking import FrameStats, HandPose, OneEuroFilter, TrackingRecorder, TrackingReplayer
+
+# The Leap SDK is only needed with a physical device; replays work without it
+try:
+    from leap.connection import Connection, Listener
+    from leap.events import TrackingEvent
+except ImportError:
+    Connection = None
+    Listener = object
+    TrackingEvent = None
 
 # Configure vedo for VTK interaction
 vedo.settings.default_backend = 'vtk'
 vedo.settings.use_parallel_projection = True
-vedo.settings.immediate_rendering = False 
+vedo.settings.immediate_rendering = False
 
 class LeapController(Listener):
-    def __init__(self, scene):
+    def __init__(self, scene, recorder=None):
         super().__init__()
         self.scene = scene
         self.base_azimuth = 45
         self.base_elevation = 30
         self.sensitivity = 0.5
-        self.last_update = time.time()
-        
+        self.recorder = recorder
+        self.stats = FrameStats()
+
+        # Latest filtered pose, written by the tracking thread and consumed by the render timer
+        self.filter = OneEuroFilter(min_cutoff=1.0, beta=0.01)
+        self._pose_lock = threading.Lock()
+        self._pending_pose = None
+
         # Initialize camera parameters properly
         self.scene.camera = {
             'azimuth': self.base_azimuth,
@@ -29,9 +48,26 @@ class LeapController(Listener):
 
     def on_event(self, event):
         if isinstance(event, TrackingEvent) and event.hands:
-            if time.time() - self.last_update > 0.016:  # ~60Hz update rate
-                self.update_camera(event.hands[0].palm.position)
-                self.last_update = time.time()
+            palm = event.hands[0].palm.position
+            self.on_pose(time.perf_counter(), (palm.x, palm.y, palm.z))
+
+    def on_pose(self, timestamp, position):
+        """Store the latest filtered pose; rendering happens on the render timer"""
+        if self.recorder is not None:
+            self.recorder.record(timestamp, position)
+        x, y, z = self.filter(timestamp, position)
+        with self._pose_lock:
+            self._pending_pose = HandPose(timestamp, x, y, z)
+
+    def on_render_timer(self, caller, event):
+        """Apply at most one pose per frame, dropping any that arrived in between"""
+        with self._pose_lock:
+            pose, self._pending_pose = self._pending_pose, None
+        if pose is None:
+            return
+        self.update_camera(pose)
+        caller.Render()
+        self.stats.add(pose.timestamp)
 
     def update_camera(self, position):
         """Convert Leap Motion coordinates to camera controls"""
@@ -44,10 +80,17 @@ class LeapController(Listener):
         self.scene.camera['elevation'] = self.base_elevation + np.clip(delta_y, -90, 90)
         self.scene.camera['roll'] = np.clip(delta_z, -180, 180)
         self.scene.camera['view_distance'] = 50 + np.clip(delta_z * 5, 10, 200)
-        
-        # Trigger render update through VTK interactor
-        if hasattr(self.scene.plotter, 'interactor'):
-            self.scene.plotter.interactor.Render()
+
+
+parser = argparse.ArgumentParser(description="Leap Motion Brain Viewer")
+parser.add_argument("--fps", type=int, default=60, help="Fixed render rate")
+parser.add_argument("--record", help="Record the tracking stream to this JSON lines file")
+parser.add_argument("--replay", help="Replay a recorded tracking stream instead of using the device")
+parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier")
+args = parser.parse_args()
+
+if args.replay is None and Connection is None:
+    raise SystemExit("Leap SDK not found: install it or use --replay with a recorded stream")
 
 # Initialize brain scene
 scene = Scene(atlas_name="allen_mouse_25um", title="Leap Motion Controller")
@@ -58,27 +101,43 @@ scene.add_brain_region("Isocortex", color="skyblue")
 scene.plotter.renderer.GetRenderWindow().SetMultiSamples(8)  # Anti-aliasing
 scene.plotter.renderer.GetRenderWindow().SetSwapControl(1)   # VSync
 
-# Set up Leap Motion
-leap_controller = LeapController(scene)
-conn = Connection(listeners=[leap_controller])
-
-with conn.open(auto_poll=True):
-    scene.render(interactive=False)  # Disable default mouse controls
-    
-    # Get VTK interactor reference
-    interactor = scene.plotter.interactor
-    interactor.Initialize()
-    
-    # Configure window
-    scene.plotter.renderWindow.SetWindowName("Leap Motion Brain Viewer")
-    
-    print("Use your hands to control the brain view!")
-    print("Move horizontally to rotate, vertically to elevate, forward/back to zoom")
-
-    # Main rendering loop (from VTK forum solution)
-    scene.plotter.renderWindow.Start()
-    while True:
-        if not scene.plotter.renderWindow.IsActive():
-            break
-        interactor.ProcessEvents()  # Handle VTK events
-        time.sleep(0.001)  # Reduce CPU load
+# Set up the tracking source
+recorder = TrackingRecorder(args.record) if args.record else None
+leap_controller = LeapController(scene, recorder=recorder)
+
+@contextmanager
+def tracking_source():
+    """Feed poses from the device, or from a recorded stream when replaying"""
+    if args.replay:
+        replayer = TrackingReplayer(args.replay, leap_controller.on_pose, speed=args.speed)
+        replayer.start()
+        try:
+            yield
+        finally:
+            replayer.stop()
+    else:
+        with Connection(listeners=[leap_controller]).open(auto_poll=True):
+            yield
+
+try:
+    with tracking_source():
+        scene.render(interactive=False)  # Disable default mouse controls
+
+        # Get VTK interactor reference
+        interactor = scene.plotter.interactor
+        interactor.Initialize()
+
+        # Configure window
+        scene.plotter.renderWindow.SetWindowName("Leap Motion Brain Viewer")
+
+        print("Use your hands to control the brain view!")
+        print("Move horizontally to rotate, vertically to elevate, forward/back to zoom")
+
+        # Render on a fixed-rate timer; the VTK event loop sleeps between events instead of busy-polling
+        interactor.AddObserver("TimerEvent", leap_controller.on_render_timer)
+        interactor.CreateRepeatingTimer(max(1, int(1000 / args.fps)))
+        interactor.Start()
+finally:
+    if recorder is not None:
+        recorder.close()
+    print(leap_controller.stats.summary())
@@ -0,0 +1,156 @@
+"""
+Tracking stream utilities for the Leap Motion viewer: pose smoothing,
+recording/replaying tracking sessions and frame latency statistics.
+"""
+
+import json
+import math
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Palm position of the tracked hand, timestamped with time.perf_counter()
+HandPose = namedtuple("HandPose", ["timestamp", "x", "y", "z"])
+
+
+class OneEuroFilter:
+    """
+    One Euro filter (Casiez et al. 2012) for noisy positions.
+
+    Smooths heavily while the hand is still and lowers the smoothing as it
+    moves faster, so jitter goes away without adding lag to fast gestures.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.007, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self._last_time = None
+        self._last_value = None
+        self._last_derivative = None
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, timestamp, value):
+        value = np.asarray(value, dtype=np.float64)
+        if self._last_time is None:
+            self._last_time = timestamp
+            self._last_value = value
+            self._last_derivative = np.zeros_like(value)
+            return value
+
+        dt = max(timestamp - self._last_time, 1e-6)
+
+        # Smoothed speed drives the cutoff of the position filter
+        derivative = (value - self._last_value) / dt
+        a_d = self._alpha(self.d_cutoff, dt)
+        derivative = a_d * derivative + (1 - a_d) * self._last_derivative
+
+        cutoff = self.min_cutoff + self.beta * np.abs(derivative)
+        a = self._alpha(cutoff, dt)
+        filtered = a * value + (1 - a) * self._last_value
+
+        self._last_time = timestamp
+        self._last_value = filtered
+        self._last_derivative = derivative
+        return filtered
+
+
+class TrackingRecorder:
+    """
+    Writes raw palm positions to a JSON lines file, one sample per line
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "w")
+        self._start = None
+        self._lock = threading.Lock()
+
+    def record(self, timestamp, position):
+        with self._lock:
+            if self._start is None:
+                self._start = timestamp
+            sample = {"t": timestamp - self._start, "x": position[0], "y": position[1], "z": position[2]}
+            self._file.write(json.dumps(sample) + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TrackingReplayer:
+    """
+    Replays a recorded tracking stream on a background thread, calling
+    callback(timestamp, position) with the recorded timing so the viewer can
+    be benchmarked without a physical device.
+    """
+
+    def __init__(self, path, callback, speed=1.0, loop=False):
+        with open(path) as f:
+            self.samples = [json.loads(line) for line in f if line.strip()]
+        self.callback = callback
+        self.speed = speed
+        self.loop = loop
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def finished(self):
+        return not self._thread.is_alive()
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            for sample in self.samples:
+                # Sleep until the sample is due instead of spinning
+                due = start + sample["t"] / self.speed
+                if self._stop.wait(max(due - time.perf_counter(), 0)):
+                    return
+                self.callback(time.perf_counter(), (sample["x"], sample["y"], sample["z"]))
+            if not self.loop:
+                return
+
+
+class FrameStats:
+    """
+    Collects pose-to-frame latency and process CPU usage for a viewer session
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def add(self, pose_timestamp):
+        self.latencies.append(time.perf_counter() - pose_timestamp)
+
+    def summary(self):
+        wall = time.perf_counter() - self._wall_start
+        cpu = time.process_time() - self._cpu_start
+        latencies_ms = np.array(self.latencies) * 1000
+        summary = {
+            "frames": len(latencies_ms),
+            "fps": len(latencies_ms) / wall if wall > 0 else 0.0,
+            "cpu_percent": 100 * cpu / wall if wall > 0 else 0.0,
+        }
+        if len(latencies_ms):
+            p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+            summary.update({"latency_p50_ms": p50, "latency_p95_ms": p95, "latency_p99_ms": p99})
+        return summary
@@ -1,23 +1,10 @@
-import random
-
-import numpy as np
+import sys
 
 from brainrender import Scene
 from brainrender.actors import Points
 
-def get_n_random_points_in_region(region, N):
-    """
-    Gets N random points inside (or on the surface) of a mesh
-    """
-
-    region_bounds = region.mesh.bounds()
-    X = np.random.randint(region_bounds[0], region_bounds[1], size=10000)
-    Y = np.random.randint(region_bounds[2], region_bounds[3], size=10000)
-    Z = np.random.randint(region_bounds[4], region_bounds[5], size=10000)
-    pts = [[x, y, z] for x, y, z in zip(X, Y, Z)]
-
-    ipts = region.mesh.inside_points(pts).coordinates
-    return np.vstack(random.choices(ipts, k=N))
+from pointcloud import PointCloud
+from sampling import get_n_random_points_in_region
 
 
 # Display the Allen Brain mouse atlas.
@@ -26,11 +13,16 @@ scene = Scene(atlas_name="allen_mouse_25um", title="Cells in primary visual cort
 # Display a brain region
 primary_visual = scene.add_brain_region("VISp", alpha=0.2)
 
-# Get a numpy array with (fake) coordinates of some labelled cells
-coordinates = get_n_random_points_in_region(primary_visual, 2000)
+if len(sys.argv) > 1:
+    # Large populations: stream coordinates from a .npy file into a level-of-detail point cloud
+    cells = PointCloud.from_file(sys.argv[1], name="Cells")
+    cells.attach(scene)
+else:
+    # Get a numpy array with (fake) coordinates of some labelled cells
+    coordinates = get_n_random_points_in_region(scene.atlas, primary_visual, 2000)
 
-# Create a Points actor
-cells = Points(coordinates)
+    # Create a Points actor
+    cells = Points(coordinates)
 
 # Add to scene
 scene.add(cells)
@@ -41,4 +33,8 @@ scene.add_label(primary_visual, "Primary visual cortex")
 # Display the figure.
 # scene.render()
 
+# Bound the exported point count by the current level of detail
+if isinstance(cells, PointCloud):
+    cells.update_lod(scene.plotter.camera.GetPosition())
+
 scene.export("cells_in_primary_visual_cortex.html")
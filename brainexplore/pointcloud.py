@@ -0,0 +1,180 @@
+import numpy as np
+import vedo
+from brainrender.actor import Actor
+
+
+def iter_coordinate_chunks(path, chunk_size=1_000_000):
+    """
+    Streams an on-disk (N, 3) coordinates array in chunks without loading it all.
+    """
+    coordinates = np.load(path, mmap_mode="r")
+    for start in range(0, len(coordinates), chunk_size):
+        yield np.asarray(coordinates[start:start + chunk_size], dtype=np.float32)
+
+
+def get_chunked_bounds(path, chunk_size=1_000_000):
+    """
+    Bounds of an on-disk coordinates array as [xmin, xmax, ymin, ymax, zmin, zmax]
+    """
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    for chunk in iter_coordinate_chunks(path, chunk_size):
+        lo = np.minimum(lo, chunk.min(axis=0))
+        hi = np.maximum(hi, chunk.max(axis=0))
+    return np.stack([lo, hi], axis=1).ravel()
+
+
+class PointOctree:
+    """
+    Level-of-detail octree over a point cloud.
+
+    Each occupied leaf cell keeps a single representative point, so a cloud
+    of any size is reduced to at most 8 ** max_depth points. Every kept point
+    also records the shallowest depth at which it represents its cell, which
+    lets coarse views draw only the first few levels of the tree.
+    """
+
+    def __init__(self, bounds, max_depth=7):
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(3, 2)
+        self.origin = bounds[:, 0]
+        # Use a cube so cells stay isotropic
+        self.size = max(float((bounds[:, 1] - bounds[:, 0]).max()), 1e-6)
+        self.max_depth = max_depth
+
+        self.points = np.empty((0, 3), dtype=np.float32)
+        self.levels = np.empty(0, dtype=np.int8)
+        # Sorted keys of occupied cells at each depth
+        self._cells = [np.empty(0, dtype=np.int64) for _ in range(max_depth + 1)]
+
+    def _cell_keys(self, points, depth):
+        n = 1 << depth
+        ijk = ((points - self.origin) / self.size * n).astype(np.int64)
+        ijk = np.clip(ijk, 0, n - 1)
+        return (ijk[:, 0] * n + ijk[:, 1]) * n + ijk[:, 2]
+
+    def insert(self, points):
+        """
+        Adds a chunk of points, keeping only those that land in an empty leaf cell
+        """
+        points = np.asarray(points, dtype=np.float32)
+        if not len(points):
+            return
+
+        # One point per newly occupied leaf cell
+        leaf_keys = self._cell_keys(points, self.max_depth)
+        leaf_keys, first = np.unique(leaf_keys, return_index=True)
+        is_new = ~np.isin(leaf_keys, self._cells[self.max_depth], assume_unique=True)
+        points = points[np.sort(first[is_new])]
+        if not len(points):
+            return
+
+        # A point's level is the shallowest depth at which it is the first in its cell
+        levels = np.full(len(points), self.max_depth, dtype=np.int8)
+        unassigned = np.ones(len(points), dtype=bool)
+        for depth in range(self.max_depth + 1):
+            keys = self._cell_keys(points, depth)
+            unique_keys, first = np.unique(keys, return_index=True)
+            is_new = ~np.isin(unique_keys, self._cells[depth], assume_unique=True)
+
+            owners = first[is_new]
+            owners = owners[unassigned[owners]]
+            levels[owners] = depth
+            unassigned[owners] = False
+
+            self._cells[depth] = np.union1d(self._cells[depth], unique_keys)
+
+        self.points = np.concatenate([self.points, points])
+        self.levels = np.concatenate([self.levels, levels])
+
+    @classmethod
+    def from_file(cls, path, bounds=None, max_depth=7, chunk_size=1_000_000):
+        """
+        Builds an octree by streaming coordinates from a .npy file
+        """
+        if bounds is None:
+            bounds = get_chunked_bounds(path, chunk_size)
+        octree = cls(bounds, max_depth=max_depth)
+        for chunk in iter_coordinate_chunks(path, chunk_size):
+            octree.insert(chunk)
+        return octree
+
+    def select(self, camera_position, lod_factor=0.02, max_points=200_000):
+        """
+        Points to draw from a given camera position.
+
+        A level is drawn while its cells, seen from the camera, are larger than
+        lod_factor (cell size / distance), so distant parts of the cloud are
+        thinned more aggressively than nearby ones.
+        """
+        distance = np.linalg.norm(self.points - np.asarray(camera_position), axis=1)
+        distance = np.maximum(distance, 1e-6)
+        allowed = np.floor(np.log2(self.size / (distance * lod_factor)))
+        visible = np.flatnonzero(self.levels <= allowed)
+
+        if len(visible) > max_points:
+            # Keep the coarsest levels so the whole cloud stays covered
+            order = np.argsort(self.levels[visible], kind="stable")
+            visible = visible[order[:max_points]]
+        return self.points[visible]
+
+
+class PointCloud(Actor):
+    """
+    Renders a large population of cells as point sprites, with level-of-detail
+    thinning driven by an octree instead of one sphere mesh per cell.
+    """
+
+    def __init__(
+        self,
+        octree,
+        name=None,
+        colors="salmon",
+        alpha=1,
+        point_size=6,
+        lod_factor=0.02,
+        max_points=200_000,
+    ):
+        self.octree = octree
+        self.name = name or "PointCloud"
+        self.lod_factor = lod_factor
+        self.max_points = max_points
+        self._last_camera_position = None
+
+        # Start from the coarsest view until a camera is available
+        initial = octree.points[octree.levels <= 2]
+        mesh = vedo.Points(initial, r=point_size, c=colors, alpha=alpha)
+        mesh.render_points_as_spheres(True)
+
+        Actor.__init__(self, mesh, name=self.name, br_class="PointCloud")
+
+    @classmethod
+    def from_file(cls, path, bounds=None, max_depth=7, chunk_size=1_000_000, **kwargs):
+        return cls(
+            PointOctree.from_file(path, bounds=bounds, max_depth=max_depth, chunk_size=chunk_size),
+            **kwargs,
+        )
+
+    def update_lod(self, camera_position):
+        """
+        Swaps in the subset of points to draw from camera_position
+        """
+        subset = self.octree.select(camera_position, self.lod_factor, self.max_points)
+        self.mesh.dataset.DeepCopy(vedo.Points(subset).dataset)
+        self.mesh.dataset.Modified()
+        self._last_camera_position = np.asarray(camera_position, dtype=np.float64)
+
+    def attach(self, scene, min_move=0.01):
+        """
+        Refreshes the level of detail before each frame whenever the camera
+        has moved more than min_move (as a fraction of the cloud size).
+        """
+        renderer = scene.plotter.renderer
+        threshold = min_move * self.octree.size
+
+        def on_render_start(caller, event):
+            position = np.asarray(renderer.GetActiveCamera().GetPosition())
+            last = self._last_camera_position
+            if last is None or np.linalg.norm(position - last) > threshold:
+                self.update_lod(position)
+
+        renderer.AddObserver("StartEvent", on_render_start)
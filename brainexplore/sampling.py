@@ -0,0 +1,80 @@
+import numpy as np
+
+
+def get_region_voxel_mask(atlas, acronym):
+    """
+    Boolean voxel mask of a brain region (including all of its sub-regions),
+    cropped to the region's bounding box.
+
+    Returns the cropped mask and the voxel offset of its first corner.
+    """
+    structure_ids = [atlas.structures[acronym]["id"]]
+    structure_ids += [
+        atlas.structures[child]["id"]
+        for child in atlas.get_structure_descendants(acronym)
+    ]
+
+    mask = np.isin(atlas.annotation, structure_ids)
+    if not mask.any():
+        raise ValueError(f"Region {acronym} has no voxels in the annotation volume")
+
+    # Crop to the bounding box so lookups and memory scale with the region, not the atlas
+    lo, hi = [], []
+    for axis in range(3):
+        other_axes = tuple(a for a in range(3) if a != axis)
+        occupied = np.flatnonzero(mask.any(axis=other_axes))
+        lo.append(occupied[0])
+        hi.append(occupied[-1] + 1)
+
+    cropped = mask[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]]
+    return np.ascontiguousarray(cropped), np.array(lo)
+
+
+def get_n_random_points_in_region(atlas, region, N, seed=None, max_batch=5_000_000):
+    """
+    Gets N unique random points (integer micron coordinates) inside a brain region.
+
+    Candidate points are drawn uniformly inside the region's bounding box and
+    tested against the atlas annotation volume, so each inside test is a
+    single array lookup instead of a mesh query. Batch sizes adapt to the
+    observed acceptance rate so that large N only needs a few passes.
+    """
+    acronym = region if isinstance(region, str) else region.name
+    mask, offset = get_region_voxel_mask(atlas, acronym)
+    resolution = np.asarray(atlas.resolution, dtype=np.float64)
+
+    # Integer micron grid spanned by the bounding box
+    origin = np.floor(offset * resolution).astype(np.int64)
+    extent = np.ceil(np.array(mask.shape) * resolution).astype(np.int64)
+
+    capacity = int(mask.sum() * np.prod(resolution))
+    if N > capacity:
+        raise ValueError(f"Cannot sample {N} unique points from {acronym}, it only holds ~{capacity}")
+
+    rng = np.random.default_rng(seed)
+    acceptance = max(mask.mean(), 1e-6)
+    keys = np.empty(0, dtype=np.int64)
+
+    while keys.size < N:
+        remaining = N - keys.size
+        # Oversample slightly so that a single pass is usually enough
+        batch = int(min(max_batch, np.ceil(remaining / acceptance * 1.1) + 1024))
+
+        local = (rng.random((batch, 3)) * extent).astype(np.int64)
+        voxels = (local / resolution).astype(np.int64)
+        voxels = np.minimum(voxels, np.array(mask.shape) - 1)
+        inside = mask[voxels[:, 0], voxels[:, 1], voxels[:, 2]]
+        local = local[inside]
+
+        # Linear key on the micron grid makes duplicate removal a single np.unique
+        new_keys = np.ravel_multi_index(local.T, extent)
+        merged = np.unique(np.concatenate([keys, new_keys]))
+
+        gained = merged.size - keys.size
+        acceptance = max(gained / batch, 1e-6)
+        keys = merged
+
+    # np.unique sorts spatially, so pick the final subset at random
+    keys = rng.choice(keys, size=N, replace=False)
+    local = np.stack(np.unravel_index(keys, extent), axis=1)
+    return local + origin
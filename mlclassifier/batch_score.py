@@ -0,0 +1,332 @@
+"""
+Offline batch scoring of image archives with the fine-tuned ResNet-18.
+
+Walks a directory tree (or reads a manifest of paths), decodes images in
+parallel worker processes, runs batched forward passes and streams one
+row per image to Parquet: path, predicted class, class probabilities and
+optionally the 512-d embedding and a Grad-CAM heatmap PNG.
+
+Output goes to <output>/part-NNNNN.parquet. A part is written under a
+temporary name and renamed once it reaches --rows-per-part rows or has
+been open --commit-every seconds, so after an interruption only complete
+parts exist and at most that much work is lost; rerunning the same
+command skips every path they contain and carries on. Throughput is
+printed as it runs.
+
+Usage:
+    python batch_score.py <image_directory> --checkpoint resnet18_finetuned.pth --output scores/
+    python batch_score.py --manifest archive.txt --checkpoint model_v2.pth --output scores_v2/ --embeddings --gradcam
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+from torchvision import models
+
+from packed_dataset import decode_image, label_map, mean, std
+
+labels = sorted(label_map, key=label_map.get)
+image_extensions = ('.png', '.jpg', '.jpeg')
+
+
+def list_directory(root):
+    """
+    Image paths under root, in a stable order
+    """
+    paths = []
+    for directory, subdirectories, file_names in os.walk(root):
+        subdirectories.sort()
+        for file_name in sorted(file_names):
+            if file_name.lower().endswith(image_extensions):
+                paths.append(os.path.join(directory, file_name))
+    return paths
+
+
+def read_manifest(manifest):
+    """
+    Paths from a text file (one per line) or a CSV file with a 'path' column
+    """
+    with open(manifest, newline='') as f:
+        if manifest.endswith('.csv'):
+            return [row['path'] for row in csv.DictReader(f) if row.get('path')]
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def checkpoint_version(path):
+    """
+    File name plus the start of its SHA-256, the same scheme the API records as modelVersion
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return f"{os.path.splitext(os.path.basename(path))[0]}@{digest.hexdigest()[:12]}"
+
+
+def load_model(checkpoint, device):
+    model = models.resnet18()
+    num_ftrs = model.fc.in_features
+    model.fc = nn.Sequential(
+        nn.Linear(num_ftrs, 512),
+        nn.ReLU(),
+        nn.Dropout(0.5),
+        nn.Linear(512, 4)
+    )
+    model.load_state_dict(torch.load(checkpoint, map_location=device, weights_only=True))
+    model.requires_grad_(False)
+    model.to(device)
+    model.eval()
+    return model
+
+
+def safe_decode(path):
+    """
+    (path, uint8 CHW array or None, error); runs in the worker processes
+    """
+    try:
+        return path, decode_image(path), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def output_schema(embeddings, gradcam):
+    fields = [('path', pa.string()), ('predicted_class', pa.string())]
+    fields += [(f'probability_{label}', pa.float32()) for label in labels]
+    if embeddings:
+        fields.append(('embedding', pa.list_(pa.float32())))
+    if gradcam:
+        fields.append(('cam_path', pa.string()))
+    fields += [('model_version', pa.string()), ('error', pa.string()), ('scored_at', pa.timestamp('ms'))]
+    return pa.schema(fields)
+
+
+def completed_paths(output):
+    """
+    Paths already scored in complete parts, and the next part number
+    """
+    parts = sorted(glob.glob(os.path.join(output, 'part-*.parquet')))
+    done = set()
+    for part in parts:
+        done.update(pq.read_table(part, columns=['path']).column('path').to_pylist())
+    return done, len(parts)
+
+
+class Scorer:
+    """
+    Batched forward passes, with the pooled features and optionally
+    Grad-CAM maps for the predicted class taken from the same pass
+    """
+
+    def __init__(self, model, device, gradcam=False):
+        self.device = device
+        self.gradcam = gradcam
+        self.head = model.fc
+        model.fc = nn.Identity()
+        self.trunk = model
+        self.mean = torch.tensor(mean, device=device).view(1, 3, 1, 1) * 255
+        self.std = torch.tensor(std, device=device).view(1, 3, 1, 1) * 255
+        self.activations = None
+        if gradcam:
+            model.layer4[-1].register_forward_hook(lambda module, input, output: setattr(self, 'activations', output))
+
+    def score(self, images):
+        """
+        images: uint8 (B, 3, H, W). Returns probabilities, embeddings and CAMs (or None) as numpy
+        """
+        batch = torch.from_numpy(images).to(self.device).float().sub_(self.mean).div_(self.std)
+        if not self.gradcam:
+            with torch.no_grad():
+                features = self.trunk(batch)
+                logits = self.head(features)
+            return torch.softmax(logits, dim=1).cpu().numpy(), features.cpu().numpy(), None
+
+        # The weights are frozen, so the graph is rooted at the input
+        batch.requires_grad_()
+        features = self.trunk(batch)
+        logits = self.head(features)
+        predicted = logits.argmax(dim=1)
+        # Images don't interact in eval mode, so one backward gives every image's gradient
+        gradients = torch.autograd.grad(logits[torch.arange(len(logits)), predicted].sum(), self.activations)[0]
+        weights = gradients.mean(dim=(2, 3), keepdim=True)
+        cams = F.relu((weights * self.activations).sum(dim=1, keepdim=True))
+        cams = F.interpolate(cams, size=images.shape[2:], mode='bilinear', align_corners=False)[:, 0]
+        cams = cams - cams.amin(dim=(1, 2), keepdim=True)
+        cams = cams / cams.amax(dim=(1, 2), keepdim=True).clamp_min(1e-8)
+        return (torch.softmax(logits.detach(), dim=1).cpu().numpy(), features.detach().cpu().numpy(),
+                cams.detach().cpu().numpy())
+
+
+def cam_file(cam_directory, path, root):
+    relative = os.path.relpath(path, root) if root else path.lstrip(os.sep)
+    return os.path.join(cam_directory, os.path.splitext(relative)[0] + '_cam.png')
+
+
+class PartWriter:
+    """
+    Writes rows to numbered Parquet parts, each renamed into place once it
+    has rows_per_part rows or has been open commit_seconds
+    """
+
+    def __init__(self, output, schema, first_part, rows_per_part, commit_seconds=60.0):
+        self.output = output
+        self.schema = schema
+        self.part = first_part
+        self.rows_per_part = rows_per_part
+        self.commit_seconds = commit_seconds
+        self.writer = None
+        self.rows = 0
+        self.opened_at = 0.0
+
+    def _path(self):
+        return os.path.join(self.output, f'part-{self.part:05d}.parquet')
+
+    def write(self, rows):
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self._path() + '.tmp', self.schema, compression='snappy')
+            self.opened_at = time.monotonic()
+        # Each batch becomes one row group, so memory is bounded by a batch
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+        self.rows += len(rows)
+        # Committing on a timer too bounds what a crash loses, however large the part target
+        if self.rows >= self.rows_per_part or time.monotonic() - self.opened_at >= self.commit_seconds:
+            self.close()
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self._path() + '.tmp', self._path())
+        self.writer = None
+        self.rows = 0
+        self.part += 1
+
+
+def score_archive(paths, args, root=None):
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    os.makedirs(args.output, exist_ok=True)
+    # Leftovers of an interrupted part; its paths are scored again
+    for leftover in glob.glob(os.path.join(args.output, 'part-*.parquet.tmp')):
+        os.remove(leftover)
+    done, next_part = completed_paths(args.output)
+    remaining = [path for path in paths if path not in done]
+    print(f"{len(paths)} images, {len(done)} already scored, {len(remaining)} to go")
+    if not remaining:
+        return
+
+    model_version = checkpoint_version(args.checkpoint)
+    scorer = Scorer(load_model(args.checkpoint, device), device, gradcam=args.gradcam)
+    writer = PartWriter(args.output, output_schema(args.embeddings, args.gradcam), next_part, args.rows_per_part,
+                        args.commit_every)
+
+    stats = {'images': 0, 'errors': 0, 'decode_wait': 0.0, 'forward': 0.0, 'write': 0.0}
+    started = last_report = time.perf_counter()
+
+    def flush(batch):
+        images = [item for item in batch if item[1] is not None]
+        rows = []
+        start = time.perf_counter()
+        if images:
+            probabilities, embeddings, cams = scorer.score(np.stack([image for _, image, _ in images]))
+        stats['forward'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        scored_at = datetime.utcnow()
+        for i, (path, _, _) in enumerate(images):
+            row = {
+                'path': path,
+                'predicted_class': labels[int(probabilities[i].argmax())],
+                'model_version': model_version,
+                'error': None,
+                'scored_at': scored_at,
+            }
+            for k, label in enumerate(labels):
+                row[f'probability_{label}'] = float(probabilities[i][k])
+            if args.embeddings:
+                row['embedding'] = embeddings[i].tolist()
+            if args.gradcam:
+                row['cam_path'] = cam_file(args.cam_dir, path, root)
+                os.makedirs(os.path.dirname(row['cam_path']), exist_ok=True)
+                Image.fromarray(np.uint8(255 * cams[i])).save(row['cam_path'])
+            rows.append(row)
+        for path, image, error in batch:
+            if image is None:
+                rows.append({'path': path, 'model_version': model_version, 'error': error, 'scored_at': scored_at})
+                stats['errors'] += 1
+        writer.write(rows)
+        stats['images'] += len(batch)
+        stats['write'] += time.perf_counter() - start
+
+    # Workers decode ahead of the model; imap keeps the input order
+    with Pool(args.workers) as pool:
+        batch = []
+        wait_start = time.perf_counter()
+        for item in pool.imap(safe_decode, remaining, chunksize=16):
+            stats['decode_wait'] += time.perf_counter() - wait_start
+            batch.append(item)
+            if len(batch) >= args.batch_size:
+                flush(batch)
+                batch = []
+            now = time.perf_counter()
+            if now - last_report >= args.report_every:
+                report(stats, now - started, len(remaining))
+                last_report = now
+            wait_start = time.perf_counter()
+        if batch:
+            flush(batch)
+    writer.close()
+    report(stats, time.perf_counter() - started, len(remaining), final=True)
+
+
+def report(stats, elapsed, total, final=False):
+    rate = stats['images'] / max(elapsed, 1e-9)
+    eta = (total - stats['images']) / rate if rate else 0
+    line = (f"{stats['images']}/{total} images, {rate:.1f} img/s, {stats['errors']} errors | "
+            f"waiting on decode {stats['decode_wait']:.1f}s, forward {stats['forward']:.1f}s, "
+            f"write {stats['write']:.1f}s")
+    print(("Done: " if final else "") + line + ("" if final else f", ETA {eta:.0f}s"), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score an image archive with the tumor classifier')
+    parser.add_argument('directory', nargs='?', help='Directory tree of images')
+    parser.add_argument('--manifest', help='Text file of paths, or CSV with a path column, instead of a directory')
+    parser.add_argument('--checkpoint', default='resnet18_finetuned.pth')
+    parser.add_argument('--output', required=True, help='Directory for the Parquet parts')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes (default: CPU count)')
+    parser.add_argument('--threads', type=int, default=0, help='Torch intra-op threads')
+    parser.add_argument('--rows-per-part', type=int, default=50000)
+    parser.add_argument('--commit-every', type=float, default=60.0,
+                        help='Seconds after which a part is committed even if it is short (0: every batch)')
+    parser.add_argument('--embeddings', action='store_true', help='Store the 512-d pooled features')
+    parser.add_argument('--gradcam', action='store_true', help='Write a Grad-CAM PNG per image')
+    parser.add_argument('--cam-dir', default=None, help='Where Grad-CAM PNGs go (default: <output>/cams)')
+    parser.add_argument('--report-every', type=float, default=10.0, help='Seconds between progress lines')
+    args = parser.parse_args()
+
+    if bool(args.directory) == bool(args.manifest):
+        parser.error('give either a directory or --manifest')
+    args.cam_dir = args.cam_dir or os.path.join(args.output, 'cams')
+    paths = list_directory(args.directory) if args.directory else read_manifest(args.manifest)
+    score_archive(paths, args, root=args.directory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Cached backbone features for the frozen first training phase.
+
+While every backbone parameter is frozen, the ResNet-18 trunk is a fixed
+function of the input image. Its 512-d pooled features are computed once
+per (image, augmentation pass) and the fc head is trained on the cached
+tensors, so each epoch only runs the head.
+"""
+
+import hashlib
+import os
+
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, TensorDataset
+
+
+def extract_features(model, loader, device, passes=1, seed=0):
+    """
+    Runs everything but model.fc over the loader `passes` times.
+
+    With an augmenting dataset every pass sees a different random
+    augmentation of each image; with a deterministic one use passes=1.
+    """
+    head = model.fc
+    model.fc = nn.Identity()
+    model.to(device)
+    # Eval mode: frozen BatchNorm statistics and no dropout in the trunk
+    model.eval()
+    torch.manual_seed(seed)
+
+    features, labels = [], []
+    try:
+        with torch.no_grad():
+            for _ in range(passes):
+                for images, targets in loader:
+                    features.append(model(images.to(device, non_blocking=True)).cpu())
+                    labels.append(targets)
+    finally:
+        model.fc = head
+    return torch.cat(features), torch.cat(labels)
+
+
+def trunk_fingerprint(model):
+    """
+    SHA-256 of every weight and buffer outside model.fc
+    """
+    digest = hashlib.sha256()
+    for name, tensor in sorted(model.state_dict().items()):
+        if name.startswith('fc.'):
+            continue
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+
+def cached_features(path, model, loader, device, passes=1, seed=0):
+    """
+    Loads features from path, extracting and saving them on first use.
+    The file records the trunk weights, passes, seed and dataset size it was
+    built from; if any of them differ it is rebuilt rather than reused.
+    """
+    key = {
+        'trunk': trunk_fingerprint(model),
+        'passes': passes,
+        'seed': seed,
+        'samples': len(loader.dataset),
+    }
+    if os.path.exists(path):
+        cache = torch.load(path)
+        if cache.get('key') == key:
+            return cache['features'], cache['labels']
+        print(f"Feature cache {path} was built with different settings, rebuilding")
+
+    features, labels = extract_features(model, loader, device, passes=passes, seed=seed)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    torch.save({'features': features, 'labels': labels, 'key': key}, path)
+    return features, labels
+
+
+def train_head(model, train_features, train_labels, val_features, val_labels, criterion, optimizer, num_epochs, name, batch_size=256):
+    """
+    Same loop as train_model in model.ipynb, but trains model.fc on cached
+    features. Saves the full model state dict so later phases can reload it.
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    head = model.fc
+
+    train_loader = DataLoader(TensorDataset(train_features, train_labels), batch_size=batch_size, shuffle=True)
+    val_loader = DataLoader(TensorDataset(val_features, val_labels), batch_size=batch_size, shuffle=False)
+
+    history = {'train_loss': [], 'train_acc': [], 'val_loss': [], 'val_acc': []}
+
+    for epoch in range(num_epochs):
+        # Training phase
+        head.train()
+        running_loss = 0.0
+        correct_train = 0
+        total_train = 0
+        for features, labels in train_loader:
+            features, labels = features.to(device), labels.to(device)
+            optimizer.zero_grad()
+            outputs = head(features)
+            loss = criterion(outputs, labels)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item()
+            _, predicted = torch.max(outputs, 1)
+            total_train += labels.size(0)
+            correct_train += (predicted == labels).sum().item()
+
+        train_loss = running_loss / len(train_loader)
+        train_acc = 100 * correct_train / total_train
+
+        # Validation phase
+        head.eval()
+        val_loss = 0.0
+        correct_val = 0
+        total_val = 0
+        with torch.no_grad():
+            for features, labels in val_loader:
+                features, labels = features.to(device), labels.to(device)
+                outputs = head(features)
+                loss = criterion(outputs, labels)
+                val_loss += loss.item()
+                _, predicted = torch.max(outputs, 1)
+                total_val += labels.size(0)
+                correct_val += (predicted == labels).sum().item()
+
+        val_loss = val_loss / len(val_loader)
+        val_acc = 100 * correct_val / total_val
+
+        history['train_loss'].append(train_loss)
+        history['train_acc'].append(train_acc)
+        history['val_loss'].append(val_loss)
+        history['val_acc'].append(val_acc)
+
+        print(f"Epoch [{epoch+1}/{num_epochs}]")
+        print(f"Train Loss: {train_loss:.4f}, Train Accuracy: {train_acc:.2f}%")
+        print(f"Val Loss: {val_loss:.4f}, Val Accuracy: {val_acc:.2f}%")
+        print("#" * 80)
+
+    torch.save(model.state_dict(), f'{name}.pth')
+
+    return history
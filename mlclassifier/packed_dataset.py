@@ -0,0 +1,157 @@
+"""
+Pre-decoded, memory-mapped image shards for training.
+
+The Kaggle Training/Testing folders are decoded and resized once into a
+uint8 (N, 3, 224, 224) array saved as .npy, next to a label array and a
+JSON index. PackedImageDataset then reads samples as zero-copy slices of
+the memory map and runs augmentation on tensors, so epochs no longer pay
+for JPEG decoding.
+
+Usage:
+    python packed_dataset.py <base_directory> <output_directory>
+"""
+
+import json
+import os
+import sys
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+import torch
+from torch.utils.data import Dataset
+import torchvision.transforms as transforms
+
+label_map = {
+    'notumor': 0,
+    'glioma': 1,
+    'meningioma': 2,
+    'pituitary': 3
+}
+target_size = (224, 224)
+mean = [0.485, 0.456, 0.406]
+std = [0.229, 0.224, 0.225]
+
+
+def list_images(split_directory):
+    """
+    Lists (file_path, label) pairs of a split folder in a stable order
+    """
+    samples = []
+    for category in sorted(os.listdir(split_directory)):
+        category_path = os.path.join(split_directory, category)
+        if category not in label_map or not os.path.isdir(category_path):
+            continue
+        for file_name in sorted(os.listdir(category_path)):
+            file_path = os.path.join(category_path, file_name)
+            # Ensure we're only adding image files
+            if os.path.isfile(file_path) and file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                samples.append((file_path, label_map[category]))
+    return samples
+
+
+def decode_image(file_path, size=target_size):
+    """
+    Decodes an image to a uint8 CHW array, resized like transforms.Resize(size)
+    """
+    img = Image.open(file_path).convert('RGB').resize(size[::-1], Image.BILINEAR)
+    return np.asarray(img, dtype=np.uint8).transpose(2, 0, 1)
+
+
+def pack_split(split_directory, output_directory, size=target_size, workers=None):
+    """
+    Decodes every image of a split once into <output_directory>/images.npy,
+    with labels.npy and index.json alongside it.
+    """
+    samples = list_images(split_directory)
+    os.makedirs(output_directory, exist_ok=True)
+
+    images = np.lib.format.open_memmap(
+        os.path.join(output_directory, 'images.npy'),
+        mode='w+',
+        dtype=np.uint8,
+        shape=(len(samples), 3, *size),
+    )
+    labels = np.array([label for _, label in samples], dtype=np.int64)
+
+    # Decode in parallel; results arrive in order and are written straight into the memmap
+    with Pool(workers) as pool:
+        decoded = pool.imap(partial(decode_image, size=size), [path for path, _ in samples], chunksize=32)
+        for i, image in enumerate(decoded):
+            images[i] = image
+    images.flush()
+    del images
+
+    np.save(os.path.join(output_directory, 'labels.npy'), labels)
+    with open(os.path.join(output_directory, 'index.json'), 'w') as f:
+        json.dump({
+            'size': list(size),
+            'label_map': label_map,
+            'counts': {name: int((labels == idx).sum()) for name, idx in label_map.items()},
+            'files': [path for path, _ in samples],
+        }, f)
+    return len(samples)
+
+
+class PackedImageDataset(Dataset):
+    """
+    Dataset over a packed split. Images are uint8 CHW tensors that share
+    memory with the memory map; transforms run on tensors.
+    """
+
+    def __init__(self, directory, transform=None, indices=None):
+        self.directory = directory
+        self.transform = transform
+        self.labels = np.load(os.path.join(directory, 'labels.npy'))
+        self.indices = np.arange(len(self.labels)) if indices is None else np.asarray(indices)
+        # Opened lazily so each DataLoader worker maps the file itself
+        self._images = None
+
+    @property
+    def images(self):
+        if self._images is None:
+            # Copy-on-write mapping: slices are writable views, the file is never modified
+            self._images = np.load(os.path.join(self.directory, 'images.npy'), mmap_mode='c')
+        return self._images
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_images'] = None
+        return state
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        i = self.indices[idx]
+        img = torch.from_numpy(self.images[i])
+        if self.transform:
+            img = self.transform(img)
+        return img, int(self.labels[i])
+
+
+# Tensor equivalents of the PIL transforms in model.ipynb (resizing already happened when packing)
+train_tensor_transform = transforms.Compose([
+    transforms.RandomHorizontalFlip(),
+    transforms.RandomAffine(degrees=0, translate=(0.1, 0.1)),
+    transforms.ColorJitter(brightness=(0.8, 1.2)),
+    transforms.RandomRotation(10),
+    transforms.ConvertImageDtype(torch.float32),
+    transforms.Normalize(mean=mean, std=std)
+])
+
+test_tensor_transform = transforms.Compose([
+    transforms.ConvertImageDtype(torch.float32),
+    transforms.Normalize(mean=mean, std=std)
+])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    base_directory, output_directory = sys.argv[1], sys.argv[2]
+    for split in ('Training', 'Testing'):
+        count = pack_split(os.path.join(base_directory, split), os.path.join(output_directory, split))
+        print(f"Packed {count} images from {split}")
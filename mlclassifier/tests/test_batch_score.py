@@ -0,0 +1,75 @@
+"""
+Interrupting batch_score and running it again scores every image exactly once
+"""
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+import pyarrow.parquet as pq
+import torch.nn as nn
+from PIL import Image
+from torchvision import models
+
+import batch_score
+
+
+def make_archive(root, count):
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        image = rng.integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        Image.fromarray(image).save(os.path.join(root, f"scan_{i:03d}.png"))
+    return batch_score.list_directory(root)
+
+
+def make_checkpoint(path):
+    model = models.resnet18()
+    model.fc = nn.Sequential(nn.Linear(512, 512), nn.ReLU(), nn.Dropout(0.5), nn.Linear(512, 4))
+    torch.save(model.state_dict(), path)
+
+
+def scored_paths(output):
+    paths = []
+    for part in sorted(glob.glob(os.path.join(output, 'part-*.parquet'))):
+        paths += pq.read_table(part, columns=['path']).column('path').to_pylist()
+    return paths
+
+
+def test_resume_after_crash(tmp_path, monkeypatch):
+    images = tmp_path / 'images'
+    images.mkdir()
+    paths = make_archive(str(images), 12)
+    checkpoint = str(tmp_path / 'model.pth')
+    make_checkpoint(checkpoint)
+    args = argparse.Namespace(
+        checkpoint=checkpoint, output=str(tmp_path / 'scores'), batch_size=4, workers=1, threads=1,
+        rows_per_part=50000, commit_every=0.0, embeddings=False, gradcam=False, cam_dir=None,
+        report_every=1000.0,
+    )
+
+    # The third forward pass dies, as if the process were killed mid-run
+    score = batch_score.Scorer.score
+    calls = []
+
+    def crashing_score(self, batch):
+        calls.append(len(batch))
+        if len(calls) == 3:
+            raise RuntimeError("killed")
+        return score(self, batch)
+
+    monkeypatch.setattr(batch_score.Scorer, 'score', crashing_score)
+    with pytest.raises(RuntimeError):
+        batch_score.score_archive(paths, args, root=str(images))
+    # Far below rows_per_part, but the two finished batches were committed
+    assert sorted(scored_paths(args.output)) == paths[:8]
+
+    monkeypatch.setattr(batch_score.Scorer, 'score', score)
+    batch_score.score_archive(paths, args, root=str(images))
+    assert sorted(scored_paths(args.output)) == paths
+    assert not glob.glob(os.path.join(args.output, '*.tmp'))
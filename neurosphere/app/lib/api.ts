@@ -94,6 +94,78 @@ export async function uploadScan(token: string | null, file: File, metadata?: Re
   }
 }
 
+// Files above this size go through the resumable upload endpoints
+export const RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024;
+
+async function sha256Header(data: ArrayBuffer) {
+  const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', data));
+  let binary = '';
+  digest.forEach((byte) => { binary += String.fromCharCode(byte); });
+  return `sha256 ${btoa(binary)}`;
+}
+
+/**
+ * Upload a large scan in checksummed chunks. After a dropped connection it
+ * asks the server for the last confirmed byte and carries on from there.
+ */
+export async function uploadScanResumable(
+  token: string | null,
+  file: File,
+  metadata?: Record<string, any>,
+  onProgress?: (fraction: number) => void,
+  maxRetries = 5
+) {
+  const authHeaders: Record<string, string> = token ? { 'Authorization': `Bearer ${token}` } : {};
+  const session = await fetchWithAuth('/api/uploads', token, {
+    method: 'POST',
+    body: JSON.stringify({ filename: file.name, size: file.size, metadata: metadata || {} })
+  });
+
+  let offset: number = session.offset;
+  let failures = 0;
+  while (offset < file.size) {
+    const chunk = await file.slice(offset, offset + session.chunkSize).arrayBuffer();
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/uploads/${session.uploadId}`, {
+        method: 'PATCH',
+        headers: {
+          ...authHeaders,
+          'Content-Type': 'application/offset+octet-stream',
+          'Upload-Offset': String(offset),
+          'Upload-Checksum': await sha256Header(chunk)
+        },
+        body: chunk,
+        credentials: 'include'
+      });
+      // Every rejection counts as a failure and backs off, so a permanent
+      // error (413, a checksum that never matches) gives up after maxRetries
+      if (!response.ok) {
+        throw new Error(`Upload Error: ${response.status}`);
+      }
+      offset = Number(response.headers.get('Upload-Offset'));
+      failures = 0;
+    } catch (error) {
+      // Back off, then ask the server where to resume. The network may still be
+      // down, so a failed query is retried from the same budget.
+      let lastError = error;
+      while (true) {
+        if (++failures > maxRetries) throw lastError;
+        await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** failures));
+        try {
+          const status = await fetchWithAuth(`/api/uploads/${session.uploadId}`, token);
+          offset = status.offset;
+          break;
+        } catch (queryError) {
+          lastError = queryError;
+        }
+      }
+    }
+    onProgress?.(offset / file.size);
+  }
+
+  return fetchWithAuth(`/api/uploads/${session.uploadId}/complete`, token, { method: 'POST' });
+}
+
 /**
  * Check processing status of a scan
  */
@@ -108,6 +180,42 @@ export async function getDashboardStats(token: string | null) {
   return fetchWithAuth('/api/users/stats', token);
 }
 
+/**
+ * Scan trends over time, e.g. scans per day or detection rate per week
+ */
+export async function getStatsTimeseries(token: string | null, options: {
+  interval?: 'hour' | 'day' | 'week' | 'month';
+  start?: string;
+  end?: string;
+} = {}) {
+  const params = new URLSearchParams();
+  if (options.interval) params.append('interval', options.interval);
+  if (options.start) params.append('start', options.start);
+  if (options.end) params.append('end', options.end);
+  return fetchWithAuth(`/api/stats/timeseries?${params.toString()}`, token);
+}
+
+/**
+ * Search scans by class, region, doctor, date range and tumor size in mm
+ */
+export async function searchScans(token: string | null, filters: {
+  classLabel?: string;
+  location?: string;
+  doctor?: string;
+  start?: string;
+  end?: string;
+  minSizeMm?: number;
+  maxSizeMm?: number;
+  page?: number;
+  limit?: number;
+} = {}) {
+  const params = new URLSearchParams();
+  Object.entries(filters).forEach(([key, value]) => {
+    if (value !== undefined && value !== '') params.append(key, String(value));
+  });
+  return fetchWithAuth(`/api/scans/search?${params.toString()}`, token);
+}
+
 /**
  * Generate or regenerate 3D visualization
  */
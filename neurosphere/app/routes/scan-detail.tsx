@@ -16,6 +16,8 @@ type ScanDetail = {
   notes?: string
   originalImageUrl?: string
   heatmapUrl?: string
+  classHeatmapUrls?: Record<string, string>
+  classProbabilities?: Record<string, number>
 }
 
 export default function ScanDetail() {
@@ -23,30 +25,40 @@ export default function ScanDetail() {
   const [scan, setScan] = useState<ScanDetail | null>(null)
   const [isLoading, setIsLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
+  const [estimatedTimeRemaining, setEstimatedTimeRemaining] = useState<number | null>(null)
   const iframeRef = useRef<HTMLIFrameElement>(null)
   const scanId = params.id
   
   // Poll for status updates when the scan is processing
   useEffect(() => {
-    let intervalId: number | undefined
+    let timeoutId: number | undefined
+    let cancelled = false
     
-    if (scan?.status === 'processing') {
-      intervalId = window.setInterval(async () => {
-        try {
-          const statusData = await getScanStatus(null, scan.id)
-          if (statusData.status !== 'processing') {
-            // If status changed from processing, fetch full details
-            fetchScanDetails()
-            clearInterval(intervalId)
-          }
-        } catch (err) {
-          console.error('Failed to check scan status:', err)
+    // The server suggests the next poll from its ETA, so far-off scans are polled rarely
+    const poll = async () => {
+      let delay = 3000
+      try {
+        const statusData = await getScanStatus(null, scan!.id)
+        if (statusData.status !== 'processing') {
+          // If status changed from processing, fetch full details
+          fetchScanDetails()
+          return
         }
-      }, 3000) // Poll every 3 seconds
+        setEstimatedTimeRemaining(statusData.estimatedTimeRemaining ?? null)
+        delay = statusData.pollIntervalMs ?? delay
+      } catch (err) {
+        console.error('Failed to check scan status:', err)
+      }
+      if (!cancelled) timeoutId = window.setTimeout(poll, delay)
+    }
+    
+    if (scan?.status === 'processing') {
+      poll()
     }
     
     return () => {
-      if (intervalId) clearInterval(intervalId)
+      cancelled = true
+      if (timeoutId) clearTimeout(timeoutId)
     }
   }, [scan?.status, scan?.id])
   
@@ -69,7 +81,9 @@ export default function ScanDetail() {
         visualizationUrl: data.visualizationUrl,
         notes: data.notes,
         originalImageUrl: data.originalImageUrl,
-        heatmapUrl: data.heatmapUrl
+        heatmapUrl: data.heatmapUrl,
+        classHeatmapUrls: data.classHeatmapUrls,
+        classProbabilities: data.classProbabilities
       })
     } catch (err) {
       console.error('Failed to fetch scan details:', err)
@@ -265,6 +279,32 @@ export default function ScanDetail() {
                   </p>
                 </div>
               </div>
+              
+              {/* Attention map for each tumor class, side by side */}
+              {scan.classHeatmapUrls && Object.keys(scan.classHeatmapUrls).length > 0 && (
+                <div className="mt-6">
+                  <h3 className="text-lg font-medium mb-3">Attention by Tumor Type</h3>
+                  <div className="grid grid-cols-1 sm:grid-cols-3 gap-4">
+                    {Object.entries(scan.classHeatmapUrls).map(([label, url]) => (
+                      <div key={label}>
+                        <p className="font-medium capitalize mb-2">
+                          {label}
+                          {scan.classProbabilities?.[label] !== undefined && (
+                            <span className="text-muted-foreground font-normal">
+                              {' '}({(scan.classProbabilities[label] * 100).toFixed(1)}%)
+                            </span>
+                          )}
+                        </p>
+                        <img
+                          src={url}
+                          alt={`${label} attention map`}
+                          className="w-full h-auto rounded-lg border shadow-sm"
+                        />
+                      </div>
+                    ))}
+                  </div>
+                </div>
+              )}
             </CardContent>
           </Card>
         )}
@@ -328,6 +368,13 @@ export default function ScanDetail() {
                         ? 'Visualization is being generated...' 
                         : '3D visualization not available'}
                     </p>
+                    {scan.status === 'processing' && estimatedTimeRemaining !== null && (
+                      <p className="text-sm text-muted-foreground mt-2">
+                        About {estimatedTimeRemaining < 60
+                          ? `${estimatedTimeRemaining}s`
+                          : `${Math.ceil(estimatedTimeRemaining / 60)} min`} remaining
+                      </p>
+                    )}
                   </div>
                 </div>
               )}
@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router'
 import { DashboardLayout } from '../components/layout/dashboard-layout'
 import { Button } from '../components/ui/button'
 import { Card, CardContent, CardDescription, CardFooter, CardHeader, CardTitle } from '../components/ui/card'
-import { uploadScan } from '../lib/api'
+import { RESUMABLE_UPLOAD_THRESHOLD, uploadScan, uploadScanResumable } from '../lib/api'
 import { useAuth } from '../lib/auth'
 
 export default function Upload() {
@@ -95,8 +95,10 @@ export default function Upload() {
         fileName: selectedFile.name
       }
       
-      // Upload the scan to the backend
-      const response = await uploadScan(token, selectedFile, metadata)
+      // Upload the scan to the backend; large studies go in resumable chunks
+      const response = selectedFile.size > RESUMABLE_UPLOAD_THRESHOLD
+        ? await uploadScanResumable(token, selectedFile, metadata)
+        : await uploadScan(token, selectedFile, metadata)
       clearInterval(progressInterval)
       setUploadProgress(100)
       